@@ -0,0 +1,445 @@
+"""Columnar, array-based representation of annotation documents.
+
+Large annotation documents such as the output of nuclei detection on a
+whole slide consist of millions of small polylines. Holding those as lists
+of python dicts and `[x, y, 0]` lists is very expensive in memory and on
+the wire. A ColumnarAnnotation stores the same elements as a flat float32
+coordinate buffer with an offsets array and a deduplicated style table,
+and can be converted to and from the large_image annotation schema.
+
+"""
+import json
+
+import numpy as np
+
+# element types supported by the columnar representation
+ELEMENT_TYPES = ('polyline', 'rectangle')
+
+# the default style of elements generated by the nuclei CLIs
+DEFAULT_STYLE = ('rgb(0,255,0)', 'rgba(0,0,0,0)', None, '')
+
+STYLE_FIELDS = ('lineColor', 'fillColor', 'lineWidth', 'group')
+
+
+class ColumnarAnnotation(object):
+    """Array-based storage of the elements of an annotation document.
+
+    Polyline elements store their vertices, rectangle elements store their
+    center, in one flat N x 2 coordinate buffer; the vertices of element i
+    are ``coords[offsets[i]:offsets[i + 1]]``.
+
+    Attributes
+    ----------
+    name : str
+        Name of the annotation document.
+    element_type : array_like
+        uint8 array with the index of each element's type in ELEMENT_TYPES.
+    offsets : array_like
+        int64 array of length num_elements + 1 delimiting the coordinates of
+        each element in `coords`.
+    coords : array_like
+        float32 array of shape (num_points, 2) holding x, y coordinates.
+    size : array_like
+        float32 array of shape (num_elements, 2) with the width and height
+        of rectangle elements; zero for polylines.
+    closed : array_like
+        bool array indicating whether each polyline is closed.
+    style_index : array_like
+        uint32 array with the row of each element in the style table.
+    styles : list of tuple
+        Style table; each row holds the lineColor, fillColor, lineWidth and
+        group of an element (see STYLE_FIELDS). A fillColor or lineWidth of
+        None or an empty group means the key is absent from the element.
+
+    Notes
+    -----
+    The z coordinate of polyline points and the rotation of rectangles are
+    assumed to be zero and any other element keys are not preserved.
+    Coordinates are stored as float32, which keeps them to within 0.01
+    pixels for slides up to 262144 pixels across.
+
+    """
+
+    def __init__(self, name='', element_type=None, offsets=None, coords=None,
+                 size=None, closed=None, style_index=None, styles=None):
+
+        self.name = name
+        self.element_type = np.zeros(0, np.uint8) \
+            if element_type is None else np.asarray(element_type, np.uint8)
+        self.offsets = np.zeros(1, np.int64) \
+            if offsets is None else np.asarray(offsets, np.int64)
+        self.coords = np.zeros((0, 2), np.float32) \
+            if coords is None else np.asarray(coords, np.float32)
+        self.size = np.zeros((len(self.element_type), 2), np.float32) \
+            if size is None else np.asarray(size, np.float32)
+        self.closed = np.ones(len(self.element_type), bool) \
+            if closed is None else np.asarray(closed, bool)
+        self.style_index = np.zeros(len(self.element_type), np.uint32) \
+            if style_index is None else np.asarray(style_index, np.uint32)
+        self.styles = [DEFAULT_STYLE] if styles is None else \
+            [tuple(s) for s in styles]
+
+        if len(self.offsets) != len(self.element_type) + 1:
+            raise ValueError('offsets must have one more entry than there '
+                             'are elements')
+
+    def __len__(self):
+
+        return len(self.element_type)
+
+    @classmethod
+    def from_polylines(cls, contours, name='', closed=True,
+                       style=DEFAULT_STYLE):
+        """Create a columnar annotation of polylines sharing one style.
+
+        Parameters
+        ----------
+        contours : list of array_like
+            List of num_points x 2 arrays of x, y vertex coordinates.
+        name : str, optional
+            Name of the annotation document.
+        closed : bool, optional
+            Whether the polylines are closed. Default value = True.
+        style : tuple, optional
+            lineColor, fillColor, lineWidth and group of all elements.
+
+        Returns
+        -------
+        ColumnarAnnotation
+
+        """
+        lengths = [len(c) for c in contours]
+        offsets = np.zeros(len(contours) + 1, np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+
+        coords = np.concatenate(contours, 0) if contours else None
+
+        return cls(name=name,
+                   element_type=np.full(len(contours),
+                                        ELEMENT_TYPES.index('polyline')),
+                   offsets=offsets, coords=coords,
+                   closed=np.full(len(contours), closed),
+                   styles=[style])
+
+    @classmethod
+    def from_rectangles(cls, centers, sizes, name='', style=DEFAULT_STYLE):
+        """Create a columnar annotation of axis-aligned rectangles sharing
+        one style.
+
+        Parameters
+        ----------
+        centers : array_like
+            num_elements x 2 array of x, y rectangle centers.
+        sizes : array_like
+            num_elements x 2 array of rectangle widths and heights.
+        name : str, optional
+            Name of the annotation document.
+        style : tuple, optional
+            lineColor, fillColor, lineWidth and group of all elements.
+
+        Returns
+        -------
+        ColumnarAnnotation
+
+        """
+        num_elements = len(centers)
+
+        return cls(name=name,
+                   element_type=np.full(num_elements,
+                                        ELEMENT_TYPES.index('rectangle')),
+                   offsets=np.arange(num_elements + 1),
+                   coords=np.reshape(centers, (-1, 2)),
+                   size=np.reshape(sizes, (-1, 2)),
+                   styles=[style])
+
+    @classmethod
+    def from_annotation(cls, annotation):
+        """Convert a large_image annotation document to columnar form.
+
+        Parameters
+        ----------
+        annotation : dict
+            Annotation document with a 'name' and a list of 'elements', each
+            of which must be a polyline or a rectangle.
+
+        Returns
+        -------
+        ColumnarAnnotation
+
+        """
+        elements = annotation.get('elements', [])
+        num_elements = len(elements)
+
+        element_type = np.zeros(num_elements, np.uint8)
+        lengths = np.zeros(num_elements, np.int64)
+        size = np.zeros((num_elements, 2), np.float32)
+        closed = np.zeros(num_elements, bool)
+        style_index = np.zeros(num_elements, np.uint32)
+        style_rows = {}
+        coords = []
+
+        for i, element in enumerate(elements):
+
+            if element.get('type') == 'polyline':
+                points = element['points']
+                closed[i] = element.get('closed', False)
+            elif element.get('type') == 'rectangle':
+                element_type[i] = ELEMENT_TYPES.index('rectangle')
+                points = [element['center']]
+                size[i] = element['width'], element['height']
+            else:
+                raise ValueError('Unsupported element type: %r' %
+                                 element.get('type'))
+
+            lengths[i] = len(points)
+            coords.extend(p[:2] for p in points)
+
+            style = (element.get('lineColor', DEFAULT_STYLE[0]),
+                     element.get('fillColor', DEFAULT_STYLE[1]),
+                     element.get('lineWidth'),
+                     element.get('group', ''))
+            style_index[i] = style_rows.setdefault(style, len(style_rows))
+
+        offsets = np.zeros(num_elements + 1, np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+
+        return cls(name=annotation.get('name', ''),
+                   element_type=element_type, offsets=offsets,
+                   coords=np.reshape(np.array(coords, np.float32), (-1, 2)),
+                   size=size, closed=closed, style_index=style_index,
+                   styles=sorted(style_rows, key=style_rows.get) or None)
+
+    def to_annotation(self, decimals=2):
+        """Convert to a large_image annotation document.
+
+        Parameters
+        ----------
+        decimals : int, optional
+            Number of decimals coordinates and sizes are rounded to, which
+            hides float32 representation noise. Default value = 2.
+
+        Returns
+        -------
+        annotation : dict
+            Annotation document with a 'name' and a list of 'elements'.
+
+        """
+        coords = np.round(self.coords.astype(np.float64), decimals).tolist()
+        size = np.round(self.size.astype(np.float64), decimals).tolist()
+        offsets = self.offsets.tolist()
+        closed = self.closed.tolist()
+
+        styles = []
+        for line_color, fill_color, line_width, group in self.styles:
+            style = {'fillColor': fill_color, 'lineColor': line_color}
+            if fill_color is None:
+                del style['fillColor']
+            if line_width is not None:
+                style['lineWidth'] = line_width
+            if group:
+                style['group'] = group
+            styles.append(style)
+
+        elements = []
+
+        for i, (etype, sidx) in enumerate(zip(self.element_type.tolist(),
+                                              self.style_index.tolist())):
+
+            if ELEMENT_TYPES[etype] == 'polyline':
+                element = {
+                    'type': 'polyline',
+                    'points': [[x, y, 0.0]
+                               for x, y in coords[offsets[i]:offsets[i + 1]]],
+                    'closed': closed[i],
+                }
+            else:
+                cx, cy = coords[offsets[i]]
+                element = {
+                    'type': 'rectangle',
+                    'center': [cx, cy, 0],
+                    'width': size[i][0],
+                    'height': size[i][1],
+                    'rotation': 0,
+                }
+
+            element.update(styles[sidx])
+            elements.append(element)
+
+        return {'name': self.name, 'elements': elements}
+
+    def get_points(self, i):
+        """Get the x, y coordinates of element i as a num_points x 2 array."""
+
+        return self.coords[self.offsets[i]:self.offsets[i + 1]]
+
+    def take(self, indices):
+        """Select a subset of the elements.
+
+        Parameters
+        ----------
+        indices : array_like
+            Indices of the elements to keep, in the desired order.
+
+        Returns
+        -------
+        ColumnarAnnotation
+
+        """
+        indices = np.asarray(indices, np.int64)
+
+        starts = self.offsets[indices]
+        lengths = self.offsets[indices + 1] - starts
+
+        offsets = np.zeros(len(indices) + 1, np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+
+        # gather the coordinate runs of all selected elements at once
+        point_ind = np.arange(offsets[-1]) - \
+            np.repeat(offsets[:-1] - starts, lengths)
+
+        return ColumnarAnnotation(
+            name=self.name, element_type=self.element_type[indices],
+            offsets=offsets, coords=self.coords[point_ind],
+            size=self.size[indices], closed=self.closed[indices],
+            style_index=self.style_index[indices], styles=self.styles)
+
+    def set_style(self, **kwargs):
+        """Set style properties of all elements, e.g.
+        ``set_style(lineColor='rgb(255,0,0)')``.
+
+        Parameters
+        ----------
+        **kwargs
+            Values for any of the fields in STYLE_FIELDS.
+
+        """
+        invalid = set(kwargs) - set(STYLE_FIELDS)
+        if invalid:
+            raise ValueError('Invalid style fields: %s' % sorted(invalid))
+
+        self.styles = [
+            tuple(kwargs.get(field, value)
+                  for field, value in zip(STYLE_FIELDS, style))
+            for style in self.styles
+        ]
+
+    @staticmethod
+    def concatenate(annotations, name=None):
+        """Concatenate the elements of several columnar annotations.
+
+        Parameters
+        ----------
+        annotations : list of ColumnarAnnotation
+            Annotations to concatenate. Empty entries, including empty
+            lists, are skipped.
+        name : str, optional
+            Name of the result; defaults to the name of the first annotation.
+
+        Returns
+        -------
+        ColumnarAnnotation
+
+        """
+        annotations = [a for a in annotations if len(a)]
+
+        if not annotations:
+            return ColumnarAnnotation(name=name or '')
+
+        style_rows = {}
+        style_index = []
+        offsets = [np.zeros(1, np.int64)]
+
+        for a in annotations:
+            remap = np.array([style_rows.setdefault(s, len(style_rows))
+                              for s in a.styles], np.uint32)
+            style_index.append(remap[a.style_index])
+            offsets.append(a.offsets[1:] + offsets[-1][-1])
+
+        return ColumnarAnnotation(
+            name=annotations[0].name if name is None else name,
+            element_type=np.concatenate([a.element_type
+                                         for a in annotations]),
+            offsets=np.concatenate(offsets),
+            coords=np.concatenate([a.coords for a in annotations]),
+            size=np.concatenate([a.size for a in annotations]),
+            closed=np.concatenate([a.closed for a in annotations]),
+            style_index=np.concatenate(style_index),
+            styles=sorted(style_rows, key=style_rows.get))
+
+    def save(self, filename, compressed=False):
+        """Save to a .npz file.
+
+        Parameters
+        ----------
+        filename : str
+            Path of the output file.
+        compressed : bool, optional
+            Use np.savez_compressed rather than np.savez.
+
+        """
+        savez = np.savez_compressed if compressed else np.savez
+
+        with open(filename, 'wb') as fptr:
+            savez(fptr,
+                  name=np.array(self.name),
+                  element_type=self.element_type,
+                  offsets=self.offsets,
+                  coords=self.coords,
+                  size=self.size,
+                  closed=self.closed,
+                  style_index=self.style_index,
+                  styles=np.array(json.dumps(self.styles)))
+
+    @classmethod
+    def load(cls, filename):
+        """Load from a .npz file written by `save`.
+
+        Parameters
+        ----------
+        filename : str
+            Path of the input file.
+
+        Returns
+        -------
+        ColumnarAnnotation
+
+        """
+        with np.load(filename, allow_pickle=False) as data:
+
+            return cls(name=str(data['name']),
+                       element_type=data['element_type'],
+                       offsets=data['offsets'],
+                       coords=data['coords'],
+                       size=data['size'],
+                       closed=data['closed'],
+                       style_index=data['style_index'],
+                       styles=json.loads(str(data['styles'])))
+
+
+def is_columnar_annotation_file(filename):
+    """Check whether a file name refers to a columnar (.npz) annotation."""
+
+    return filename.lower().endswith('.npz')
+
+
+def read_annotation_file(filename):
+    """Read an annotation file as a ColumnarAnnotation, whether it was saved
+    in columnar (.npz) form or as large_image annotation JSON.
+
+    Parameters
+    ----------
+    filename : str
+        Path of the annotation file.
+
+    Returns
+    -------
+    ColumnarAnnotation
+
+    """
+    if is_columnar_annotation_file(filename):
+        return ColumnarAnnotation.load(filename)
+
+    with open(filename) as fptr:
+        annotation = json.load(fptr)
+
+    return ColumnarAnnotation.from_annotation(annotation)
@@ -11,6 +11,8 @@ from pandas import DataFrame, concat
 import cv2
 from shapely.geometry.polygon import Polygon
 from histomicstk.utils.general_utils import Print_and_log
+from histomicstk.annotations_and_masks.columnar_annotations import (
+    ColumnarAnnotation, ELEMENT_TYPES)
 
 # %% =====================================================================
 
@@ -623,3 +625,98 @@ def get_annotation_documents_from_contours(
     return annotation_docs
 
 # %% =====================================================================
+
+
+def get_columnar_annotation_from_contours(
+        contours_df, docname='default', F=1.0, X_OFFSET=0, Y_OFFSET=0,
+        opacity=0.3, lineWidth=4.0):
+    """Given dataframe of contours, get a columnar annotation.
+
+    This is an array-based alternative to
+    get_single_annotation_document_from_contours() that parses the
+    coordinates of all contours at once and never builds per-vertex python
+    objects, which makes it suitable for millions of contours. The result
+    can be saved as .npz or converted to a DSA-style annotation document
+    using its to_annotation() method.
+
+    Parameters
+    -----------
+    contours_df : pandas DataFrame
+        The following columns are of relevance and must be contained.
+
+        group : str
+            annotation group (ground truth label).
+        color : str
+            annotation color if it were to be posted to DSA.
+        coords_x : str
+            vertix x coordinates comma-separated values
+        coords_y
+            vertix y coordinated comma-separated values
+    docname : str
+        annotation document name
+    F : float
+        how much smaller is the mask where the contours come from is relative
+        to the slide scan magnification.
+    X_OFFSET : int
+        x offset to add to contours at BASE (SCAN) magnification
+    Y_OFFSET : int
+        y offset to add to contours at BASE (SCAN) magnification
+    opacity : float
+        opacity of annotation elements (in the range [0, 1])
+    lineWidth : float
+        width of boarders of annotation elements
+
+    Returns
+    --------
+    ColumnarAnnotation
+        Closed polylines, one per contour, styled by group and color.
+        Unlike get_single_annotation_document_from_contours(), elements do
+        not carry a 'label'.
+
+    """
+    num_contours = contours_df.shape[0]
+    if num_contours == 0:
+        return ColumnarAnnotation(name=docname)
+
+    coords_x = contours_df.loc[:, 'coords_x'].astype(str)
+    coords_y = contours_df.loc[:, 'coords_y'].astype(str)
+
+    # parse all vertices in one go
+    x_coords = F * np.array(','.join(coords_x).split(','), float) + X_OFFSET
+    y_coords = F * np.array(','.join(coords_y).split(','), float) + Y_OFFSET
+
+    lengths = coords_x.str.count(',').values + 1
+    starts = np.r_[0, np.cumsum(lengths)[:-1]]
+
+    # close each polygon by repeating its first vertex
+    offsets = np.zeros(num_contours + 1, np.int64)
+    np.cumsum(lengths + 1, out=offsets[1:])
+    point_ind = np.arange(offsets[-1]) - np.repeat(offsets[:-1] - starts,
+                                                   lengths + 1)
+    point_ind[offsets[1:] - 1] = starts
+
+    coords = np.stack([x_coords, y_coords], 1)[point_ind]
+
+    # build the style table
+    def _get_fillColor(lineColor):
+        if opacity <= 0:
+            return None
+        fillColor = lineColor.replace("rgb", "rgba")
+        return fillColor[:fillColor.rfind(")")] + ",%.1f)" % opacity
+
+    style_keys = list(zip(contours_df.loc[:, 'color'],
+                          contours_df.loc[:, 'group']))
+    style_rows = {}
+    style_index = np.array([style_rows.setdefault(k, len(style_rows))
+                            for k in style_keys], np.uint32)
+    styles = [(color, _get_fillColor(color), lineWidth, group)
+              for color, group in sorted(style_rows, key=style_rows.get)]
+
+    return ColumnarAnnotation(
+        name=docname,
+        element_type=np.full(num_contours, ELEMENT_TYPES.index('polyline')),
+        offsets=offsets, coords=coords,
+        closed=np.ones(num_contours, bool),
+        style_index=style_index, styles=styles)
+
+# %% =====================================================================
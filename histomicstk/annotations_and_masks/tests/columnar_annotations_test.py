@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""Tests for the columnar annotation format."""
+
+import unittest
+
+import os
+import tempfile
+import numpy as np
+from pandas import read_csv
+
+from histomicstk.annotations_and_masks.columnar_annotations import (
+    ColumnarAnnotation, read_annotation_file)
+from histomicstk.annotations_and_masks.masks_to_annotations_handler import (
+    get_columnar_annotation_from_contours,
+    get_single_annotation_document_from_contours)
+
+# %%===========================================================================
+# Constants & prep work
+# =============================================================================
+
+CONTOURS_DF_PATH = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)),
+    'test_files', 'sample_contours_df.tsv')
+CONTOURS_DF = read_csv(CONTOURS_DF_PATH, sep='\t', index_col=0)
+
+ANNOTATION = {
+    'name': 'test-nuclei',
+    'elements': [
+        {
+            'type': 'polyline',
+            'points': [[10.5, 20.25, 0.0], [12.0, 20.0, 0.0],
+                       [11.0, 23.75, 0.0]],
+            'closed': True,
+            'fillColor': 'rgba(0,0,0,0)',
+            'lineColor': 'rgb(0,255,0)',
+        },
+        {
+            'type': 'rectangle',
+            'center': [100.5, 200.25, 0],
+            'width': 8.0,
+            'height': 6.5,
+            'rotation': 0,
+            'fillColor': 'rgba(0,0,0,0)',
+            'lineColor': 'rgb(255,0,0)',
+        },
+        {
+            'type': 'polyline',
+            'points': [[1.0, 2.0, 0.0], [3.0, 4.0, 0.0], [5.0, 0.0, 0.0],
+                       [0.0, 0.0, 0.0]],
+            'closed': True,
+            'fillColor': 'rgba(0,0,0,0)',
+            'lineColor': 'rgb(0,255,0)',
+        },
+    ]
+}
+
+# %%===========================================================================
+
+
+class ColumnarAnnotationTest(unittest.TestCase):
+    """Test conversion to and from the columnar annotation format."""
+
+    def test_round_trip(self):
+        """Test conversion to and from large_image annotations."""
+        ca = ColumnarAnnotation.from_annotation(ANNOTATION)
+
+        self.assertEqual(len(ca), 3)
+        self.assertEqual(len(ca.styles), 2)
+        self.assertEqual(ca.coords.dtype, np.float32)
+        np.testing.assert_array_equal(ca.offsets, [0, 3, 4, 8])
+        self.assertEqual(ca.to_annotation(), ANNOTATION)
+
+        with tempfile.NamedTemporaryFile(suffix='.npz') as fptr:
+            ca.save(fptr.name)
+            self.assertEqual(
+                read_annotation_file(fptr.name).to_annotation(), ANNOTATION)
+
+    # %% ----------------------------------------------------------------------
+
+    def test_take_and_concatenate(self):
+        """Test selecting and concatenating elements."""
+        ca = ColumnarAnnotation.from_annotation(ANNOTATION)
+
+        sub = ca.take([2, 0])
+        np.testing.assert_array_equal(sub.get_points(0), ca.get_points(2))
+        np.testing.assert_array_equal(sub.get_points(1), ca.get_points(0))
+
+        sub.set_style(lineColor='rgb(1,2,3)')
+        cat = ColumnarAnnotation.concatenate([sub, [], ca])
+
+        elements = cat.to_annotation()['elements']
+        self.assertEqual(len(elements), 5)
+        self.assertEqual(elements[0]['lineColor'], 'rgb(1,2,3)')
+        self.assertEqual(elements[2:], ANNOTATION['elements'])
+
+    # %% ----------------------------------------------------------------------
+
+    def test_get_columnar_annotation_from_contours(self):
+        """Test get_columnar_annotation_from_contours()."""
+        annprops = {
+            'X_OFFSET': 59206,
+            'Y_OFFSET': 33505,
+            'opacity': 0.2,
+            'lineWidth': 4.0,
+        }
+        doc = get_single_annotation_document_from_contours(
+            CONTOURS_DF, verbose=False, **annprops)
+        ca = get_columnar_annotation_from_contours(CONTOURS_DF, **annprops)
+
+        elements = ca.to_annotation()['elements']
+        self.assertEqual(len(elements), len(doc['elements']))
+
+        for element, expected in zip(elements, doc['elements']):
+            np.testing.assert_allclose(element['points'], expected['points'])
+            for key in ('group', 'lineColor', 'fillColor', 'lineWidth'):
+                self.assertEqual(element[key], expected[key])
+
+# %%===========================================================================
+
+
+if __name__ == '__main__':
+    unittest.main()
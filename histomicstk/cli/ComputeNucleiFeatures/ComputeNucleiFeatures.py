@@ -11,10 +11,11 @@ import histomicstk.preprocessing.color_deconvolution as htk_cdeconv
 import histomicstk.features as htk_features
 import histomicstk.utils as htk_utils
 import histomicstk.segmentation.nuclear as htk_nuclear
-import histomicstk.segmentation.label as htk_seg_label
 
 import large_image
 
+from histomicstk.annotations_and_masks.columnar_annotations import (
+    ColumnarAnnotation, is_columnar_annotation_file)
 from histomicstk.cli.utils import CLIArgumentParser
 
 from histomicstk.cli import utils as cli_utils
@@ -26,8 +27,8 @@ logging.basicConfig(level=logging.CRITICAL)
 def compute_tile_nuclei_features(slide_path, tile_position, args, it_kwargs,
                                  src_mu_lab=None, src_sigma_lab=None):
 
-    # get slide tile source
-    ts = large_image.getTileSource(slide_path)
+    # get slide tile source from the worker-local pool
+    ts = htk_utils.get_tile_source(slide_path)
 
     # get requested tile
     tile_info = ts.getSingleTile(
@@ -38,19 +39,15 @@ def compute_tile_nuclei_features(slide_path, tile_position, args, it_kwargs,
     # get tile image
     im_tile = tile_info['tile'][:, :, :3]
 
-    # perform color normalization
-    im_nmzd = htk_cnorm.reinhard(im_tile,
-                                 args.reference_mu_lab,
-                                 args.reference_std_lab,
-                                 src_mu=src_mu_lab,
-                                 src_sigma=src_sigma_lab)
-
-    # perform color decovolution
+    # perform color normalization and deconvolution in a single pass
     w = cli_utils.get_stain_matrix(args)
 
-    im_stains = htk_cdeconv.color_deconvolution(im_nmzd, w).Stains
+    im_stains = htk_cdeconv.reinhard_color_deconvolution(
+        im_tile, w, args.reference_mu_lab, args.reference_std_lab,
+        src_mu=src_mu_lab, src_sigma=src_sigma_lab,
+        stains=(0, 1) if _need_cytoplasm(args) else (0,))
 
-    im_nuclei_stain = im_stains[:, :, 0].astype(np.float)
+    im_nuclei_stain = im_stains[:, :, 0]
 
     # segment nuclear foreground
     im_nuclei_fgnd_mask = im_nuclei_stain < args.foreground_threshold
@@ -62,14 +59,10 @@ def compute_tile_nuclei_features(slide_path, tile_position, args, it_kwargs,
         args.min_radius,
         args.max_radius,
         args.min_nucleus_area,
-        args.local_max_search_radius
+        args.local_max_search_radius,
+        ignore_border_nuclei=args.ignore_border_nuclei is True
     )
 
-    # Delete border nuclei
-    if args.ignore_border_nuclei is True:
-
-        im_nuclei_seg_mask = htk_seg_label.delete_border(im_nuclei_seg_mask)
-
     # generate nuclei annotations
     nuclei_annot_list = []
 
@@ -78,15 +71,18 @@ def compute_tile_nuclei_features(slide_path, tile_position, args, it_kwargs,
     if flag_nuclei_found:
 
         nuclei_annot_list = cli_utils.create_tile_nuclei_annotations(
-            im_nuclei_seg_mask, tile_info, args.nuclei_annotation_format)
+            im_nuclei_seg_mask, tile_info, args.nuclei_annotation_format,
+            columnar=is_columnar_annotation_file(
+                args.outputNucleiAnnotationFile))
 
     # compute nuclei features
     fdata = None
+    geometry = None
 
     if flag_nuclei_found:
 
-        if args.cytoplasm_features:
-            im_cytoplasm_stain = im_stains[:, :, 1].astype(np.float)
+        if _need_cytoplasm(args):
+            im_cytoplasm_stain = im_stains[:, :, 1]
         else:
             im_cytoplasm_stain = None
 
@@ -100,11 +96,44 @@ def compute_tile_nuclei_features(slide_path, tile_position, args, it_kwargs,
             fsd_features_flag=args.fsd_features,
             intensity_features_flag=args.intensity_features,
             gradient_features_flag=args.gradient_features,
+            haralick_features_flag=args.haralick_features,
+            use_contours=args.use_contours,
+            feature_list=args.feature_list or None,
+            num_threads=args.num_feature_threads,
         )
 
         fdata.columns = ['Feature.' + col for col in fdata.columns]
 
-    return nuclei_annot_list, fdata
+        # store the nuclei boundaries alongside their features
+        if _get_feature_file_format(args) == '.parquet':
+            geometry = cli_utils.get_tile_nuclei_contours(
+                im_nuclei_seg_mask, tile_info)
+
+    return nuclei_annot_list, fdata, geometry
+
+
+def _need_cytoplasm(args):
+
+    # the cytoplasm stain is only needed for requested cytoplasm features
+    return args.cytoplasm_features and (not args.feature_list or any(
+        name == 'Cytoplasm' or name.startswith('Cytoplasm.')
+        for name in args.feature_list))
+
+
+def _get_feature_file_format(args):
+
+    return os.path.splitext(args.outputNucleiFeatureFile)[1]
+
+
+def compute_tile_nuclei_features_group(slide_path, tile_positions, args,
+                                       it_kwargs, src_mu_lab=None,
+                                       src_sigma_lab=None):
+
+    return [
+        compute_tile_nuclei_features(slide_path, tile_position, args,
+                                     it_kwargs, src_mu_lab, src_sigma_lab)
+        for tile_position in tile_positions
+    ]
 
 
 def check_args(args):
@@ -121,8 +150,12 @@ def check_args(args):
     if len(args.analysis_roi) != 4:
         raise ValueError('Analysis ROI must be a vector of 4 elements.')
 
-    if os.path.splitext(args.outputNucleiFeatureFile)[1] not in ['.csv', '.h5']:
-        raise ValueError('Extension of output feature file must be .csv or .h5')
+    if _get_feature_file_format(args) not in ['.csv', '.h5', '.parquet']:
+        raise ValueError('Extension of output feature file must be .csv, .h5 '
+                         'or .parquet')
+
+    if args.num_feature_threads < 1:
+        raise ValueError('Number of feature threads must be >= 1.')
 
 
 def main(args):
@@ -135,7 +168,7 @@ def main(args):
 
     check_args(args)
 
-    feature_file_format = os.path.splitext(args.outputNucleiFeatureFile)[1]
+    feature_file_format = _get_feature_file_format(args)
 
     if np.all(np.array(args.analysis_roi) == -1):
         process_whole_image = True
@@ -169,6 +202,8 @@ def main(args):
 
     is_wsi = ts_metadata['magnification'] is not None
 
+    cache = cli_utils.get_artifact_cache(args)
+
     #
     # Compute tissue/foreground mask at low-res for whole slide images
     #
@@ -178,8 +213,9 @@ def main(args):
 
         start_time = time.time()
 
-        im_fgnd_mask_lres, fgnd_seg_scale = \
-            cli_utils.segment_wsi_foreground_at_low_res(ts)
+        im_fgnd_mask_lres, fgnd_seg_scale = cli_utils.get_slide_artifact(
+            cache, args.inputImageFile, 'fgnd_mask_lres', {'lres_size': 2048},
+            cli_utils.segment_wsi_foreground_at_low_res, ts)
 
         fgnd_time = time.time() - start_time
 
@@ -218,9 +254,12 @@ def main(args):
 
         if process_whole_image:
 
-            tile_fgnd_frac_list = htk_utils.compute_tile_foreground_fraction(
-                args.inputImageFile, im_fgnd_mask_lres, fgnd_seg_scale,
-                it_kwargs
+            tile_fgnd_frac_list = cli_utils.get_slide_artifact(
+                cache, args.inputImageFile, 'tile_fgnd_frac',
+                {'im_fgnd_mask_lres': im_fgnd_mask_lres,
+                 'fgnd_seg_scale': fgnd_seg_scale, 'it_kwargs': it_kwargs},
+                htk_utils.compute_tile_foreground_fraction,
+                args.inputImageFile
             )
 
         else:
@@ -252,8 +291,11 @@ def main(args):
 
         start_time = time.time()
 
-        src_mu_lab, src_sigma_lab = htk_cnorm.reinhard_stats(
-            args.inputImageFile, 0.01, magnification=args.analysis_mag)
+        src_mu_lab, src_sigma_lab = cli_utils.get_slide_artifact(
+            cache, args.inputImageFile, 'reinhard_stats',
+            {'sample_fraction': 0.01, 'magnification': args.analysis_mag,
+             'tissue_seg_mag': 1.25, 'seed': None},
+            htk_cnorm.reinhard_stats, args.inputImageFile)
 
         rstats_time = time.time() - start_time
 
@@ -267,7 +309,7 @@ def main(args):
 
     start_time = time.time()
 
-    tile_result_list = []
+    tile_positions = []
 
     for tile in ts.tileIterator(**it_kwargs):
 
@@ -276,10 +318,17 @@ def main(args):
         if is_wsi and tile_fgnd_frac_list[tile_position] <= args.min_fgnd_frac:
             continue
 
+        tile_positions.append(tile_position)
+
+    tile_result_list = []
+
+    for tile_position_group in cli_utils.group_tile_positions(
+            tile_positions, args.tile_grouping):
+
         # detect nuclei
-        cur_result = dask.delayed(compute_tile_nuclei_features)(
+        cur_result = dask.delayed(compute_tile_nuclei_features_group)(
             args.inputImageFile,
-            tile_position,
+            tile_position_group,
             args, it_kwargs,
             src_mu_lab, src_sigma_lab
         )
@@ -287,21 +336,54 @@ def main(args):
         # append result to list
         tile_result_list.append(cur_result)
 
-    tile_result_list = dask.delayed(tile_result_list).compute()
+    # parquet feature files are written one tile at a time as tiles complete
+    feature_writer = None
+
+    if feature_file_format == '.parquet':
+
+        feature_writer = cli_utils.ParquetFeatureWriter(
+            args.outputNucleiFeatureFile)
+
+    annot_lists = []
+    fdata_list = []
+
+    try:
 
-    nuclei_annot_list = [annot
-                         for annot_list, fdata in tile_result_list
-                         for annot in annot_list]
+        for group_result_list in cli_utils.iter_dask_results(
+                tile_result_list, c):
+
+            for annot_list, fdata, geometry in group_result_list:
+
+                annot_lists.append(annot_list)
+
+                if fdata is None:
+                    continue
+
+                if feature_writer is not None:
+                    feature_writer.write(fdata, geometry)
+                else:
+                    fdata_list.append(fdata)
+
+    finally:
+
+        if feature_writer is not None:
+            feature_writer.close()
+
+    if is_columnar_annotation_file(args.outputNucleiAnnotationFile):
+
+        nuclei_annot_list = ColumnarAnnotation.concatenate(annot_lists)
+
+    else:
+
+        nuclei_annot_list = [annot
+                             for annot_list in annot_lists
+                             for annot in annot_list]
 
     nuclei_fdata = pd.DataFrame()
 
-    if len(nuclei_annot_list) > 0:
+    if len(fdata_list) > 0:
 
-        nuclei_fdata = pd.concat([
-            fdata
-            for annot_list, fdata in tile_result_list if fdata is not None],
-            ignore_index=True
-        )
+        nuclei_fdata = pd.concat(fdata_list, ignore_index=True)
 
     nuclei_detection_time = time.time() - start_time
 
@@ -309,6 +391,11 @@ def main(args):
     print('Nuclei detection time = {}'.format(
         cli_utils.disp_time_hms(nuclei_detection_time)))
 
+    pool_info = cli_utils.get_tile_source_pool_info(c)
+
+    if pool_info:
+        print('Tile source pool = {}'.format(pool_info))
+
     #
     # Write annotation file
     #
@@ -317,20 +404,34 @@ def main(args):
     annot_fname = os.path.splitext(
         os.path.basename(args.outputNucleiAnnotationFile))[0]
 
-    annotation = {
-        "name": annot_fname + '-nuclei-' + args.nuclei_annotation_format,
-        "elements": nuclei_annot_list
-    }
+    annot_name = annot_fname + '-nuclei-' + args.nuclei_annotation_format
 
-    with open(args.outputNucleiAnnotationFile, 'w') as annotation_file:
-        json.dump(annotation, annotation_file, indent=2, sort_keys=False)
+    if is_columnar_annotation_file(args.outputNucleiAnnotationFile):
+
+        nuclei_annot_list.name = annot_name
+        nuclei_annot_list.save(args.outputNucleiAnnotationFile)
+
+    else:
+
+        annotation = {
+            "name": annot_name,
+            "elements": nuclei_annot_list
+        }
+
+        with open(args.outputNucleiAnnotationFile, 'w') as annotation_file:
+            json.dump(annotation, annotation_file, indent=2, sort_keys=False)
 
     #
-    # Create CSV Feature file
+    # Create Feature file
     #
-    print('>> Writing CSV feature file')
+    print('>> Writing feature file')
+
+    if feature_file_format == '.parquet':
+
+        print('Number of feature row groups = {}'.format(
+            feature_writer.num_row_groups))
 
-    if feature_file_format == '.csv':
+    elif feature_file_format == '.csv':
 
         nuclei_fdata.to_csv(args.outputNucleiFeatureFile, index=False)
 
@@ -341,7 +442,8 @@ def main(args):
 
     else:
 
-        raise ValueError('Extension of output feature file must be .csv or .h5')
+        raise ValueError('Extension of output feature file must be .csv, .h5 '
+                         'or .parquet')
 
     total_time_taken = time.time() - total_start_time
 
@@ -52,20 +52,52 @@ def gen_distinct_rgb_colors(n, seed=None):
     return color_list
 
 
-def read_feature_file(args):
+def read_feature_file(args, columns=None):
+    """Lazily read a nuclei feature file into a dask dataframe.
 
+    Parameters
+    ----------
+    args : argparse.Namespace
+        Arguments whose inputNucleiFeatureFile attribute is the path of a
+        .csv, .h5 or .parquet feature file.
+    columns : list of str, optional
+        Columns to read. All feature columns are read if None, which for
+        parquet files excludes the nuclei geometry column.
+
+    Returns
+    -------
+    ddf : dask.dataframe.DataFrame
+        The nuclei features. Parquet files are read with one partition per
+        row group and only the requested columns are loaded.
+
+    """
     fname, feature_file_format = os.path.splitext(args.inputNucleiFeatureFile)
 
     if feature_file_format == '.csv':
 
-        ddf = dd.read_csv(args.inputNucleiFeatureFile)
+        ddf = dd.read_csv(args.inputNucleiFeatureFile, usecols=columns)
 
     elif feature_file_format == '.h5':
 
-        ddf = dd.read_hdf(args.inputNucleiFeatureFile, 'Features')
+        ddf = dd.read_hdf(args.inputNucleiFeatureFile, 'Features',
+                          columns=columns)
+
+    elif feature_file_format == '.parquet':
+
+        import pyarrow.parquet as pq
+
+        if columns is None:
+            columns = [
+                name
+                for name in pq.read_schema(args.inputNucleiFeatureFile).names
+                if name != cli_utils.ParquetFeatureWriter.geometry_column]
+
+        ddf = dd.read_parquet(args.inputNucleiFeatureFile, columns=columns,
+                              split_row_groups=True, engine='pyarrow')
 
     else:
-        raise ValueError('Extension of output feature file must be .csv or .h5')
+        raise ValueError('Extension of input feature file must be .csv, .h5 '
+                         'or .parquet')
 
     return ddf
 
@@ -118,11 +150,10 @@ def main(args):
     #
     print('\n>> Loading nuclei annotation file ...\n')
 
-    with open(args.inputNucleiAnnotationFile) as f:
+    nuclei_annot = cli_utils.read_annotation_elements(
+        args.inputNucleiAnnotationFile)
 
-        nuclei_annot_list = json.load(f)['elements']
-
-    if len(nuclei_annot_list) != len(ddf.index):
+    if len(nuclei_annot) != len(ddf.index):
 
         raise ValueError('The number of nuclei in the feature file and the '
                          'annotation file do not match')
@@ -151,19 +182,16 @@ def main(args):
 
     num_classes = len(clf_model.classes_)
 
-    nuclei_annot_by_class = {c: [] for c in clf_model.classes_}
-
     class_color_map = dict(zip(clf_model.classes_,
                                gen_distinct_rgb_colors(num_classes, seed=1)))
 
-    for i in range(len(nuclei_annot_list)):
-
-        cur_class = pred_class.iloc[i]
+    class_styles = {
+        cur_class: {'lineColor': 'rgb(%s)' % ','.join(
+            [str(int(round(col*255))) for col in class_color_map[cur_class]])}
+        for cur_class in clf_model.classes_}
 
-        cur_anot = nuclei_annot_list[i]
-        cur_anot['lineColor'] = 'rgb(%s)' % ','.join(
-            [str(int(round(col*255))) for col in class_color_map[cur_class]])
-        nuclei_annot_by_class[cur_class].append(cur_anot)
+    nuclei_annot_by_class = cli_utils.group_annotation_elements(
+        nuclei_annot, pred_class.values, class_styles)
 
     #
     # Write annotation file
@@ -8,11 +8,12 @@ import dask
 import histomicstk.preprocessing.color_normalization as htk_cnorm
 import histomicstk.preprocessing.color_deconvolution as htk_cdeconv
 import histomicstk.segmentation.nuclear as htk_nuclear
-import histomicstk.segmentation.label as htk_seg_label
 import histomicstk.utils as htk_utils
 
 import large_image
 
+from histomicstk.annotations_and_masks.columnar_annotations import (
+    ColumnarAnnotation, is_columnar_annotation_file)
 from histomicstk.cli.utils import CLIArgumentParser
 
 from histomicstk.cli import utils as cli_utils
@@ -24,8 +25,8 @@ logging.basicConfig(level=logging.CRITICAL)
 def detect_tile_nuclei(slide_path, tile_position, args, it_kwargs,
                        src_mu_lab=None, src_sigma_lab=None):
 
-    # get slide tile source
-    ts = large_image.getTileSource(slide_path)
+    # get slide tile source from the worker-local pool
+    ts = htk_utils.get_tile_source(slide_path)
 
     # get requested tile
     tile_info = ts.getSingleTile(
@@ -36,19 +37,15 @@ def detect_tile_nuclei(slide_path, tile_position, args, it_kwargs,
     # get tile image
     im_tile = tile_info['tile'][:, :, :3]
 
-    # perform color normalization
-    im_nmzd = htk_cnorm.reinhard(im_tile,
-                                 args.reference_mu_lab,
-                                 args.reference_std_lab,
-                                 src_mu=src_mu_lab,
-                                 src_sigma=src_sigma_lab)
-
-    # perform color decovolution
+    # perform color normalization and deconvolution in a single pass
     w = cli_utils.get_stain_matrix(args)
 
-    im_stains = htk_cdeconv.color_deconvolution(im_nmzd, w).Stains
+    im_stains = htk_cdeconv.reinhard_color_deconvolution(
+        im_tile, w, args.reference_mu_lab, args.reference_std_lab,
+        src_mu=src_mu_lab, src_sigma=src_sigma_lab,
+        stains=(0,))
 
-    im_nuclei_stain = im_stains[:, :, 0].astype(np.float)
+    im_nuclei_stain = im_stains[:, :, 0]
 
     # segment nuclear foreground
     im_nuclei_fgnd_mask = im_nuclei_stain < args.foreground_threshold
@@ -60,14 +57,10 @@ def detect_tile_nuclei(slide_path, tile_position, args, it_kwargs,
         args.min_radius,
         args.max_radius,
         args.min_nucleus_area,
-        args.local_max_search_radius
+        args.local_max_search_radius,
+        ignore_border_nuclei=args.ignore_border_nuclei is True
     )
 
-    # Delete border nuclei
-    if args.ignore_border_nuclei is True:
-
-        im_nuclei_seg_mask = htk_seg_label.delete_border(im_nuclei_seg_mask)
-
     # generate nuclei annotations
     nuclei_annot_list = []
 
@@ -75,11 +68,28 @@ def detect_tile_nuclei(slide_path, tile_position, args, it_kwargs,
 
     if flag_nuclei_found:
         nuclei_annot_list = cli_utils.create_tile_nuclei_annotations(
-            im_nuclei_seg_mask, tile_info, args.nuclei_annotation_format)
+            im_nuclei_seg_mask, tile_info, args.nuclei_annotation_format,
+            columnar=is_columnar_annotation_file(
+                args.outputNucleiAnnotationFile))
 
     return nuclei_annot_list
 
 
+def detect_tile_nuclei_group(slide_path, tile_positions, args, it_kwargs,
+                             src_mu_lab=None, src_sigma_lab=None):
+
+    tile_nuclei_list = [
+        detect_tile_nuclei(slide_path, tile_position, args, it_kwargs,
+                           src_mu_lab, src_sigma_lab)
+        for tile_position in tile_positions
+    ]
+
+    if is_columnar_annotation_file(args.outputNucleiAnnotationFile):
+        return ColumnarAnnotation.concatenate(tile_nuclei_list)
+
+    return [annot for annot_list in tile_nuclei_list for annot in annot_list]
+
+
 def main(args):
 
     total_start_time = time.time()
@@ -133,6 +143,8 @@ def main(args):
 
     is_wsi = ts_metadata['magnification'] is not None
 
+    cache = cli_utils.get_artifact_cache(args)
+
     #
     # Compute tissue/foreground mask at low-res for whole slide images
     #
@@ -142,8 +154,9 @@ def main(args):
 
         start_time = time.time()
 
-        im_fgnd_mask_lres, fgnd_seg_scale = \
-            cli_utils.segment_wsi_foreground_at_low_res(ts)
+        im_fgnd_mask_lres, fgnd_seg_scale = cli_utils.get_slide_artifact(
+            cache, args.inputImageFile, 'fgnd_mask_lres', {'lres_size': 2048},
+            cli_utils.segment_wsi_foreground_at_low_res, ts)
 
         fgnd_time = time.time() - start_time
 
@@ -182,9 +195,12 @@ def main(args):
 
         if process_whole_image:
 
-            tile_fgnd_frac_list = htk_utils.compute_tile_foreground_fraction(
-                args.inputImageFile, im_fgnd_mask_lres, fgnd_seg_scale,
-                it_kwargs
+            tile_fgnd_frac_list = cli_utils.get_slide_artifact(
+                cache, args.inputImageFile, 'tile_fgnd_frac',
+                {'im_fgnd_mask_lres': im_fgnd_mask_lres,
+                 'fgnd_seg_scale': fgnd_seg_scale, 'it_kwargs': it_kwargs},
+                htk_utils.compute_tile_foreground_fraction,
+                args.inputImageFile
             )
 
         else:
@@ -216,8 +232,11 @@ def main(args):
 
         start_time = time.time()
 
-        src_mu_lab, src_sigma_lab = htk_cnorm.reinhard_stats(
-            args.inputImageFile, 0.01, magnification=args.analysis_mag)
+        src_mu_lab, src_sigma_lab = cli_utils.get_slide_artifact(
+            cache, args.inputImageFile, 'reinhard_stats',
+            {'sample_fraction': 0.01, 'magnification': args.analysis_mag,
+             'tissue_seg_mag': 1.25, 'seed': None},
+            htk_cnorm.reinhard_stats, args.inputImageFile)
 
         rstats_time = time.time() - start_time
 
@@ -225,13 +244,14 @@ def main(args):
             cli_utils.disp_time_hms(rstats_time)))
 
     #
-    # Detect nuclei in parallel using Dask
+    # Detect nuclei in parallel using Dask and stream them to the
+    # annotation file as tiles complete
     #
-    print('\n>> Detecting nuclei ...\n')
+    print('\n>> Detecting nuclei and writing annotation file ...\n')
 
     start_time = time.time()
 
-    tile_nuclei_list = []
+    tile_positions = []
 
     for tile in ts.tileIterator(**it_kwargs):
 
@@ -240,10 +260,17 @@ def main(args):
         if is_wsi and tile_fgnd_frac_list[tile_position] <= args.min_fgnd_frac:
             continue
 
+        tile_positions.append(tile_position)
+
+    tile_nuclei_list = []
+
+    for tile_position_group in cli_utils.group_tile_positions(
+            tile_positions, args.tile_grouping):
+
         # detect nuclei
-        cur_nuclei_list = dask.delayed(detect_tile_nuclei)(
+        cur_nuclei_list = dask.delayed(detect_tile_nuclei_group)(
             args.inputImageFile,
-            tile_position,
+            tile_position_group,
             args, it_kwargs,
             src_mu_lab, src_sigma_lab
         )
@@ -251,33 +278,39 @@ def main(args):
         # append result to list
         tile_nuclei_list.append(cur_nuclei_list)
 
-    tile_nuclei_list = dask.delayed(tile_nuclei_list).compute()
+    annot_fname = os.path.splitext(
+        os.path.basename(args.outputNucleiAnnotationFile))[0]
+
+    annot_name = annot_fname + '-nuclei-' + args.nuclei_annotation_format
+
+    if is_columnar_annotation_file(args.outputNucleiAnnotationFile):
+
+        annotation = ColumnarAnnotation.concatenate(
+            cli_utils.iter_dask_results(tile_nuclei_list, c),
+            name=annot_name)
+
+        annotation.save(args.outputNucleiAnnotationFile)
+
+        num_nuclei = len(annotation)
+
+    else:
 
-    nuclei_list = [anot
-                   for anot_list in tile_nuclei_list for anot in anot_list]
+        num_nuclei = cli_utils.write_annotation_stream(
+            args.outputNucleiAnnotationFile, annot_name,
+            cli_utils.iter_dask_results(tile_nuclei_list, c),
+            compact=args.compact_json)
 
     nuclei_detection_time = time.time() - start_time
 
-    print('Number of nuclei = {}'.format(len(nuclei_list)))
+    print('Number of nuclei = {}'.format(num_nuclei))
 
     print('Nuclei detection time = {}'.format(
         cli_utils.disp_time_hms(nuclei_detection_time)))
 
-    #
-    # Write annotation file
-    #
-    print('\n>> Writing annotation file ...\n')
-
-    annot_fname = os.path.splitext(
-        os.path.basename(args.outputNucleiAnnotationFile))[0]
-
-    annotation = {
-        "name":     annot_fname + '-nuclei-' + args.nuclei_annotation_format,
-        "elements": nuclei_list
-    }
+    pool_info = cli_utils.get_tile_source_pool_info(c)
 
-    with open(args.outputNucleiAnnotationFile, 'w') as annotation_file:
-        json.dump(annotation, annotation_file, indent=2, sort_keys=False)
+    if pool_info:
+        print('Tile source pool = {}'.format(pool_info))
 
     total_time_taken = time.time() - total_start_time
 
@@ -1,14 +1,16 @@
 from argparse import Namespace
 from datetime import timedelta
+import json
 from ctk_cli import CLIArgumentParser
 import psutil
 import numpy as np
-import skimage.measure
-import skimage.morphology
 
+import histomicstk.features as htk_features
 import histomicstk.preprocessing.color_deconvolution as htk_cdeconv
 import histomicstk.segmentation as htk_seg
 import histomicstk.utils as htk_utils
+from histomicstk.annotations_and_masks.columnar_annotations import \
+    ColumnarAnnotation, is_columnar_annotation_file
 from histomicstk.cli import ctk_cli_adjustment  # noqa - imported for side effects
 
 import large_image
@@ -79,31 +81,74 @@ def segment_wsi_foreground_at_low_res(ts, lres_size=2048):
     return im_fgnd_mask_lres, fgnd_seg_scale
 
 
-def create_tile_nuclei_bbox_annotations(im_nuclei_seg_mask, tile_info):
+def get_tile_nuclei_bboxes(im_nuclei_seg_mask, tile_info):
+    """Compute the centers and sizes of the bounding boxes of all nuclei in
+    a tile in base pixel coordinates, using array operations over all
+    labels at once.
 
-    nuclei_annot_list = []
+    Params
+    ------
+    im_nuclei_seg_mask: array_like
+        Label image of the nuclei in the tile.
+    tile_info: dict
+        Tile dictionary as returned by large_image.TileSource.getSingleTile.
+
+    Returns
+    -------
+    centers: array_like
+        N x 2 array with the (x, y) centroid of each nucleus.
+    sizes: array_like
+        N x 2 array with the (width, height) of the bounding box of each
+        nucleus.
 
+    Notes
+    -----
+    Nuclei are ordered by label, as with skimage.measure.regionprops.
+
+    """
     gx = tile_info['gx']
     gy = tile_info['gy']
     wfrac = tile_info['gwidth'] / np.double(tile_info['width'])
     hfrac = tile_info['gheight'] / np.double(tile_info['height'])
 
-    nuclei_obj_props = skimage.measure.regionprops(im_nuclei_seg_mask)
+    rows, cols = np.nonzero(im_nuclei_seg_mask)
 
-    for i in range(len(nuclei_obj_props)):
-        cx = nuclei_obj_props[i].centroid[1]
-        cy = nuclei_obj_props[i].centroid[0]
-        width = nuclei_obj_props[i].bbox[3] - nuclei_obj_props[i].bbox[1] + 1
-        height = nuclei_obj_props[i].bbox[2] - nuclei_obj_props[i].bbox[0] + 1
+    if rows.size == 0:
+        return np.zeros((0, 2)), np.zeros((0, 2))
 
-        # convert to base pixel coords
-        cx = np.round(gx + cx * wfrac, 2)
-        cy = np.round(gy + cy * hfrac, 2)
-        width = np.round(width * wfrac, 2)
-        height = np.round(height * hfrac, 2)
+    # group pixels by label; np.nonzero returns them in raster order, so
+    # the sort does not need to be stable
+    labels = im_nuclei_seg_mask[rows, cols]
+    order = np.argsort(labels)
+    labels, rows, cols = labels[order], rows[order], cols[order]
 
-        # create annotation json
-        cur_bbox = {
+    starts = np.flatnonzero(np.r_[True, labels[1:] != labels[:-1]])
+    counts = np.diff(np.r_[starts, labels.size])
+
+    cx = np.add.reduceat(cols, starts) / counts.astype(float)
+    cy = np.add.reduceat(rows, starts) / counts.astype(float)
+
+    # the +1 on top of the exclusive regionprops bbox is kept for
+    # consistency with previously generated annotations
+    width = np.maximum.reduceat(cols, starts) - \
+        np.minimum.reduceat(cols, starts) + 2
+    height = np.maximum.reduceat(rows, starts) - \
+        np.minimum.reduceat(rows, starts) + 2
+
+    # convert to base pixel coords
+    centers = np.round(np.stack([gx + cx * wfrac, gy + cy * hfrac], 1), 2)
+    sizes = np.round(np.stack([width * wfrac, height * hfrac], 1), 2)
+
+    return centers, sizes
+
+
+def create_tile_nuclei_bbox_annotations(im_nuclei_seg_mask, tile_info):
+
+    centers, sizes = get_tile_nuclei_bboxes(im_nuclei_seg_mask, tile_info)
+
+    # create annotation json
+    nuclei_annot_list = [
+        {
             "type": "rectangle",
             "center": [cx, cy, 0],
             "width": width,
@@ -112,16 +157,30 @@ def create_tile_nuclei_bbox_annotations(im_nuclei_seg_mask, tile_info):
             "fillColor": "rgba(0,0,0,0)",
             "lineColor": "rgb(0,255,0)"
         }
-
-        nuclei_annot_list.append(cur_bbox)
+        for (cx, cy), (width, height) in zip(centers.tolist(), sizes.tolist())
+    ]
 
     return nuclei_annot_list
 
 
-def create_tile_nuclei_boundary_annotations(im_nuclei_seg_mask, tile_info):
+def get_tile_nuclei_boundaries(im_nuclei_seg_mask, tile_info):
+    """Trace the boundaries of all nuclei in a tile and convert them to base
+    pixel coordinates.
 
-    nuclei_annot_list = []
+    Params
+    ------
+    im_nuclei_seg_mask: array_like
+        Label image of the nuclei in the tile.
+    tile_info: dict
+        Tile dictionary as returned by large_image.TileSource.getSingleTile.
+
+    Returns
+    -------
+    boundaries: list of array_like
+        One num_points x 2 array of (x, y) coordinates per nucleus.
+        Boundaries with fewer than 3 points are dropped.
 
+    """
     gx = tile_info['gx']
     gy = tile_info['gy']
     wfrac = tile_info['gwidth'] / np.double(tile_info['width'])
@@ -130,6 +189,8 @@ def create_tile_nuclei_boundary_annotations(im_nuclei_seg_mask, tile_info):
     by, bx = htk_seg.label.trace_object_boundaries(im_nuclei_seg_mask,
                                                    trace_all=True)
 
+    boundaries = []
+
     for i in range(len(bx)):
 
         # get boundary points and convert to base pixel space
@@ -138,15 +199,70 @@ def create_tile_nuclei_boundary_annotations(im_nuclei_seg_mask, tile_info):
         if num_points < 3:
             continue
 
-        cur_points = np.zeros((num_points, 3))
+        cur_points = np.zeros((num_points, 2))
         cur_points[:, 0] = np.round(gx + bx[i] * wfrac, 2)
         cur_points[:, 1] = np.round(gy + by[i] * hfrac, 2)
-        cur_points = cur_points.tolist()
+
+        boundaries.append(cur_points)
+
+    return boundaries
+
+
+def get_tile_nuclei_contours(im_nuclei_seg_mask, tile_info):
+    """Trace the boundaries of all nuclei in a tile in a single pass and
+    convert them to base pixel coordinates.
+
+    Params
+    ------
+    im_nuclei_seg_mask: array_like
+        Label image of the nuclei in the tile.
+    tile_info: dict
+        Tile dictionary as returned by large_image.TileSource.getSingleTile.
+
+    Returns
+    -------
+    coords: array_like
+        num_points x 2 array of the (x, y) coordinates of the boundary
+        points of all nuclei.
+    offsets: array_like
+        (N + 1)-element array such that the boundary of the i-th nucleus is
+        ``coords[offsets[i]:offsets[i + 1]]``.
+
+    Notes
+    -----
+    Nuclei are ordered by label, as with skimage.measure.regionprops, so
+    that the i-th boundary belongs to the i-th row of the output of
+    histomicstk.features.compute_nuclei_features. Every nucleus has a
+    boundary, including those with fewer than 3 boundary points.
+
+    """
+    gx = tile_info['gx']
+    gy = tile_info['gy']
+    wfrac = tile_info['gwidth'] / np.double(tile_info['width'])
+    hfrac = tile_info['gheight'] / np.double(tile_info['height'])
+
+    contours = htk_features.trace_label_contours(im_nuclei_seg_mask)
+
+    coords = np.empty((len(contours.coords), 2))
+    coords[:, 0] = np.round(gx + contours.coords[:, 1] * wfrac, 2)
+    coords[:, 1] = np.round(gy + contours.coords[:, 0] * hfrac, 2)
+
+    return coords, contours.offsets
+
+
+def create_tile_nuclei_boundary_annotations(im_nuclei_seg_mask, tile_info):
+
+    nuclei_annot_list = []
+
+    for cur_points in get_tile_nuclei_boundaries(im_nuclei_seg_mask,
+                                                 tile_info):
+
+        cur_points = np.pad(cur_points, ((0, 0), (0, 1)), 'constant')
 
         # create annotation json
         cur_annot = {
             "type": "polyline",
-            "points": cur_points,
+            "points": cur_points.tolist(),
             "closed": True,
             "fillColor": "rgba(0,0,0,0)",
             "lineColor": "rgb(0,255,0)"
@@ -157,15 +273,43 @@ def create_tile_nuclei_boundary_annotations(im_nuclei_seg_mask, tile_info):
     return nuclei_annot_list
 
 
-def create_tile_nuclei_annotations(im_nuclei_seg_mask, tile_info, format):
+def create_tile_nuclei_annotations(im_nuclei_seg_mask, tile_info, format,
+                                   columnar=False):
+    """Create the annotations of all nuclei in a tile.
 
+    Params
+    ------
+    im_nuclei_seg_mask: array_like
+        Label image of the nuclei in the tile.
+    tile_info: dict
+        Tile dictionary as returned by large_image.TileSource.getSingleTile.
+    format: str
+        'bbox' for rectangles or 'boundary' for polylines.
+    columnar: bool, optional
+        If True, return a ColumnarAnnotation rather than a list of
+        annotation elements.
+
+    Returns
+    -------
+    nuclei_annot: list of dict or ColumnarAnnotation
+        The nuclei annotations.
+
+    """
     if format == 'bbox':
 
+        if columnar:
+            return ColumnarAnnotation.from_rectangles(
+                *get_tile_nuclei_bboxes(im_nuclei_seg_mask, tile_info))
+
         return create_tile_nuclei_bbox_annotations(im_nuclei_seg_mask,
                                                    tile_info)
 
     elif format == 'boundary':
 
+        if columnar:
+            return ColumnarAnnotation.from_polylines(
+                get_tile_nuclei_boundaries(im_nuclei_seg_mask, tile_info))
+
         return create_tile_nuclei_boundary_annotations(im_nuclei_seg_mask,
                                                        tile_info)
     else:
@@ -173,6 +317,281 @@ def create_tile_nuclei_annotations(im_nuclei_seg_mask, tile_info, format):
         raise ValueError('Invalid value passed for nuclei_annotation_format')
 
 
+def read_annotation_elements(filename):
+    """Read the elements of a nuclei annotation file.
+
+    Params
+    ------
+    filename: str
+        Path of a columnar (.npz) annotation file or of an annotation JSON
+        file.
+
+    Returns
+    -------
+    elements: ColumnarAnnotation or list of dict
+        A ColumnarAnnotation for columnar files, and the list of element
+        dicts otherwise. JSON elements are not converted, so that elements of
+        any type and all their keys are kept as they are.
+
+    """
+    if is_columnar_annotation_file(filename):
+        return ColumnarAnnotation.load(filename)
+
+    with open(filename) as annotation_file:
+        return json.load(annotation_file)['elements']
+
+
+def group_annotation_elements(elements, element_class, class_styles):
+    """Group annotation elements by class, setting the style of each class.
+
+    Params
+    ------
+    elements: ColumnarAnnotation or list of dict
+        Elements as returned by read_annotation_elements.
+    element_class: array_like
+        Class of each element.
+    class_styles: dict
+        Maps each class to a dict of style keys, e.g. lineColor, set on the
+        elements of the class.
+
+    Returns
+    -------
+    elements_by_class: dict
+        Maps each class to the list of its element dicts, in input order.
+
+    """
+    element_class = np.asarray(element_class)
+
+    elements_by_class = {}
+
+    for cur_class, style in class_styles.items():
+
+        indices = np.flatnonzero(element_class == cur_class)
+
+        if isinstance(elements, ColumnarAnnotation):
+            cur_annot = elements.take(indices)
+            cur_annot.set_style(**style)
+            elements_by_class[cur_class] = \
+                cur_annot.to_annotation()['elements']
+        else:
+            elements_by_class[cur_class] = [dict(elements[i], **style)
+                                            for i in indices]
+
+    return elements_by_class
+
+
+def iter_dask_results(tasks, client=None, batch_size=64):
+    """Compute a list of dask.delayed tasks and yield their results as they
+    become available, so that the caller never holds all of them at once.
+
+    Params
+    ------
+    tasks: list of dask.delayed
+        Tasks to compute.
+    client: dask.distributed.Client, optional
+        If given, all tasks are submitted to the cluster and results are
+        yielded in order of completion using dask.distributed.as_completed.
+        Each result is released from the cluster once it has been yielded.
+    batch_size: int, optional
+        If no client is given, tasks are computed with the configured dask
+        scheduler in batches of this size and results are yielded in order.
+
+    Yields
+    ------
+    result:
+        The result of one of the tasks.
+
+    """
+    import dask
+
+    if client is not None:
+        import dask.distributed
+
+        # do not keep a reference to the futures so that each result can be
+        # released as soon as it has been consumed
+        for future in dask.distributed.as_completed(client.compute(tasks)):
+            yield future.result()
+        return
+
+    for i in range(0, len(tasks), batch_size):
+        for result in dask.compute(*tasks[i:i + batch_size]):
+            yield result
+
+
+def write_annotation_stream(filename, name, element_lists, compact=False):
+    """Write an annotation file in the girder annotation format, writing
+    elements to disk as they are produced rather than building the whole
+    document in memory.
+
+    Params
+    ------
+    filename: str
+        Path of the output annotation file.
+    name: str
+        Name of the annotation.
+    element_lists: iterable of list of dict
+        Lists of annotation elements, e.g. the per-tile results yielded by
+        iter_dask_results.
+    compact: bool, optional
+        If True, write the file without indentation or whitespace.  If False,
+        the output is identical to that of json.dump with indent=2.
+
+    Returns
+    -------
+    num_elements: int
+        Total number of elements written.
+
+    """
+    if compact:
+        def dumps(obj):
+            return json.dumps(obj, separators=(',', ':'))
+        head = '{"name":%s,"elements":[' % dumps(name)
+        first_sep, sep, tail, empty_tail = '', ',', ']}', ']}'
+    else:
+        # elements are nested two levels deep in the document
+        def dumps(obj):
+            return '    ' + json.dumps(obj, indent=2).replace('\n', '\n    ')
+        head = '{\n  "name": %s,\n  "elements": [' % json.dumps(name)
+        first_sep, sep, tail, empty_tail = '\n', ',\n', '\n  ]\n}', ']\n}'
+
+    num_elements = 0
+
+    with open(filename, 'w') as annotation_file:
+
+        annotation_file.write(head)
+
+        for element_list in element_lists:
+            for element in element_list:
+                annotation_file.write(sep if num_elements else first_sep)
+                annotation_file.write(dumps(element))
+                num_elements += 1
+
+        annotation_file.write(tail if num_elements else empty_tail)
+
+    return num_elements
+
+
+class ParquetFeatureWriter(object):
+    """Write nuclei feature tables to a Parquet file one row group at a time,
+    so that the features of a whole slide never need to be held in memory.
+
+    Feature columns are stored as float32. The boundary of each nucleus can
+    be stored alongside its features in a column of lists of (x, y) float32
+    points.
+
+    Params
+    ------
+    filename: str
+        Path of the output Parquet file.
+    compression: str, optional
+        Compression codec of the Parquet file.
+
+    Notes
+    -----
+    All tables must have the same columns as the first one. The file is only
+    complete once the writer has been closed, which is done automatically
+    when it is used as a context manager.
+
+    """
+
+    #: Name of the column holding the nucleus boundaries
+    geometry_column = 'Geometry'
+
+    def __init__(self, filename, compression='snappy'):
+
+        self.filename = filename
+        self.compression = compression
+        self.num_rows = 0
+        self.num_row_groups = 0
+
+        self._schema = None
+        self._writer = None
+        self._closed = False
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+
+        self.close()
+
+    def write(self, fdata, geometry=None):
+        """Append a feature table to the file as a new row group.
+
+        Params
+        ------
+        fdata: pandas.DataFrame
+            Features of N nuclei.
+        geometry: tuple of array_like, optional
+            The (coords, offsets) of the boundaries of the N nuclei, as
+            returned by get_tile_nuclei_contours.
+
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        names = [str(col) for col in fdata.columns]
+        arrays = [pa.array(np.asarray(fdata[col], dtype=np.float32))
+                  for col in fdata.columns]
+
+        if geometry is not None:
+
+            coords, offsets = geometry
+
+            if len(offsets) != len(fdata) + 1:
+                raise ValueError('The number of nuclei of the geometry and '
+                                 'the feature table do not match')
+
+            points = pa.FixedSizeListArray.from_arrays(
+                pa.array(np.asarray(coords, dtype=np.float32).ravel()), 2)
+
+            names.append(self.geometry_column)
+            arrays.append(pa.ListArray.from_arrays(
+                pa.array(np.asarray(offsets, dtype=np.int32)), points))
+
+        if self._schema is None:
+            self._schema = pa.schema(
+                [pa.field(name, array.type)
+                 for name, array in zip(names, arrays)])
+        elif names != self._schema.names:
+            raise ValueError('The columns of the feature table do not match '
+                             'those of the previous ones')
+
+        if not len(fdata):
+            return
+
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self.filename, self._schema,
+                                            compression=self.compression)
+
+        self._writer.write_table(
+            pa.Table.from_arrays(arrays, schema=self._schema))
+
+        self.num_rows += len(fdata)
+        self.num_row_groups += 1
+
+    def close(self):
+        """Finish writing the file. A file with no rows is written if no
+        feature table was written."""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if self._closed:
+            return
+
+        if self._writer is None:
+            schema = self._schema if self._schema is not None \
+                else pa.schema([])
+            pq.write_table(schema.empty_table(), self.filename,
+                           compression=self.compression)
+        else:
+            self._writer.close()
+            self._writer = None
+
+        self._closed = True
+
+
 def create_dask_client(args):
     """Create and install a Dask distributed client using args from a
     Namespace, supporting the following attributes:
@@ -233,6 +652,113 @@ def create_dask_client(args):
     return dask.distributed.Client(scheduler)
 
 
+def group_tile_positions(tile_positions, tile_grouping):
+    """Split a sequence of tile positions into contiguous groups so that
+    each group can be processed as part of a single task.
+
+    Params
+    ------
+    tile_positions: list of int
+        Positions of the tiles to be processed, e.g. those of the foreground
+        tiles in iteration order.
+    tile_grouping: int
+        Maximum number of tiles in each group.  Values less than 1 are
+        treated as 1.
+
+    Returns
+    -------
+    tile_position_groups: list of list of int
+        Consecutive runs of at most `tile_grouping` tile positions.
+
+    """
+    tile_positions = list(tile_positions)
+    tile_grouping = max(1, int(tile_grouping))
+
+    return [tile_positions[i:i + tile_grouping]
+            for i in range(0, len(tile_positions), tile_grouping)]
+
+
+def get_artifact_cache(args):
+    """Create the on-disk cache of per-slide artifacts requested by args,
+    supporting the following attributes:
+
+    - .cache_dir: Directory of the cache, or the empty string to disable
+      caching
+    - .cache_max_size: Maximum size of the cache in megabytes
+
+    Returns
+    -------
+    cache: histomicstk.utils.ArtifactCache or None
+        None if caching is disabled.
+
+    """
+    cache_dir = getattr(args, 'cache_dir', None)
+
+    if not cache_dir:
+        return None
+
+    max_size = getattr(args, 'cache_max_size', 1024)
+
+    return htk_utils.ArtifactCache(cache_dir, max_size=max_size * 1024 ** 2)
+
+
+# version of the code computing each cached slide artifact, which must be
+# incremented whenever the result of segment_wsi_foreground_at_low_res,
+# compute_tile_foreground_fraction or reinhard_stats changes
+ARTIFACT_VERSIONS = {
+    'fgnd_mask_lres': 1,
+    'tile_fgnd_frac': 1,
+    'reinhard_stats': 1,
+}
+
+
+def get_slide_artifact(cache, slide_path, name, params, func, *args):
+    """Get an artifact of a slide through the artifact cache, or compute it
+    directly if cache is None.  See histomicstk.utils.ArtifactCache.
+
+    The artifact is computed as ``func(*args, **params)`` and cached under
+    its version in ARTIFACT_VERSIONS, so params holds all arguments of func
+    other than the slide.
+
+    """
+    if cache is None:
+        return func(*args, **params)
+
+    return cache.get_or_compute(slide_path, name, ARTIFACT_VERSIONS[name],
+                                params, func, *args, **params)
+
+
+def get_tile_source_pool_info(client=None):
+    """Collect the counters of the tile source pool of every dask worker.
+
+    Params
+    ------
+    client: dask.distributed.Client, optional
+        Client of the cluster whose workers should be queried.  If None,
+        only the pool of the current process is reported, which is where
+        tiles are read with the 'multithreading' scheduler.  With the
+        'multiprocessing' scheduler, tiles are read in pool processes whose
+        counters cannot be collected, and an empty dict is returned.
+
+    Returns
+    -------
+    pool_info: dict
+        Maps worker addresses (or 'local') to a
+        histomicstk.utils.tile_source_pool.TileSourcePoolInfo
+
+    """
+    if client is None:
+        import dask
+
+        if dask.config.get('scheduler', None) in (
+                'processes', 'multiprocessing'):
+            return {}
+
+        return {'local': htk_utils.tile_source_pool_info()}
+
+    return client.run(htk_utils.tile_source_pool_info)
+
+
 def get_region_dict(region, maxRegionSize=None, tilesource=None):
     """Return a dict corresponding to region, checking the region size if
     maxRegionSize is provided.
@@ -334,10 +860,18 @@ __all__ = (
     'create_tile_nuclei_bbox_annotations',
     'create_tile_nuclei_boundary_annotations',
     'disp_time_hms',
+    'get_artifact_cache',
     'get_region_dict',
+    'get_slide_artifact',
+    'get_tile_nuclei_bboxes',
+    'get_tile_nuclei_boundaries',
+    'get_tile_source_pool_info',
+    'group_tile_positions',
+    'iter_dask_results',
     'get_stain_matrix',
     'get_stain_vector',
     'sample_pixels',
     'segment_wsi_foreground_at_low_res',
     'splitArgs',
+    'write_annotation_stream',
 )
@@ -14,6 +14,8 @@ from .compute_haralick_features import compute_haralick_features
 from .compute_intensity_features import compute_intensity_features
 from .compute_morphometry_features import compute_morphometry_features
 from .graycomatrixext import graycomatrixext
+from .label_index import LabelIndex
+from .trace_label_contours import trace_label_contours
 
 from .compute_nuclei_features import compute_nuclei_features
 
@@ -29,4 +31,6 @@ __all__ = (
     'compute_morphometry_features',
     'compute_nuclei_features',
     'graycomatrixext',
+    'LabelIndex',
+    'trace_label_contours',
 )
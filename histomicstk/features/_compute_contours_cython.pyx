@@ -0,0 +1,201 @@
+import numpy as np
+cimport numpy as np
+cimport cython
+
+from libcpp.vector cimport vector
+
+
+# offsets of the Moore neighbors in clockwise order starting from the west
+cdef long[8] _drow = [0, -1, -1, -1, 0, 1, 1, 1]
+cdef long[8] _dcol = [-1, -1, 0, 1, 1, 1, 0, -1]
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def _trace_label_contours_cython(long[:, ::1] im_label not None):
+
+    # traces the outer boundary of every label with Moore neighbor tracing
+    # in a single raster scan of the label image. The first pixel of a label
+    # met by the scan is the start of its contour, so the first component of
+    # each label in raster order is traced.
+    cdef long nrows = im_label.shape[0]
+    cdef long ncols = im_label.shape[1]
+
+    cdef long max_label = 0
+    cdef long r, c
+
+    for r in range(nrows):
+        for c in range(ncols):
+            if im_label[r, c] > max_label:
+                max_label = im_label[r, c]
+
+    cdef unsigned char[::1] traced = np.zeros(max_label + 1, dtype=np.uint8)
+
+    cdef vector[long] rows
+    cdef vector[long] cols
+    cdef vector[long] offsets
+    cdef vector[long] labels
+
+    # direction from a pixel to the last background neighbor checked before
+    # its successor at each direction, relative to the successor
+    cdef long[8] backtrack
+    cdef long d, br, bc, k
+
+    for d in range(8):
+        br = _drow[(d + 7) % 8] - _drow[d]
+        bc = _dcol[(d + 7) % 8] - _dcol[d]
+        for k in range(8):
+            if _drow[k] == br and _dcol[k] == bc:
+                backtrack[d] = k
+
+    cdef long lab, pr, pc, qr, qc, r1, c1, dirn, found
+    cdef long num_steps, max_steps = 4 * nrows * ncols + 8
+
+    offsets.push_back(0)
+
+    with nogil:
+
+        for r in range(nrows):
+            for c in range(ncols):
+
+                lab = im_label[r, c]
+
+                if lab <= 0 or traced[lab]:
+                    continue
+
+                traced[lab] = 1
+
+                labels.push_back(lab)
+                rows.push_back(r)
+                cols.push_back(c)
+
+                # the west neighbor of the first pixel is background
+                pr = r
+                pc = c
+                dirn = 0
+                r1 = -1
+                c1 = -1
+                num_steps = 0
+
+                while num_steps < max_steps:
+
+                    num_steps += 1
+
+                    # clockwise search for the next boundary pixel
+                    found = 0
+                    for k in range(1, 8):
+                        d = (dirn + k) % 8
+                        qr = pr + _drow[d]
+                        qc = pc + _dcol[d]
+                        if 0 <= qr < nrows and 0 <= qc < ncols and \
+                                im_label[qr, qc] == lab:
+                            found = 1
+                            break
+
+                    # isolated pixel
+                    if not found:
+                        break
+
+                    # stop when the first edge of the contour is revisited,
+                    # dropping the start pixel appended on the way back
+                    if pr == r and pc == c and qr == r1 and qc == c1:
+                        rows.pop_back()
+                        cols.pop_back()
+                        break
+
+                    if r1 < 0:
+                        r1 = qr
+                        c1 = qc
+
+                    rows.push_back(qr)
+                    cols.push_back(qc)
+
+                    pr = qr
+                    pc = qc
+                    dirn = backtrack[d]
+
+                offsets.push_back(rows.size())
+
+    coords = np.empty((rows.size(), 2), dtype=np.int64)
+    contour_offsets = np.empty(offsets.size(), dtype=np.int64)
+    contour_labels = np.empty(labels.size(), dtype=np.int64)
+
+    cdef long[:, ::1] coords_view = coords
+    cdef long[::1] offsets_view = contour_offsets
+    cdef long[::1] labels_view = contour_labels
+
+    for k in range(rows.size()):
+        coords_view[k, 0] = rows[k]
+        coords_view[k, 1] = cols[k]
+
+    for k in range(offsets.size()):
+        offsets_view[k] = offsets[k]
+
+    for k in range(labels.size()):
+        labels_view[k] = labels[k]
+
+    return coords, contour_offsets, contour_labels
+
+
+@cython.cdivision(True)
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def _convex_hull_areas_cython(double[:, ::1] points not None,
+                              long[::1] offsets not None):
+
+    # area of the convex hull of each segment of points sorted by row and
+    # then column within each segment, with Andrew's monotone chain
+    cdef long num_segments = offsets.shape[0] - 1
+
+    cdef double[::1] areas = np.zeros(num_segments, dtype=np.float64)
+
+    cdef long[::1] hull = np.empty(2 * points.shape[0] + 1, dtype=np.int64)
+
+    cdef long i, j, start, stop, n, lower
+    cdef double area
+
+    with nogil:
+        for i in range(num_segments):
+
+            start = offsets[i]
+            stop = offsets[i + 1]
+
+            if stop - start < 3:
+                continue
+
+            # lower hull
+            n = 0
+            for j in range(start, stop):
+                while n >= 2 and _cross(points, hull[n - 2],
+                                        hull[n - 1], j) <= 0:
+                    n -= 1
+                hull[n] = j
+                n += 1
+
+            # upper hull
+            lower = n + 1
+            for j in range(stop - 2, start - 1, -1):
+                while n >= lower and _cross(points, hull[n - 2],
+                                            hull[n - 1], j) <= 0:
+                    n -= 1
+                hull[n] = j
+                n += 1
+
+            # shoelace formula over the closed hull
+            area = 0
+            for j in range(n - 1):
+                area += (points[hull[j], 0] * points[hull[j + 1], 1] -
+                         points[hull[j + 1], 0] * points[hull[j], 1])
+
+            areas[i] = abs(area) / 2
+
+    return np.asarray(areas)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef inline double _cross(double[:, ::1] points,
+                          long o, long a, long b) nogil:
+
+    return ((points[a, 0] - points[o, 0]) * (points[b, 1] - points[o, 1]) -
+            (points[a, 1] - points[o, 1]) * (points[b, 0] - points[o, 0]))
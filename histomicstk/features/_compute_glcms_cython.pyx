@@ -0,0 +1,42 @@
+import numpy as np
+cimport numpy as np
+cimport cython
+
+@cython.cdivision(True)
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def _compute_glcms_cython(long[:, ::1] im_levels not None,
+                          long[:, ::1] bboxes not None,
+                          long[:, ::1] offsets not None,
+                          long num_levels):
+
+    # co-occurrence counts of the pixel pairs within the bounding box
+    # (min_row, min_col, max_row, max_col) of each object for each offset
+    cdef long num_objects = bboxes.shape[0]
+    cdef long num_offsets = offsets.shape[0]
+
+    cdef double[:, :, :, ::1] glcms = np.zeros(
+        [num_objects, num_levels, num_levels, num_offsets], dtype=np.float64)
+
+    cdef long i, k, r, c, dr, dc, r0, r1, c0, c1, p1, p2
+
+    with nogil:
+        for i in range(num_objects):
+            for k in range(num_offsets):
+
+                dr = offsets[k, 0]
+                dc = offsets[k, 1]
+
+                # rows and columns whose neighbor is also in the box
+                r0 = max(bboxes[i, 0], bboxes[i, 0] - dr)
+                r1 = min(bboxes[i, 2], bboxes[i, 2] - dr)
+                c0 = max(bboxes[i, 1], bboxes[i, 1] - dc)
+                c1 = min(bboxes[i, 3], bboxes[i, 3] - dc)
+
+                for r in range(r0, r1):
+                    for c in range(c0, c1):
+                        p1 = im_levels[r, c]
+                        p2 = im_levels[r + dr, c + dc]
+                        glcms[i, p1, p2, k] += 1
+
+    return np.asarray(glcms)
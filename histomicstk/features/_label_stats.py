@@ -0,0 +1,31 @@
+"""Helpers computing features from per-label statistics of pixel values
+gathered with a LabelIndex."""
+import numpy as np
+
+
+def hist_energy_entropy(hist):
+    """Get the energy and entropy of each row of a histogram, as
+    ``np.sum(prob**2)`` and ``scipy.stats.entropy(prob)`` do."""
+    prob = hist / hist.sum(1, keepdims=True).astype(np.float32)
+    energy = np.sum(prob ** 2, 1)
+    pk = prob / prob.sum(1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        entr = np.where(pk > 0, -pk * np.log(pk), 0)
+    return energy, np.sum(entr, 1)
+
+
+def skew_kurtosis(m2, m3, m4):
+    """Get the biased skewness and Fisher kurtosis from central moments,
+    which are 0 and -3 respectively for constant values."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        skew = np.where(m2 > 0, m3 / m2 ** 1.5, 0)
+        kurt = np.where(m2 > 0, m4 / m2 ** 2, 0) - 3
+    return skew, kurt
+
+
+def get_object_rows(label_index, rprops=None):
+    """Get the rows of the statistics of `label_index` in the order of
+    `rprops`, or all of them in increasing label order."""
+    if rprops is None:
+        return slice(None)
+    return label_index.get_rows([prop.label for prop in rprops])
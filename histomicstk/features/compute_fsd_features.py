@@ -3,8 +3,11 @@ import pandas as pd
 from skimage.measure import regionprops
 from skimage.segmentation import find_boundaries
 
+from ._label_stats import get_object_rows
 
-def compute_fsd_features(im_label, K=128, Fs=6, Delta=8, rprops=None):
+
+def compute_fsd_features(im_label, K=128, Fs=6, Delta=8, rprops=None,
+                         contours=None, label_index=None):
     """
     Calculates `Fourier shape descriptors` for each objects.
 
@@ -27,6 +30,20 @@ def compute_fsd_features(im_label, K=128, Fs=6, Delta=8, rprops=None):
         passed then it will be computed inside which will increase the
         computation time.
 
+    contours : output of histomicstk.features.trace_label_contours, optional
+        contours = trace_label_contours( im_label ). If passed, the FSDs of
+        all objects are computed at once from these ordered boundaries,
+        instead of from the boundary pixels of each object in raster order.
+        The FSDs are then those of a different sampling of the boundary and
+        can differ substantially from the default ones. Objects one pixel
+        wide, whose default FSDs are NaN, get the finite FSDs of their traced
+        boundary.
+
+    label_index : histomicstk.features.LabelIndex, optional
+        label_index = histomicstk.features.LabelIndex( im_label ). If passed,
+        the labels and bounding boxes of the objects are taken from it
+        instead of rprops.
+
     Returns
     -------
     fdata: Pandas data frame containing the FSD features for each
@@ -44,47 +61,60 @@ def compute_fsd_features(im_label, K=128, Fs=6, Delta=8, rprops=None):
     for i in range(0, Fs):
         feature_list = np.append(feature_list, 'Shape.FSD' + str(i+1))
 
+    # fourier descriptors, spaced evenly over the interval 1:K/2
+    Interval = np.round(
+        np.power(
+            2, np.linspace(0, np.log2(K)-1, Fs+1, endpoint=True)
+        )
+    ).astype(np.uint8)
+
+    if contours is not None:
+
+        F = _ContourFSDs(contours, K, Interval)
+
+        if rprops is not None:
+            F = F[contours.get_rows([prop.label for prop in rprops])]
+
+        return pd.DataFrame(F, columns=feature_list)
+
     # get Label size x
     sizex = im_label.shape[0]
     sizey = im_label.shape[1]
 
-    # get the number of objects in Label
-    if rprops is None:
-        rprops = regionprops(im_label)
+    # get the labels and bounding boxes of the objects in Label
+    if label_index is not None:
+        rows = get_object_rows(label_index, rprops)
+        labels = label_index.labels[rows]
+        bboxes = label_index.bboxes[rows]
+    else:
+        if rprops is None:
+            rprops = regionprops(im_label)
+        labels = [prop.label for prop in rprops]
+        bboxes = [prop.bbox for prop in rprops]
 
     # create pandas data frame containing the features for each object
     numFeatures = len(feature_list)
-    numLabels = len(rprops)
-    fdata = pd.DataFrame(np.zeros((numLabels, numFeatures)),
-                         columns=feature_list)
-
-    # fourier descriptors, spaced evenly over the interval 1:K/2
-    Interval = np.round(
-        np.power(
-            2, np.linspace(0, np.log2(K)-1, Fs+1, endpoint=True)
-        )
-    ).astype(np.uint8)
+    numLabels = len(labels)
+    F = np.zeros((numLabels, numFeatures))
 
     for i in range(numLabels):
         # get bounds of dilated nucleus
         min_row, max_row, min_col, max_col = \
-            _GetBounds(rprops[i].bbox, Delta, sizex, sizey)
+            _GetBounds(bboxes[i], Delta, sizex, sizey)
         # grab label mask
         lmask = (
-            im_label[min_row:max_row, min_col:max_col] == rprops[i].label
+            im_label[min_row:max_row, min_col:max_col] == labels[i]
         ).astype(np.bool)
         # find boundaries
         Bounds = np.argwhere(
             find_boundaries(lmask, mode="inner").astype(np.uint8) == 1
         )
         # check length of boundaries
-        if len(Bounds) < 2:
-            fdata.at[i, :] = 0
-        else:
+        if len(Bounds) >= 2:
             # compute fourier descriptors
-            fdata.at[i, :] = _FSDs(Bounds[:, 0], Bounds[:, 1], K, Interval)
+            F[i] = _FSDs(Bounds[:, 0], Bounds[:, 1], K, Interval)
 
-    return fdata
+    return pd.DataFrame(F, columns=feature_list)
 
 
 def _InterpolateArcLength(X, Y, K):
@@ -197,6 +227,69 @@ def _FSDs(X, Y, K, Intervals):
     return F
 
 
+def _ContourFSDs(contours, K, Intervals):
+    """
+    Calculates the FSDs of all objects from their traced boundaries at once,
+    as `_FSDs` does for one object.
+
+    Parameters
+    ----------
+    contours : LabelContours
+        Boundaries of the objects.
+    K : int
+        Number of points for boundary resampling to calculate fourier
+        descriptors.
+    Intervals : array_like
+        Intervals spaced evenly over 1:K/2.
+
+    Returns
+    -------
+    F : array_like
+        A len(contours) x (length(Intervals) - 1) array containing the
+        spectral energy of the cumulative angular function of each object,
+        summed over defined 'Intervals'. Rows of objects with less than two
+        boundary points are zero.
+
+    """
+
+    # check input 'Intervals'
+    if Intervals[0] != 1.:
+        Intervals = np.hstack((1., Intervals))
+    if Intervals[-1] != (K / 2):
+        Intervals = np.hstack((Intervals, float(K)))
+    Intervals = Intervals.astype(int)
+    # get length of intervals
+    L = len(Intervals)
+    # initialize F
+    F = np.zeros((len(contours), L-1))
+    # interpolate boundaries of objects with at least two boundary points
+    valid = contours.counts >= 2
+    iX, iY = contours.resample(K)
+    # round off the noise of the batch interpolation, which would otherwise
+    # flip the angle of horizontal steps between -pi and pi
+    iX, iY = np.round(iX[valid], 9), np.round(iY[valid], 9)
+    # calculate curvature
+    Curvature = np.arctan2(
+        (iY[:, 1:] - iY[:, :-1]),
+        (iX[:, 1:] - iX[:, :-1])
+    )
+    # make curvature cumulative
+    Curvature = Curvature - Curvature[:, :1]
+    # calculate FFT
+    fX = np.fft.fft(Curvature, axis=1)
+    # spectral energy
+    fX = (fX * fX.conj()).real
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fX = fX / fX.sum(axis=1, keepdims=True)
+    # calculate 'F' values
+    for i in range(L-1):
+        F[valid, i] = np.round(
+            fX[:, Intervals[i]-1:Intervals[i+1]].sum(axis=1), L
+        )
+
+    return F
+
+
 def _GetBounds(bbox, delta, M, N):
     """
     Returns bounds of object in global label image.
@@ -5,10 +5,9 @@ from collections import namedtuple
 import numpy as np
 from numpy import linalg
 from pandas import DataFrame
-from scipy.spatial import cKDTree as KDTree, Voronoi
+from scipy.spatial import cKDTree as KDTree, Delaunay, QhullError
 from scipy import sparse
 from scipy.sparse.csgraph import minimum_spanning_tree
-from scipy.spatial.distance import pdist
 
 PopStats = namedtuple('PopStats', ['mean', 'stddev', 'min_max_ratio', 'disorder'])
 PolyProps = namedtuple('PolyProps', ['area', 'peri', 'max_dist'])
@@ -22,6 +21,9 @@ def compute_global_cell_graph_features(
         centroids,
         neighbor_distances=10. * np.arange(1, 6),
         neighbor_counts=(3, 5, 7),
+        block_size=None,
+        halo=None,
+        relative_accuracy=None,
 ):
     r"""Compute global (i.e., not per-nucleus) features of the nuclei with
     the given centroids based on the partitioning of the space into
@@ -37,6 +39,27 @@ def compute_global_cell_graph_features(
         Sequence of numbers of neighbors, each of which is used to
         compute statistics relating to the distance required to reach
         that many neighbors.
+    block_size : float, optional
+        If given, the Voronoi diagram and Delaunay triangulation are
+        computed separately in square blocks of this side length, so that
+        time and memory scale with the number of nuclei in a block rather
+        than in the whole slide.  Each Voronoi cell, Delaunay triangle and
+        Delaunay edge is only counted in the block that contains its
+        nucleus, centroid or midpoint respectively.  If None, all nuclei are
+        processed at once.
+    halo : float, optional
+        Width of the margin of nuclei around each block that are included
+        when triangulating it.  Cells and triangles near a block border are
+        the same as those of the whole point set as long as their extent is
+        within the halo, which excludes the long thin triangles along the
+        convex hull of all nuclei.  Must not exceed `block_size`.  Default
+        value = block_size / 4.
+    relative_accuracy : float, optional
+        If given, the statistics of each population are computed from a
+        logarithmic histogram whose bins have this relative width, instead
+        of from all of its values, so that memory does not grow with the
+        number of nuclei.  The statistics are then approximate to within
+        about this relative error.
 
     Returns
     -------
@@ -78,6 +101,9 @@ def compute_global_cell_graph_features(
     The indices for the density features are with respect to the
     *sorted* values of the corresponding argument sequence.
 
+    The minimum spanning tree is computed over the Delaunay edges of all
+    blocks, and the density features are always computed over all nuclei.
+
     References
     ----------
     .. [#] Doyle, S., Agner, S., Madabhushi, A., Feldman, M., & Tomaszewski, J.
@@ -91,6 +117,9 @@ def compute_global_cell_graph_features(
         centroids,
         neighbor_distances,
         neighbor_counts,
+        block_size,
+        halo,
+        relative_accuracy,
     ))
 
 
@@ -98,45 +127,89 @@ def _compute_global_cell_graph_features(
         centroids,
         neighbor_distances,
         neighbor_counts,
+        block_size=None,
+        halo=None,
+        relative_accuracy=None,
 ):
     """Internal support for compute_global_cell_graph_features that
     returns its result in a nested nametuple structure instead of a
     pandas DataFrame.
 
     """
-    vor = Voronoi(centroids)
-    centroids = vor.points
-    vertices = vor.vertices
-
-    regions = [r for r in vor.regions if r and -1 not in r]
-    areas = np.stack(_poly_area(vertices[r]) for r in regions)
-    peris = np.stack(_poly_peri(vertices[r]) for r in regions)
-    max_dists = np.stack(pdist(vertices[r]).max() for r in regions)
-    poly_props = PolyProps._make(map(_pop_stats, (areas, peris, max_dists)))
-
-    # Assume that each Voronoi vertex is on exactly three ridges.
-    ridge_points = vor.ridge_points
-    # This isn't exactly the collection of sides, since if they should
-    # be counted per-triangle then we weight border ridges wrong
-    # relative to ridges that are part of two triangles.
-    ridge_lengths = _dist(*np.swapaxes(centroids[ridge_points], 0, 1))
-    sides = ridge_lengths
-    # Point indices of each triangle
-    tris = [[] for _ in vertices]
-    for p, ri in enumerate(vor.point_region):
-        for vi in vor.regions[ri]:
-            if vi != -1:
-                tris[vi].append(p)
-    # This will only fail in particular symmetrical cases where a
-    # Voronoi vertex is associated with more than three centroids.
-    # Since this should be unlikely in practice, we don't handle it
-    # beyond throwing an AssertionError
-    assert all(len(t) == 3 for t in tris)
-    tris = np.asarray(tris)
-    areas = np.stack(_poly_area(centroids[t]) for t in tris)
-    tri_props = TriProps._make(map(_pop_stats, (sides, areas)))
-
-    graph = sparse.coo_matrix((ridge_lengths, np.sort(ridge_points).T),
+    centroids = np.asarray(centroids, dtype=float)
+
+    if block_size is not None:
+        if halo is None:
+            halo = block_size / 4.
+        if not 0 <= halo <= block_size:
+            raise ValueError('halo must be between 0 and block_size')
+
+    def accumulator():
+        return _PopStatsAccumulator(relative_accuracy)
+
+    poly_props = PolyProps(accumulator(), accumulator(), accumulator())
+    tri_props = TriProps(accumulator(), accumulator())
+    neighbors_in_distance = {r: accumulator() for r in neighbor_distances}
+    distance_for_neighbors = {c: accumulator() for c in neighbor_counts}
+
+    mst_edges = []
+    mst_lengths = []
+
+    tree = KDTree(centroids)
+
+    for key, indices in _iter_blocks(centroids, block_size, halo):
+
+        points = centroids[indices]
+        owned = np.flatnonzero(_is_owned(points, key, block_size))
+
+        try:
+            tris = Delaunay(points).simplices
+        except QhullError:
+            # too few or degenerate nuclei in the block and its halo
+            if key is None:
+                raise
+            tris = None
+
+        if tris is not None:
+
+            ridge_points, is_boundary = _delaunay_edges(tris, len(points))
+
+            for acc, values in zip(poly_props, _voronoi_cell_props(
+                    points, tris, owned, is_boundary)):
+                acc.add(values)
+
+            # Delaunay edges are the point pairs of the Voronoi ridges.
+            # This isn't exactly the collection of sides, since if they
+            # should be counted per-triangle then we weight border ridges
+            # wrong relative to ridges that are part of two triangles.
+            ends = points[ridge_points]
+            is_owned = _is_owned(ends.mean(1), key, block_size)
+            ridge_lengths = _dist(*np.swapaxes(ends[is_owned], 0, 1))
+            tri_props.sides.add(ridge_lengths)
+
+            mst_edges.append(indices[ridge_points[is_owned]])
+            mst_lengths.append(ridge_lengths)
+
+            corners = points[tris]
+            is_owned = _is_owned(corners.mean(1), key, block_size)
+            tri_props.area.add(_poly_area(corners[is_owned]))
+
+        owned_points = points[owned]
+
+        for r, acc in neighbors_in_distance.items():
+            # Yes, we just throw away the actual points
+            acc.add(tree.query_ball_point(owned_points, r,
+                                          return_length=True) - 1)
+
+        distances = tree.query(owned_points,
+                               [c + 1 for c in neighbor_counts])[0]
+        for c, values in zip(neighbor_counts, distances.T):
+            distance_for_neighbors[c].add(values)
+
+    mst_edges = np.concatenate(mst_edges) if mst_edges \
+        else np.zeros((0, 2), dtype=int)
+    graph = sparse.coo_matrix((np.concatenate(mst_lengths or [[]]),
+                               np.sort(mst_edges).T),
                               (len(centroids), len(centroids)))
     mst = minimum_spanning_tree(graph)
     # Without looking into exactly how minimum_spanning_tree
@@ -144,19 +217,192 @@ def _compute_global_cell_graph_features(
     # safe side.
     mst_branches = _pop_stats(mst.data[mst.data != 0])
 
-    tree = KDTree(centroids)
-    neigbors_in_distance = {
-        # Yes, we just throw away the actual points
-        r: _pop_stats(np.stack(map(len, tree.query_ball_tree(tree, r))) - 1)
-        for r in neighbor_distances
-    }
-    distance_for_neighbors = dict(zip(
-        neighbor_counts,
-        map(_pop_stats, tree.query(centroids, [c + 1 for c in neighbor_counts])[0].T),
-    ))
-    density_props = DensityProps(neigbors_in_distance, distance_for_neighbors)
+    density_props = DensityProps(
+        {r: acc.pop_stats() for r, acc in neighbors_in_distance.items()},
+        {c: acc.pop_stats() for c, acc in distance_for_neighbors.items()},
+    )
+
+    return Props(PolyProps._make(acc.pop_stats() for acc in poly_props),
+                 TriProps._make(acc.pop_stats() for acc in tri_props),
+                 mst_branches, density_props)
+
+
+def _iter_blocks(centroids, block_size, halo):
+    """Yield the key of each block of the given size containing points,
+    along with the indices of the points in the block and within halo of
+    it.  A single block with key None and all points is yielded if
+    block_size is None.
+
+    """
+    if block_size is None:
+        yield None, np.arange(len(centroids))
+        return
+
+    keys = np.floor(centroids / block_size).astype(np.int64)
+    order = np.lexsort((keys[:, 1], keys[:, 0]))
+    keys = keys[order]
+
+    starts = np.flatnonzero(np.r_[True, np.any(keys[1:] != keys[:-1], 1)])
+    stops = np.r_[starts[1:], len(order)]
+
+    blocks = {tuple(key): (start, stop) for key, start, stop in
+              zip(keys[starts].tolist(), starts, stops)}
+
+    # the halo does not exceed the block size, so it only spans the
+    # neighboring blocks
+    for key in keys[starts].tolist():
+
+        indices = np.concatenate([
+            order[slice(*blocks[key[0] + i, key[1] + j])]
+            for i in (-1, 0, 1) for j in (-1, 0, 1)
+            if (key[0] + i, key[1] + j) in blocks
+        ])
+
+        points = centroids[indices]
+        low = np.multiply(key, block_size) - halo
+        high = np.multiply(key, block_size) + block_size + halo
+
+        yield tuple(key), indices[np.all((points >= low) & (points < high), 1)]
+
 
-    return Props(poly_props, tri_props, mst_branches, density_props)
+def _is_owned(points, key, block_size):
+    """Get whether each point lies in the block with the given key."""
+    if key is None:
+        return np.ones(len(points), dtype=bool)
+    return np.all(np.floor(points / block_size) == key, 1)
+
+
+def _delaunay_edges(tris, num_points):
+    """Get the N x 2 array of the distinct edges of a Delaunay
+    triangulation, and whether each point lies on its boundary, i.e. has
+    an unbounded Voronoi cell.
+
+    """
+    edges = np.sort(tris[:, [[0, 1], [1, 2], [2, 0]]].reshape(-1, 2), 1)
+    codes, counts = np.unique(edges[:, 0] * num_points + edges[:, 1],
+                              return_counts=True)
+    edges = np.stack(np.divmod(codes, num_points), 1)
+
+    # boundary edges belong to a single triangle
+    is_boundary = np.zeros(num_points, dtype=bool)
+    is_boundary[edges[counts == 1].ravel()] = True
+
+    return edges, is_boundary
+
+
+def _voronoi_cell_props(points, tris, point_indices, is_boundary):
+    """Compute the area, perimeter and maximum vertex distance of the
+    bounded Voronoi cells of the given points from the Delaunay
+    triangulation, processing all cells with the same number of vertices
+    at once.
+
+    The Voronoi cell of a point is the polygon of the circumcenters of its
+    Delaunay triangles, in order of angle around the point.
+
+    """
+    is_selected = np.zeros(len(points), dtype=bool)
+    is_selected[point_indices] = True
+    is_selected &= ~is_boundary
+
+    owners = tris.ravel()
+    tri_ids = np.repeat(np.arange(len(tris)), 3)
+    keep = is_selected[owners]
+    owners, tri_ids = owners[keep], tri_ids[keep]
+
+    centers = _circumcenters(points[tris])
+    offsets = centers[tri_ids] - points[owners]
+    order = np.lexsort((np.arctan2(offsets[:, 1], offsets[:, 0]), owners))
+    vertices = centers[tri_ids[order]]
+
+    owners = owners[order]
+    starts = np.flatnonzero(np.r_[True, owners[1:] != owners[:-1]]) \
+        if len(owners) else np.zeros(0, dtype=int)
+    lengths = np.diff(np.r_[starts, len(owners)])
+
+    areas = []
+    peris = []
+    max_dists = []
+
+    for n in np.unique(lengths):
+        rows = starts[lengths == n]
+        polygons = vertices[rows[:, None] + np.arange(n)]
+        areas.append(_poly_area(polygons))
+        peris.append(_poly_peri(polygons))
+        max_dists.append(_dist(polygons[:, :, None],
+                               polygons[:, None, :]).max((1, 2)))
+
+    return [np.concatenate(values or [[]])
+            for values in (areas, peris, max_dists)]
+
+
+def _circumcenters(triangles):
+    """Compute the circumcenters of an N x 3 x 2 array of triangles."""
+    b = triangles[:, 1] - triangles[:, 0]
+    c = triangles[:, 2] - triangles[:, 0]
+    b2 = (b ** 2).sum(1)
+    c2 = (c ** 2).sum(1)
+    d = 2 * (b[:, 0] * c[:, 1] - b[:, 1] * c[:, 0])
+    return triangles[:, 0] + np.stack([
+        (c[:, 1] * b2 - b[:, 1] * c2) / d,
+        (b[:, 0] * c2 - c[:, 0] * b2) / d,
+    ], 1)
+
+
+class _PopStatsAccumulator(object):
+    """Accumulator of a population of non-negative values that are added in
+    batches, e.g. one per block, and whose _pop_stats are computed once all
+    of them have been added.
+
+    Values are kept as they are, unless a relative accuracy is given, in
+    which case they are counted in a logarithmic histogram whose bins have
+    that relative width, as in the DDSketch quantile sketch.  Its size then
+    only depends on the range of the values.
+
+    """
+
+    def __init__(self, relative_accuracy=None):
+
+        self.relative_accuracy = relative_accuracy
+        self._values = []
+
+        if relative_accuracy is not None:
+            self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+            self._bins = np.zeros(0, dtype=np.int64)
+            self._counts = np.zeros(0, dtype=np.int64)
+            self._num_zeros = 0
+
+    def add(self, values):
+
+        values = np.ravel(values)
+
+        if self.relative_accuracy is None:
+            self._values.append(values)
+            return
+
+        nonzero = values[values > 0]
+        self._num_zeros += len(values) - len(nonzero)
+
+        bins = np.ceil(np.log(nonzero) / np.log(self._gamma)).astype(np.int64)
+        self._add_bins(*np.unique(bins, return_counts=True))
+
+    def _add_bins(self, bins, counts):
+
+        self._bins, inverse = np.unique(np.r_[self._bins, bins],
+                                        return_inverse=True)
+        self._counts = np.bincount(inverse, np.r_[self._counts, counts],
+                                   len(self._bins)).astype(np.int64)
+
+    def pop_stats(self):
+
+        if self.relative_accuracy is None:
+            return _pop_stats(np.concatenate(self._values or [[]]))
+
+        # the value of each bin within the relative accuracy of its range
+        values = np.r_[0, 2 * self._gamma ** self._bins / (self._gamma + 1)]
+        counts = np.r_[self._num_zeros, self._counts]
+        nonempty = counts > 0
+
+        return _weighted_pop_stats(values[nonempty], counts[nonempty])
 
 
 def _poly_area(vertices):
@@ -182,6 +428,8 @@ def _dist(x, y):
 
 
 def _pop_stats(pop):
+    if not len(pop):
+        return PopStats(np.nan, np.nan, np.nan, np.nan)
     # Filter out outliers (here defined as points more than three
     # standard deviations away from the mean)
     while True:
@@ -196,6 +444,25 @@ def _pop_stats(pop):
     return PopStats(mean, stddev, minmaxr, disorder)
 
 
+def _weighted_pop_stats(values, counts):
+    """Compute _pop_stats of a population given as distinct values and the
+    number of times each occurs.
+
+    """
+    if not len(values):
+        return PopStats(np.nan, np.nan, np.nan, np.nan)
+    while True:
+        mean = np.average(values, weights=counts)
+        stddev = np.average((values - mean) ** 2, weights=counts) ** .5
+        mask = abs(values - mean) <= 3 * stddev
+        if mask.all():
+            break
+        values, counts = values[mask], counts[mask]
+    minmaxr = values.min() / values.max()
+    disorder = stddev / (mean + stddev)
+    return PopStats(mean, stddev, minmaxr, disorder)
+
+
 def _flatten_to_dataframe(nt):
     """Flatten the result of _compute_global_cell_graph_features to the
     DataFrame returned by compute_global_cell_graph_features.
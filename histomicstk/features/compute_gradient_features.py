@@ -1,12 +1,14 @@
 import numpy as np
 import pandas as pd
-import scipy.stats
 from skimage.feature import canny
-from skimage.measure import regionprops
+
+from ._label_stats import get_object_rows, hist_energy_entropy, skew_kurtosis
+from .label_index import LabelIndex
 
 
 def compute_gradient_features(im_label, im_intensity,
-                              num_hist_bins=10, rprops=None):
+                              num_hist_bins=10, rprops=None,
+                              label_index=None):
     """Calculates gradient features from an intensity image.
 
     Parameters
@@ -21,9 +23,13 @@ def compute_gradient_features(im_label, im_intensity,
         Number of bins used to computed the gradient histogram of an object.
         Histogram is used to energy and entropy features. Default is 10.
     rprops : output of skimage.measure.regionprops, optional
-        rprops = skimage.measure.regionprops( im_label ). If rprops is not
-        passed then it will be computed inside which will increase the
-        computation time.
+        rprops = skimage.measure.regionprops( im_label ). Only used to get
+        the labels of the objects and the order of the output rows. Defaults
+        to all objects of `im_label` in increasing label order.
+    label_index : histomicstk.features.LabelIndex, optional
+        label_index = histomicstk.features.LabelIndex( im_label ). If
+        label_index is not passed then it will be computed inside which will
+        increase the computation time.
 
     Returns
     -------
@@ -78,55 +84,47 @@ def compute_gradient_features(im_label, im_intensity,
         'Gradient.Canny.Mean',
     ]
 
-    # compute object properties if not provided
-    if rprops is None:
-        rprops = regionprops(im_label)
+    # group the pixels of each object, unless a shared index is given
+    if label_index is None:
+        label_index = LabelIndex(im_label)
 
-    # create pandas data frame containing the features for each object
-    numFeatures = len(feature_list)
-    numLabels = len(rprops)
-    fdata = pd.DataFrame(np.zeros((numLabels, numFeatures)),
-                         columns=feature_list)
+    # rows of the objects in the order of rprops if provided
+    rows = get_object_rows(label_index, rprops)
+
+    if not len(label_index):
+        return pd.DataFrame(np.zeros((0, len(feature_list))),
+                            columns=feature_list)
 
     Gx, Gy = np.gradient(im_intensity)
     diffG = np.sqrt(Gx**2 + Gy**2)
     cannyG = canny(im_intensity)
 
-    for i in range(numLabels):
-
-        # get gradients of object pixels
-        pixelGradients = np.sort(
-            diffG[rprops[i].coords[:, 0], rprops[i].coords[:, 1]]
-        )
-
-        # compute mean
-        fdata.at[i, 'Gradient.Mag.Mean'] = np.mean(pixelGradients)
+    # get gradients of object pixels sorted within each object
+    pixelGradients = label_index.sorted_values(diffG)
 
-        # compute standard deviation
-        fdata.at[i, 'Gradient.Mag.Std'] = np.std(pixelGradients)
+    features = {}
 
-        # compute skewness
-        fdata.at[i, 'Gradient.Mag.Skewness'] = scipy.stats.skew(pixelGradients)
+    # compute mean, standard deviation, skewness and kurtosis
+    meanGradient, (m2, m3, m4) = label_index.central_moments(pixelGradients)
+    features['Gradient.Mag.Mean'] = meanGradient
+    features['Gradient.Mag.Std'] = np.sqrt(m2)
+    features['Gradient.Mag.Skewness'], features['Gradient.Mag.Kurtosis'] = \
+        skew_kurtosis(m2, m3, m4)
 
-        # compute kurtosis
-        fdata.at[i, 'Gradient.Mag.Kurtosis'] = \
-            scipy.stats.kurtosis(pixelGradients)
+    # compute gradient histogram, its entropy and energy
+    hist = label_index.histogram(pixelGradients, num_hist_bins)
+    features['Gradient.Mag.HistEnergy'], \
+        features['Gradient.Mag.HistEntropy'] = hist_energy_entropy(hist)
 
-        # compute intensity histogram
-        hist, bins = np.histogram(pixelGradients, bins=num_hist_bins)
-        prob = hist/np.sum(hist, dtype=np.float32)
+    # compute the number and fraction of canny edge pixels
+    canny_sum = label_index.sum(label_index.values(cannyG).astype('float'))
+    features['Gradient.Canny.Sum'] = canny_sum
+    features['Gradient.Canny.Mean'] = canny_sum / label_index.counts
 
-        # compute entropy
-        fdata.at[i, 'Gradient.Mag.HistEntropy'] = scipy.stats.entropy(prob)
-
-        # compute energy
-        fdata.at[i, 'Gradient.Mag.HistEnergy'] = np.sum(prob**2)
-
-        bw_canny = cannyG[rprops[i].coords[:, 0], rprops[i].coords[:, 1]]
-        canny_sum = np.sum(bw_canny).astype('float')
-
-        fdata.at[i, 'Gradient.Canny.Sum'] = canny_sum
-
-        fdata.at[i, 'Gradient.Canny.Mean'] = canny_sum / len(pixelGradients)
+    # create pandas data frame containing the features for each object
+    fdata = pd.DataFrame({
+        feature: np.asarray(features[feature], dtype=float)[rows]
+        for feature in feature_list
+    }, columns=feature_list)
 
     return fdata
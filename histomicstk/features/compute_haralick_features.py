@@ -1,15 +1,16 @@
 import numpy as np
 import pandas as pd
-from skimage.measure import regionprops
-from .graycomatrixext import graycomatrixext
+import scipy.ndimage
 from .graycomatrixext import _default_num_levels
 from .graycomatrixext import _default_offsets
 
-from ._compute_marginal_glcm_probs_cython import _compute_marginal_glcm_probs_cython
+from ._compute_glcms_cython import _compute_glcms_cython
+from ._label_stats import get_object_rows
 
 
 def compute_haralick_features(im_label, im_intensity, offsets=None,
-                              num_levels=None, gray_limits=None, rprops=None):
+                              num_levels=None, gray_limits=None, rprops=None,
+                              label_index=None):
     r"""
     Calculates 26 Haralick texture features for each object in the given label
     mask.
@@ -52,6 +53,16 @@ def compute_haralick_features(im_label, im_intensity, offsets=None,
         Default: [0, 1] for boolean-valued image, [0, 255] for integer-valued
         image, and [0.0, 1.0] for-real valued image
 
+    rprops : output of skimage.measure.regionprops, optional
+        rprops = skimage.measure.regionprops( im_label ). Only used to get
+        the bounding boxes of the objects and the order of the output rows.
+        Defaults to all objects of `im_label` in increasing label order.
+
+    label_index : histomicstk.features.LabelIndex, optional
+        label_index = histomicstk.features.LabelIndex( im_label ). If passed,
+        the bounding boxes of the objects are taken from it instead of rprops
+        or `scipy.ndimage.find_objects`.
+
     Returns
     -------
     fdata: pandas.DataFrame
@@ -60,7 +71,10 @@ def compute_haralick_features(im_label, im_intensity, offsets=None,
     Notes
     -----
     This function computes the following list of haralick features derived
-    from normalized GLCMs (P) of the given list of neighborhood offsets:
+    from normalized GLCMs (P) of the given list of neighborhood offsets.
+    The GLCMs of all objects and offsets are built in a single pass over the
+    quantized image, and the features are computed as reductions over the
+    stacked GLCMs:
 
     Haralick.ASM.Mean, Haralick.ASM.Range : float
         Mean and range of the angular second moment (ASM) feature for GLCMs
@@ -246,6 +260,9 @@ def compute_haralick_features(im_label, im_intensity, offsets=None,
 
     num_dims = len(im_intensity.shape)
 
+    if num_dims != 2:
+        raise ValueError('Only 2D images are supported')
+
     # offsets
     if offsets is None:
 
@@ -260,115 +277,183 @@ def compute_haralick_features(im_label, im_intensity, offsets=None,
                 'Dimension mismatch between input image and offsets'
             )
 
-    num_offsets = offsets.shape[0]
+    if gray_limits is None:
+        # intensities are cast to uint8 before quantization
+        gray_limits = [0, 255]
+
+    # get bounding boxes of objects, in the order of rprops if provided
+    bboxes = _get_bboxes(im_label, rprops, label_index)
+
+    numLabels = len(bboxes)
+
+    if numLabels == 0:
+        return pd.DataFrame(np.zeros((0, len(agg_feature_list))),
+                            columns=agg_feature_list)
+
+    # extend each box by one pixel along each dimension as the box of the
+    # intensities of an object always has been
+    bboxes[:, num_dims:] = np.minimum(bboxes[:, num_dims:] + 1,
+                                      im_intensity.shape)
+
+    # get co-occurrence counts of all objects and offsets at once
+    im_levels = _quantize(im_intensity, num_levels, gray_limits)
 
-    # compute object properties if not provided
-    if rprops is None:
-        rprops = regionprops(im_label)
+    if im_levels.min() < 0 or im_levels.max() >= num_levels:
+        raise ValueError('Intensities must be within gray_limits')
+
+    glcms = _compute_glcms_cython(
+        np.ascontiguousarray(im_levels, dtype=np.int_),
+        np.ascontiguousarray(bboxes, dtype=np.int_),
+        np.ascontiguousarray(offsets, dtype=np.int_),
+        num_levels)
+
+    # symmetrize and normalize
+    glcms += glcms.transpose(0, 2, 1, 3)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        glcms /= glcms.sum(axis=(1, 2), keepdims=True)
+
+    # compute haralick features of each object and offset
+    fmat = _compute_haralick_statistics(glcms, num_levels)
 
-    # create pandas data frame containing the features for each object
-    numLabels = len(rprops)
     fdata = pd.DataFrame(np.zeros((numLabels, len(agg_feature_list))),
                          columns=agg_feature_list)
 
+    fdata.values[:, ::2] = np.mean(fmat, axis=2)
+    fdata.values[:, 1::2] = np.ptp(fmat, axis=2)
+
+    return fdata
+
+
+def _get_bboxes(im_label, rprops=None, label_index=None):
+    """Get an (n, 2 * num_dims) array of the bounding boxes of objects."""
+
+    if label_index is not None:
+        return np.array(label_index.bboxes[get_object_rows(label_index,
+                                                           rprops)])
+
+    if rprops is not None:
+        return np.array([r.bbox for r in rprops],
+                        dtype=np.int_).reshape(len(rprops), -1)
+
+    bboxes = [
+        [sl.start for sl in obj_slices] + [sl.stop for sl in obj_slices]
+        for obj_slices in scipy.ndimage.find_objects(im_label)
+        if obj_slices is not None
+    ]
+
+    return np.array(bboxes, dtype=np.int_).reshape(len(bboxes),
+                                                   2 * im_label.ndim)
+
+
+def _quantize(im_intensity, num_levels, gray_limits):
+    """Quantize intensities to gray levels as graycomatrixext does for an
+    image cast to uint8."""
+
+    im_levels = im_intensity.astype(np.uint8).astype('float')
+    im_levels -= gray_limits[0]
+    im_levels /= float(gray_limits[1] - gray_limits[0])
+    im_levels *= (num_levels - 1)
+
+    return np.round(im_levels).astype('int')
+
+
+def _compute_haralick_statistics(glcms, num_levels):
+    """Compute the 13 haralick features of a (num_objects, num_levels,
+    num_levels, num_offsets) array of normalized GLCMs.
+
+    Returns a (num_objects, 13, num_offsets) array.
+
+    """
+    num_objects, num_offsets = glcms.shape[0], glcms.shape[3]
+
+    # reduce over contiguous (num_levels, num_levels) blocks
+    P = np.ascontiguousarray(glcms.transpose(0, 3, 1, 2)).reshape(
+        -1, num_levels, num_levels)
+    P_flat = P.reshape(len(P), -1)
+
     n_Minus = np.arange(num_levels)
     n_Plus = np.arange(2 * num_levels - 1)
 
     x, y = np.mgrid[0:num_levels, 0:num_levels]
-    xy = x * y
-    xy_IDM = 1. / (1 + np.square(x - y))
+    xy = np.ravel(x * y)
+    xy_IDM = np.ravel(1. / (1 + np.square(x - y)))
 
     e = 0.00001  # small positive constant to avoid log 0
 
-    for i in range(numLabels):
+    def _entropy(p):
+        return -np.sum(p * np.log2(p + e), axis=-1)
 
-        # get bounds of an intensity image
-        minr, minc, maxr, maxc = rprops[i].bbox
+    # get marginal-probabilities
+    px = P.sum(axis=2)
+    py = P.sum(axis=1)
+    pxPlusy = np.dot(P_flat, _diagonal_sum_matrix(x + y))
+    pxMinusy = np.dot(P_flat, _diagonal_sum_matrix(np.abs(x - y)))
 
-        # grab nucleus mask
-        subImage = im_intensity[minr:maxr+1, minc:maxc+1].astype(np.uint8)
+    fmat = np.zeros((len(P), 13))
 
-        # gets GLCM or gray-tone spatial dependence matrix
-        arrayGLCM = graycomatrixext(subImage, offsets=offsets,
-                                    num_levels=num_levels,
-                                    gray_limits=gray_limits,
-                                    symmetric=True, normed=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
 
-        # Compute haralick features for each offset
-        ldata = pd.DataFrame(np.zeros((num_offsets, len(feature_list))),
-                             columns=feature_list)
+        # computes angular second moment
+        fmat[:, 0] = np.sum(np.square(P_flat), axis=1)
 
-        for r in range(num_offsets):
+        # computes contrast
+        fmat[:, 1] = np.dot(pxMinusy, np.square(n_Minus))
 
-            nGLCM = arrayGLCM[:, :, r]
+        # computes correlation
+        # gets weighted mean and standard deviation of px and py
+        meanx = np.dot(px, n_Minus)
+        variance = np.dot(px, np.square(n_Minus)) - np.square(meanx)
+        fmat[:, 2] = (np.dot(P_flat, xy) - np.square(meanx)) / variance
 
-            # get marginal-probabilities
-            px, py, pxPlusy, pxMinusy = _compute_marginal_glcm_probs_cython(
-                nGLCM)
+        # computes sum of squares : variance
+        fmat[:, 3] = variance
 
-            # computes angular second moment
-            ldata.at[r, 'Haralick.ASM'] = np.sum(np.square(nGLCM))
+        # computes inverse difference moment
+        fmat[:, 4] = np.dot(P_flat, xy_IDM)
 
-            # computes contrast
-            ldata.at[r, 'Haralick.Contrast'] = \
-                np.dot(np.square(n_Minus), pxMinusy)
+        # computes sum average
+        fmat[:, 5] = np.dot(pxPlusy, n_Plus)
 
-            # computes correlation
-            # gets weighted mean and standard deviation of px and py
-            meanx = np.dot(n_Minus, px)
-            variance = np.dot(px, np.square(n_Minus)) - np.square(meanx)
-            nGLCMr = np.ravel(nGLCM)
-            ldata.at[r, 'Haralick.Correlation'] = \
-                (np.dot(np.ravel(xy), nGLCMr) - np.square(meanx)) / variance
+        # computes sum variance
+        # [1] uses sum entropy, but we use sum average
+        fmat[:, 6] = np.dot(pxPlusy, np.square(n_Plus)) - \
+            np.square(fmat[:, 5])
 
-            # computes sum of squares : variance
-            ldata.at[r, 'Haralick.SumOfSquares'] = variance
+        # computes sum entropy
+        fmat[:, 7] = _entropy(pxPlusy)
 
-            # computes inverse difference moment
-            ldata.at[r, 'Haralick.IDM'] = \
-                np.dot(np.ravel(xy_IDM), nGLCMr)
+        # computes entropy
+        fmat[:, 8] = _entropy(P_flat)
 
-            # computes sum average
-            ldata.at[r, 'Haralick.SumAverage'] = \
-                np.dot(n_Plus, pxPlusy)
+        # computes variance px-y
+        fmat[:, 9] = np.var(pxMinusy, axis=1)
 
-            # computes sum variance
-            # [1] uses sum entropy, but we use sum average
-            ldata.at[r, 'Haralick.SumVariance'] = \
-                np.dot(np.square(n_Plus), pxPlusy) - \
-                np.square(ldata.at[r, 'Haralick.SumAverage'])
+        # computes difference entropy px-y
+        fmat[:, 10] = _entropy(pxMinusy)
 
-            # computes sum entropy
-            ldata.at[r, 'Haralick.SumEntropy'] = \
-                -np.dot(pxPlusy, np.log2(pxPlusy+e))
+        # computes information measures of correlation
+        # gets entropies of px and py
+        HX = _entropy(px)
+        HY = _entropy(py)
+        HXY = fmat[:, 8]
+        pxy_ijr = (px[:, :, None] * py[:, None, :]).reshape(len(P), -1)
+        HXY1 = -np.sum(P_flat * np.log2(pxy_ijr + e), axis=1)
+        HXY2 = _entropy(pxy_ijr)
+        fmat[:, 11] = (HXY - HXY1) / np.maximum(HX, HY)
 
-            # computes entropy
-            ldata.at[r, 'Haralick.Entropy'] = \
-                -np.dot(nGLCMr, np.log2(nGLCMr+e))
+        # computes information measures of correlation
+        fmat[:, 12] = np.sqrt(1 - np.exp(-2.0 * (HXY2 - HXY)))
 
-            # computes variance px-y
-            ldata.at[r, 'Haralick.DifferenceVariance'] = np.var(pxMinusy)
+    return fmat.reshape(num_objects, num_offsets, 13).transpose(0, 2, 1)
 
-            # computes difference entropy px-y
-            ldata.at[r, 'Haralick.DifferenceEntropy'] = \
-                -np.dot(pxMinusy, np.log2(pxMinusy+e))
 
-            # computes information measures of correlation
-            # gets entropies of px and py
-            HX = -np.dot(px, np.log2(px+e))
-            HY = -np.dot(py, np.log2(py+e))
-            HXY = ldata.at[r, 'Haralick.Entropy']
-            pxy_ij = np.outer(px, py)
-            pxy_ijr = np.ravel(pxy_ij)
-            HXY1 = -np.dot(nGLCMr, np.log2(pxy_ijr+e))
-            HXY2 = -np.dot(pxy_ijr, np.log2(pxy_ijr+e))
-            ldata.at[r, 'Haralick.IMC1'] = (HXY-HXY1)/max(HX, HY)
+def _diagonal_sum_matrix(key):
+    """Get the (num_levels**2, key.max() + 1) matrix that sums the elements
+    of a flattened num_levels x num_levels matrix by the value of key."""
 
-            # computes information measures of correlation
-            ldata.at[r, 'Haralick.IMC2'] = \
-                np.sqrt(1 - np.exp(-2.0*(HXY2-HXY)))
+    key = np.ravel(key)
 
-        fdata.values[i, ::2] = np.mean(ldata.values, axis=0)
-        fdata.values[i, 1::2] = np.ptp(ldata.values, axis=0)
+    S = np.zeros((len(key), key.max() + 1))
+    S[np.arange(len(key)), key] = 1
 
-    return fdata
+    return S
@@ -1,13 +1,14 @@
 """Compute intensity features in labeled image."""
 import numpy as np
 import pandas as pd
-import scipy.stats
-from skimage.measure import regionprops
+
+from ._label_stats import get_object_rows, hist_energy_entropy, skew_kurtosis
+from .label_index import LabelIndex
 
 
 def compute_intensity_features(
         im_label, im_intensity, num_hist_bins=10,
-        rprops=None, feature_list=None):
+        rprops=None, feature_list=None, label_index=None):
     """Calculate intensity features from an intensity image.
 
     Parameters
@@ -25,14 +26,19 @@ def compute_intensity_features(
         Histogram is used to energy and entropy features. Default is 10.
 
     rprops : output of skimage.measure.regionprops, optional
-        rprops = skimage.measure.regionprops( im_label ). If rprops is not
-        passed then it will be computed inside which will increase the
-        computation time.
+        rprops = skimage.measure.regionprops( im_label ). Only used to get
+        the labels of the objects and the order of the output rows. Defaults
+        to all objects of `im_label` in increasing label order.
 
     feature_list : list, default is None
         list of intensity features to return.
         If none, all intensity features are returned.
 
+    label_index : histomicstk.features.LabelIndex, optional
+        label_index = histomicstk.features.LabelIndex( im_label ). If
+        label_index is not passed then it will be computed inside which will
+        increase the computation time.
+
     Returns
     -------
     fdata: pandas.DataFrame
@@ -109,85 +115,65 @@ def compute_intensity_features(
         assert all(j in default_feature_list for j in feature_list), \
             "Some feature names are not recognized."
 
-    # compute object properties if not provided
-    if rprops is None:
-        rprops = regionprops(im_label)
-
-    # create pandas data frame containing the features for each object
-    numFeatures = len(feature_list)
-    numLabels = len(rprops)
-    fdata = pd.DataFrame(np.zeros((numLabels, numFeatures)),
-                         columns=feature_list)
-
-    # conditionally execute calculations if x in the features list
-    def _conditional_execution(feature, func, *args, **kwargs):
-        if feature in feature_list:
-            fdata.at[i, feature] = func(*args, **kwargs)
+    # group the pixels of each object, unless a shared index is given
+    if label_index is None:
+        label_index = LabelIndex(im_label)
 
-    def _return_input(x):
-        return x
+    # rows of the objects in the order of rprops if provided
+    rows = get_object_rows(label_index, rprops)
 
-    for i in range(numLabels):
+    # get intensities of object pixels sorted within each object
+    pixelIntensities = label_index.sorted_values(im_intensity)
 
-        # get intensities of object pixels
-        pixelIntensities = np.sort(
-            im_intensity[rprops[i].coords[:, 0], rprops[i].coords[:, 1]]
-        )
+    if not len(label_index):
+        return pd.DataFrame(np.zeros((0, len(feature_list))),
+                            columns=feature_list)
 
-        # compute min
-        _conditional_execution('Intensity.Min', np.min, pixelIntensities)
+    features = {}
 
-        # compute max
-        _conditional_execution('Intensity.Max', np.max, pixelIntensities)
+    # compute min and max
+    features['Intensity.Min'] = pixelIntensities[label_index.starts]
+    features['Intensity.Max'] = pixelIntensities[
+        label_index.starts + label_index.counts - 1]
 
-        # compute mean
-        meanIntensity = np.mean(pixelIntensities)
-        _conditional_execution('Intensity.Mean', _return_input, meanIntensity)
+    # compute mean, standard deviation, skewness and kurtosis
+    meanIntensity, (m2, m3, m4) = label_index.central_moments(pixelIntensities)
+    features['Intensity.Mean'] = meanIntensity
+    features['Intensity.Std'] = np.sqrt(m2)
+    features['Intensity.Skewness'], features['Intensity.Kurtosis'] = \
+        skew_kurtosis(m2, m3, m4)
 
-        # compute median
-        medianIntensity = np.median(pixelIntensities)
-        _conditional_execution(
-            'Intensity.Median', _return_input, medianIntensity)
+    # compute median and mean median difference
+    medianIntensity = label_index.median(pixelIntensities)
+    features['Intensity.Median'] = medianIntensity
+    features['Intensity.MeanMedianDiff'] = meanIntensity - medianIntensity
 
-        # compute mean median differnece
-        _conditional_execution(
-            'Intensity.MeanMedianDiff', _return_input,
-            meanIntensity - medianIntensity)
+    # compute inter-quartile range
+    if 'Intensity.IQR' in feature_list:
+        features['Intensity.IQR'] = (
+            label_index.quantile(pixelIntensities, 0.75) -
+            label_index.quantile(pixelIntensities, 0.25))
 
-        # compute standard deviation
-        _conditional_execution('Intensity.Std', np.std, pixelIntensities)
+    # compute median absolute deviation
+    if 'Intensity.MAD' in feature_list:
+        features['Intensity.MAD'] = label_index.median(label_index.sort(np.abs(
+            pixelIntensities - medianIntensity[label_index.segment_ids])))
 
-        # compute inter-quartile range
-        _conditional_execution(
-            'Intensity.IQR', scipy.stats.iqr, pixelIntensities)
+    # histogram-based features
+    if any(j in feature_list for j in [
+            'Intensity.HistEntropy', 'Intensity.HistEnergy']):
 
-        # compute median absolute deviation
-        _conditional_execution(
-            'Intensity.MAD', np.median,
-            np.abs(pixelIntensities - medianIntensity))
+        # compute intensity histogram
+        hist = label_index.histogram(pixelIntensities, num_hist_bins)
 
-        # compute skewness
-        _conditional_execution(
-            'Intensity.Skewness', scipy.stats.skew, pixelIntensities)
+        # compute energy and entropy
+        features['Intensity.HistEnergy'], features['Intensity.HistEntropy'] = \
+            hist_energy_entropy(hist)
 
-        # compute kurtosis
-        _conditional_execution(
-            'Intensity.Kurtosis', scipy.stats.kurtosis, pixelIntensities)
-
-        # histogram-based features
-        if any(j in feature_list for j in [
-                'Intensity.HistEntropy', 'Intensity.HistEnergy']):
-
-            # compute intensity histogram
-            hist, bins = np.histogram(pixelIntensities, bins=num_hist_bins)
-            prob = hist/np.sum(hist, dtype=np.float32)
-
-            # compute entropy
-            _conditional_execution(
-                'Intensity.HistEntropy', scipy.stats.entropy, prob)
-
-            # compute energy
-            _conditional_execution(
-                'Intensity.HistEnergy', np.sum, prob**2)
+    # create pandas data frame containing the features for each object
+    fdata = pd.DataFrame({
+        feature: np.asarray(features[feature], dtype=float)[rows]
+        for feature in feature_list
+    }, columns=feature_list)
 
     return fdata
@@ -2,8 +2,12 @@ import numpy as np
 import pandas as pd
 from skimage.measure import regionprops
 
+from ._label_stats import get_object_rows
+from .label_index import LabelIndex
 
-def compute_morphometry_features(im_label, rprops=None):
+
+def compute_morphometry_features(im_label, rprops=None, contours=None,
+                                 label_index=None):
     """
     Calculates morphometry features for each object
 
@@ -15,9 +19,27 @@ def compute_morphometry_features(im_label, rprops=None):
         objects.
 
     rprops : output of skimage.measure.regionprops, optional
-        rprops = skimage.measure.regionprops( im_label ). If rprops is not
-        passed then it will be computed inside which will increase the
-        computation time.
+        rprops = skimage.measure.regionprops( im_label ). Used to get the
+        order of the output rows and, unless contours is passed, the
+        perimeter and solidity of the objects. If rprops is not passed then
+        it will be computed inside which will increase the computation time.
+
+    contours : output of histomicstk.features.trace_label_contours, optional
+        contours = trace_label_contours( im_label ). If passed, the solidity
+        of all objects is computed at once from the convex hull of these
+        boundary pixels, and the perimeter of all objects at once from the
+        label image, instead of from the attributes of each region of rprops,
+        which is much faster. The perimeter and circularity are then the same
+        as with regionprops. The convex hull passes through the outer corners
+        of the boundary pixels, whereas regionprops counts the pixels whose
+        centers are in the hull, so Shape.Solidity is lower than with
+        regionprops. The difference grows as objects get smaller and can be
+        large for objects of a few pixels.
+
+    label_index : histomicstk.features.LabelIndex, optional
+        label_index = histomicstk.features.LabelIndex( im_label ). If
+        label_index is not passed then it will be computed inside which will
+        increase the computation time.
 
     Returns
     -------
@@ -84,53 +106,151 @@ def compute_morphometry_features(im_label, rprops=None):
         'Shape.Solidity',
     ]
 
-    # compute object properties if not provided
-    if rprops is None:
-        rprops = regionprops(im_label)
+    # group the pixels of each object, unless a shared index is given
+    if label_index is None:
+        label_index = LabelIndex(im_label)
+
+    # rows of the objects in the order of rprops if provided
+    rows = get_object_rows(label_index, rprops)
+
+    area = label_index.counts.astype(float)
+
+    # get the boundary features in increasing label order
+    if contours is not None:
+
+        perimeter = _perimeter(im_label, label_index)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            solidity = area / contours.convex_hull_area()
+
+    else:
+
+        # compute object properties if not provided
+        if rprops is None:
+            rprops = regionprops(im_label)
+
+        perimeter = np.zeros(len(label_index))
+        solidity = np.zeros(len(label_index))
+
+        perimeter[rows] = [prop.perimeter for prop in rprops]
+        solidity[rows] = [prop.solidity for prop in rprops]
+
+    fdata = _compute_morphometry(label_index, perimeter, solidity)
+
+    return pd.DataFrame(fdata[rows], columns=feature_list)
+
+
+def _perimeter(im_label, label_index):
+    """Compute the perimeter of all objects at once as regionprops does.
+
+    The border pixels of each object, which have a 4-neighbor outside of it,
+    are weighted by the configuration of the border pixels of the same object
+    in their 8-neighborhood. Returns the perimeters in increasing label
+    order.
+
+    """
+    if not len(label_index):
+        return np.zeros(0)
+
+    im_label = np.pad(np.asarray(im_label), 1, mode='constant')
+
+    rows, cols = label_index.coords
+    rows = rows + 1
+    cols = cols + 1
+
+    labels = label_index.labels[label_index.segment_ids]
+
+    # border pixels
+    is_border = np.zeros(len(rows), dtype=bool)
+
+    for dr, dc in ((-1, 0), (1, 0), (0, -1), (0, 1)):
+        is_border |= im_label[rows + dr, cols + dc] != labels
+
+    im_border = np.zeros(im_label.shape, dtype=bool)
+    im_border[rows[is_border], cols[is_border]] = True
+
+    rows = rows[is_border]
+    cols = cols[is_border]
+    labels = labels[is_border]
+
+    # code of the neighborhood of each border pixel, as the convolution with
+    # [[10, 2, 10], [2, 1, 2], [10, 2, 10]] of skimage.measure.perimeter
+    codes = np.ones(len(rows), dtype=np.int_)
+
+    for dr in (-1, 0, 1):
+        for dc in (-1, 0, 1):
+            if dr or dc:
+                weight = 2 if dr == 0 or dc == 0 else 10
+                codes += weight * (im_border[rows + dr, cols + dc] &
+                                   (im_label[rows + dr, cols + dc] == labels))
+
+    code_lengths = np.zeros(50)
+    code_lengths[[5, 7, 15, 17, 25, 27]] = 1
+    code_lengths[[21, 33]] = np.sqrt(2)
+    code_lengths[[13, 23]] = (1 + np.sqrt(2)) / 2
+
+    return np.bincount(label_index.segment_ids[is_border],
+                       weights=code_lengths[codes],
+                       minlength=len(label_index))
+
+
+def _compute_morphometry(label_index, perimeter, solidity):
+    """Compute the morphometry features of all objects at once from their
+    pixels, perimeter and solidity.
+
+    Returns a (num_objects, 10) array whose columns follow the feature list
+    of `compute_morphometry_features`.
+
+    """
+    area = label_index.counts.astype(float)
+
+    if not len(area):
+        return np.zeros((0, 10))
 
-    # create pandas data frame containing the features for each object
-    numFeatures = len(feature_list)
-    numLabels = len(rprops)
-    fdata = pd.DataFrame(np.zeros((numLabels, numFeatures)),
-                         columns=feature_list)
+    # pixel coordinates of each object
+    rows, cols = label_index.coords
 
-    for i in range(numLabels):
+    # second central moments, i.e. the inertia tensor of each object
+    mean_row = label_index.mean(rows)
+    mean_col = label_index.mean(cols)
 
-        # compute Area
-        fdata.at[i, 'Size.Area'] = rprops[i].area
+    drow = rows - mean_row[label_index.segment_ids]
+    dcol = cols - mean_col[label_index.segment_ids]
 
-        # compute MajorAxisLength and MinorAxisLength
-        fdata.at[i, 'Size.MajorAxisLength'] = rprops[i].major_axis_length
-        fdata.at[i, 'Size.MinorAxisLength'] = rprops[i].minor_axis_length
+    mu_rr = label_index.sum(drow * drow) / area
+    mu_cc = label_index.sum(dcol * dcol) / area
+    mu_rc = label_index.sum(drow * dcol) / area
 
-        # compute Perimeter
-        fdata.at[i, 'Size.Perimeter'] = rprops[i].perimeter
+    # eigenvalues of the inertia tensor
+    half_trace = (mu_rr + mu_cc) / 2
+    delta = np.sqrt(((mu_rr - mu_cc) / 2) ** 2 + mu_rc ** 2)
 
-        # compute Circularity
-        numerator = 4 * np.pi * rprops[i].area
-        denominator = rprops[i].perimeter**2
-        if denominator:
-            fdata.at[i, 'Shape.Circularity'] = numerator / denominator
-        else:
-            fdata.at[i, 'Shape.Circularity'] = 0  # should this be NaN?
+    l1 = np.maximum(half_trace + delta, 0)
+    l2 = np.maximum(half_trace - delta, 0)
 
-        # compute Eccentricity
-        fdata.at[i, 'Shape.Eccentricity'] = rprops[i].eccentricity
+    major_axis_length = 4 * np.sqrt(l1)
+    minor_axis_length = 4 * np.sqrt(l2)
 
-        # compute EquivalentDiameter
-        fdata.at[i, 'Shape.EquivalentDiameter'] = rprops[i].equivalent_diameter
+    # bounding box extent
+    bboxes = label_index.bboxes
+    bbox_area = ((bboxes[:, 2] - bboxes[:, 0]) *
+                 (bboxes[:, 3] - bboxes[:, 1]))
 
-        # compute Extent
-        fdata.at[i, 'Shape.Extent'] = rprops[i].extent
+    fdata = np.zeros((len(area), 10))
 
-        # compute Minor to Major axis ratio
-        if rprops[i].major_axis_length > 0:
-            fdata.at[i, 'Shape.MinorMajorAxisRatio'] = \
-                rprops[i].minor_axis_length / rprops[i].major_axis_length
-        else:
-            fdata.at[i, 'Shape.MinorMajorAxisRatio'] = 1
+    with np.errstate(divide='ignore', invalid='ignore'):
 
-        # compute Solidity
-        fdata.at[i, 'Shape.Solidity'] = rprops[i].solidity
+        fdata[:, 0] = area
+        fdata[:, 1] = major_axis_length
+        fdata[:, 2] = minor_axis_length
+        fdata[:, 3] = perimeter
+        fdata[:, 4] = np.where(perimeter > 0,
+                               4 * np.pi * area / perimeter ** 2, 0)
+        fdata[:, 5] = np.where(l1 > 0, np.sqrt(1 - l2 / l1), 0)
+        fdata[:, 6] = np.sqrt(4 * area / np.pi)
+        fdata[:, 7] = area / bbox_area
+        fdata[:, 8] = np.where(major_axis_length > 0,
+                               minor_axis_length / major_axis_length, 1)
+        fdata[:, 9] = solidity
 
     return fdata
@@ -1,11 +1,14 @@
+from concurrent.futures import ThreadPoolExecutor
+
 import pandas as pd
-from skimage.measure import regionprops
 
 from .compute_fsd_features import compute_fsd_features
 from .compute_gradient_features import compute_gradient_features
 from .compute_haralick_features import compute_haralick_features
 from .compute_intensity_features import compute_intensity_features
 from .compute_morphometry_features import compute_morphometry_features
+from .label_index import LabelIndex
+from .trace_label_contours import trace_label_contours
 
 from histomicstk.segmentation import label as htk_label
 
@@ -17,7 +20,10 @@ def compute_nuclei_features(im_label, im_nuclei, im_cytoplasm=None,
                             fsd_features_flag=True,
                             intensity_features_flag=True,
                             gradient_features_flag=True,
-                            haralick_features_flag=True
+                            haralick_features_flag=True,
+                            use_contours=False,
+                            feature_list=None,
+                            num_threads=1
                             ):
     """
     Calculates features for nuclei classification
@@ -79,6 +85,33 @@ def compute_nuclei_features(im_label, im_nuclei, im_cytoplasm=None,
         haralick features from intensity and cytoplasm channels.
         See `histomicstk.features.compute_haralick_features` for more details.
 
+    use_contours : bool, optional
+        If True, the boundaries of all nuclei are traced once with
+        `histomicstk.features.trace_label_contours` and the morphometry and
+        FSD features of all nuclei are computed at once from them, which is
+        much faster. Size.Perimeter and Shape.Circularity are the same as by
+        default. Shape.Solidity uses the convex hull of the corners of the
+        boundary pixels, so it is lower than by default, the more so the
+        smaller the nucleus. The FSDs are computed from the traced boundary
+        in order around the nucleus rather than from its pixels in raster
+        order, and can differ substantially from the default ones. Nuclei one
+        pixel wide, whose default FSDs are NaN, get the finite FSDs of their
+        traced boundary. Default value = False.
+
+    feature_list : list of str, optional
+        Names of the features to compute, e.g. ``['Size.Area',
+        'Nucleus.Intensity.Mean']``. A name may also be a prefix of feature
+        names ending at a dot, e.g. ``'Size'`` or ``'Nucleus.Haralick'``,
+        to request all of them. Only the feature families (and the cytoplasm
+        mask, contours, etc. they depend on) needed for the requested
+        features are computed. All features of the enabled families are
+        computed if None. Default value = None.
+
+    num_threads : int, optional
+        Number of threads used to compute independent feature families
+        concurrently. Most of their work is done in NumPy, SciPy and Cython
+        kernels that release the GIL. Default value = 1.
+
     Returns
     -------
     fdata : pandas.DataFrame
@@ -122,102 +155,182 @@ def compute_nuclei_features(im_label, im_nuclei, im_cytoplasm=None,
 
     """
 
-    feature_list = []
-
-    # get the number of objects in im_label
-    nuclei_props = regionprops(im_label)
+    # get the feature families to compute
+    families = [
+        family for family, flag in [
+            ('morphometry', morphometry_features_flag),
+            ('fsd', fsd_features_flag),
+            ('nucleus_intensity', intensity_features_flag),
+            ('cytoplasm_intensity', intensity_features_flag),
+            ('nucleus_gradient', gradient_features_flag),
+            ('cytoplasm_gradient', gradient_features_flag),
+            ('nucleus_haralick', haralick_features_flag),
+            ('cytoplasm_haralick', haralick_features_flag),
+        ]
+        if flag and (im_cytoplasm is not None or
+                     not family.startswith('cytoplasm'))
+    ]
+
+    if feature_list is not None:
+
+        for name in feature_list:
+            if not any(_family_matches(family, name) for family in families):
+                raise ValueError(
+                    'Feature %r is unknown or not enabled' % name)
+
+        families = [
+            family for family in families
+            if any(_family_matches(family, name) for name in feature_list)
+        ]
+
+    # index the pixels of the nuclei once for all feature families
+    label_index = {'nucleus': LabelIndex(im_label)}
 
     # compute cytoplasm mask
-    if im_cytoplasm is not None:
+    if any(family.startswith('cytoplasm') for family in families):
 
         cyto_mask = htk_label.dilate_xor(im_label, neigh_width=cyto_width)
 
-        cytoplasm_props = regionprops(cyto_mask)
+        label_index['cytoplasm'] = LabelIndex(cyto_mask)
 
-    # compute morphometry features
-    if morphometry_features_flag:
+    # trace the boundaries of all nuclei once
+    if use_contours and ('morphometry' in families or 'fsd' in families):
 
-        fmorph = compute_morphometry_features(im_label, rprops=nuclei_props)
+        nuclei_contours = trace_label_contours(im_label)
 
-        feature_list.append(fmorph)
+    else:
 
-    # compute FSD features
-    if fsd_features_flag:
+        nuclei_contours = None
 
-        ffsd = compute_fsd_features(im_label, fsd_bnd_pts, fsd_freq_bins,
-                                    cyto_width, rprops=nuclei_props)
+    def compute_family(family):
 
-        feature_list.append(ffsd)
+        if family == 'morphometry':
 
-    # compute nuclei intensity features
-    if intensity_features_flag:
+            # compute morphometry features
+            return compute_morphometry_features(
+                im_label, contours=nuclei_contours,
+                label_index=label_index['nucleus'])
 
-        fint_nuclei = compute_intensity_features(im_label, im_nuclei,
-                                                 rprops=nuclei_props)
-        fint_nuclei.columns = ['Nucleus.' + col
-                               for col in fint_nuclei.columns]
+        if family == 'fsd':
 
-        feature_list.append(fint_nuclei)
+            # compute FSD features
+            return compute_fsd_features(
+                im_label, fsd_bnd_pts, fsd_freq_bins, cyto_width,
+                contours=nuclei_contours, label_index=label_index['nucleus'])
 
-    # compute cytoplasm intensity features
-    if intensity_features_flag and im_cytoplasm is not None:
+        channel, kind = family.split('_')
 
-        fint_cytoplasm = compute_intensity_features(cyto_mask, im_cytoplasm,
-                                                    rprops=cytoplasm_props)
-        fint_cytoplasm.columns = ['Cytoplasm.' + col
-                                  for col in fint_cytoplasm.columns]
+        if channel == 'nucleus':
+            im_mask, im_intensity, prefix = im_label, im_nuclei, 'Nucleus.'
+        else:
+            im_mask, im_intensity, prefix = \
+                cyto_mask, im_cytoplasm, 'Cytoplasm.'
 
-        feature_list.append(fint_cytoplasm)
+        if kind == 'intensity':
 
-    # compute nuclei gradient features
-    if gradient_features_flag:
+            # compute intensity features, only those requested if possible
+            fdata = compute_intensity_features(
+                im_mask, im_intensity,
+                feature_list=_get_intensity_feature_list(
+                    prefix, feature_list),
+                label_index=label_index[channel])
 
-        fgrad_nuclei = compute_gradient_features(im_label, im_nuclei,
-                                                 rprops=nuclei_props)
-        fgrad_nuclei.columns = ['Nucleus.' + col
-                                for col in fgrad_nuclei.columns]
+        elif kind == 'gradient':
 
-        feature_list.append(fgrad_nuclei)
+            # compute gradient features
+            fdata = compute_gradient_features(
+                im_mask, im_intensity, label_index=label_index[channel])
 
-    # compute cytoplasm gradient features
-    if gradient_features_flag and im_cytoplasm is not None:
+        else:
 
-        fgrad_cytoplasm = compute_gradient_features(cyto_mask, im_cytoplasm,
-                                                    rprops=cytoplasm_props)
-        fgrad_cytoplasm.columns = ['Cytoplasm.' + col
-                                   for col in fgrad_cytoplasm.columns]
+            # compute haralick features
+            fdata = compute_haralick_features(
+                im_mask, im_intensity, num_levels=num_glcm_levels,
+                label_index=label_index[channel])
 
-        feature_list.append(fgrad_cytoplasm)
+        fdata.columns = [prefix + col for col in fdata.columns]
 
-    # compute nuclei haralick features
-    if haralick_features_flag:
+        # align the rows of the cytoplasm features with the nuclei, whose
+        # cytoplasm ring may be empty
+        if channel == 'cytoplasm':
+            fdata.index = label_index['cytoplasm'].labels
+            fdata = fdata.reindex(
+                label_index['nucleus'].labels).reset_index(drop=True)
 
-        fharalick_nuclei = compute_haralick_features(
-            im_label, im_nuclei,
-            num_levels=num_glcm_levels,
-            rprops=nuclei_props
-        )
+        return fdata
 
-        fharalick_nuclei.columns = ['Nucleus.' + col
-                                    for col in fharalick_nuclei.columns]
+    # compute independent feature families, concurrently if requested
+    if num_threads > 1 and len(families) > 1:
 
-        feature_list.append(fharalick_nuclei)
+        with ThreadPoolExecutor(max_workers=num_threads) as executor:
+            family_fdata = list(executor.map(compute_family, families))
 
-    # compute cytoplasm haralick features
-    if haralick_features_flag and im_cytoplasm is not None:
+    else:
 
-        fharalick_cytoplasm = compute_haralick_features(
-            cyto_mask, im_cytoplasm,
-            num_levels=num_glcm_levels,
-            rprops=cytoplasm_props
-        )
+        family_fdata = [compute_family(family) for family in families]
 
-        fharalick_cytoplasm.columns = ['Cytoplasm.' + col
-                                       for col in fharalick_cytoplasm.columns]
-
-        feature_list.append(fharalick_cytoplasm)
+    if not family_fdata:
+        return pd.DataFrame(index=pd.RangeIndex(len(label_index['nucleus'])))
 
     # Merge all features
-    fdata = pd.concat(feature_list, axis=1)
+    fdata = pd.concat(family_fdata, axis=1)
+
+    # keep the requested features only
+    if feature_list is not None:
+
+        selected = [
+            [col for col in fdata.columns
+             if col == name or col.startswith(name + '.')]
+            for name in feature_list
+        ]
+
+        for name, cols in zip(feature_list, selected):
+            if not cols:
+                raise ValueError('Feature %r is unknown' % name)
+
+        fdata = fdata[[col for col in fdata.columns
+                       if any(col in cols for cols in selected)]]
 
     return fdata
+
+
+# prefixes of the names of the features of each family
+_family_prefixes = {
+    'morphometry': ('Size.', 'Shape.'),
+    'fsd': ('Shape.FSD',),
+    'nucleus_intensity': ('Nucleus.Intensity.',),
+    'cytoplasm_intensity': ('Cytoplasm.Intensity.',),
+    'nucleus_gradient': ('Nucleus.Gradient.',),
+    'cytoplasm_gradient': ('Cytoplasm.Gradient.',),
+    'nucleus_haralick': ('Nucleus.Haralick.',),
+    'cytoplasm_haralick': ('Cytoplasm.Haralick.',),
+}
+
+
+def _family_matches(family, name):
+    """Check whether the feature name or prefix `name` may select features
+    of a family."""
+
+    if family == 'morphometry' and name.startswith('Shape.FSD'):
+        return False
+
+    name = name + '.'
+
+    return any(name.startswith(prefix) or prefix.startswith(name)
+               for prefix in _family_prefixes[family])
+
+
+def _get_intensity_feature_list(prefix, feature_list):
+    """Get the names of the requested intensity features of a channel, or
+    None if all of them are requested."""
+
+    if feature_list is None:
+        return None
+
+    prefix = prefix + 'Intensity.'
+
+    if any(prefix.startswith(name + '.') for name in feature_list):
+        return None
+
+    return [name[len(prefix) - len('Intensity.'):] for name in feature_list
+            if name.startswith(prefix)]
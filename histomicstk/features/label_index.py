@@ -0,0 +1,190 @@
+import numpy as np
+
+
+class LabelIndex(object):
+    """Pixels of a label image grouped by object.
+
+    The flat indices of the pixels of all objects are sorted by label once,
+    with a single argsort of the label image, so that each object is a
+    contiguous segment of `indices`. The index can be built once per image
+    and passed to all feature functions, which then compute the statistics of
+    every object in a few passes over flat arrays with segment reductions
+    instead of scanning the label image and allocating the coordinates of
+    each object again.
+
+    Parameters
+    ----------
+    im_label : array_like
+        A labeled mask image wherein intensity of a pixel is the ID of the
+        object it belongs to. Non-zero values are considered to be foreground
+        objects.
+
+    Attributes
+    ----------
+    labels : array_like
+        Labels of the objects in increasing order, which is the order of
+        `skimage.measure.regionprops`. Statistics are computed in this order.
+    indices : array_like
+        Flat indices of the pixels of all objects grouped by label.
+    starts : array_like
+        Position in `indices` of the first pixel of each object.
+    counts : array_like
+        Number of pixels of each object.
+    segment_ids : array_like
+        Index of the object of each pixel of `indices`.
+    shape : tuple
+        Shape of the label image.
+
+    See Also
+    --------
+    histomicstk.features.compute_nuclei_features
+
+    """
+
+    def __init__(self, im_label):
+
+        im_label = np.asarray(im_label)
+
+        flat_label = im_label.ravel()
+        fgnd = np.flatnonzero(flat_label > 0)
+        order = np.argsort(flat_label[fgnd], kind='stable')
+
+        self.indices = fgnd[order]
+
+        self.labels, self.starts, self.counts = np.unique(
+            flat_label[self.indices], return_index=True, return_counts=True)
+
+        self.segment_ids = np.repeat(np.arange(len(self.labels)),
+                                     self.counts)
+
+        self.shape = im_label.shape
+
+        self._coords = None
+        self._bboxes = None
+
+    def __len__(self):
+        return len(self.labels)
+
+    @property
+    def coords(self):
+        """A tuple of arrays containing the coordinates of the pixels of
+        `indices` along each dimension."""
+        if self._coords is None:
+            self._coords = np.unravel_index(self.indices, self.shape)
+        return self._coords
+
+    @property
+    def bboxes(self):
+        """A len(labels) x (2 * ndim) array containing the bounding box of
+        each object, as the `bbox` attribute of regionprops, i.e.
+        (min_row, min_col, max_row, max_col) in 2D with max excluded."""
+        if self._bboxes is None:
+            bboxes = np.zeros((len(self), 2 * len(self.shape)),
+                              dtype=np.int_)
+            if len(self):
+                for i, coord in enumerate(self.coords):
+                    bboxes[:, i] = np.minimum.reduceat(coord, self.starts)
+                    bboxes[:, len(self.shape) + i] = \
+                        np.maximum.reduceat(coord, self.starts) + 1
+            self._bboxes = bboxes
+        return self._bboxes
+
+    def get_coords(self, i):
+        """Get a (count x ndim) array containing the coordinates of the
+        pixels of the i-th object, as the `coords` attribute of
+        regionprops."""
+        start, stop = self.starts[i], self.starts[i] + self.counts[i]
+        return np.stack([coord[start:stop] for coord in self.coords], axis=1)
+
+    def get_rows(self, labels):
+        """Get the indices of the objects with the given labels."""
+        return np.searchsorted(self.labels, labels)
+
+    def values(self, im_values):
+        """Get the values of the pixels of each object."""
+        return np.asarray(im_values).ravel()[self.indices]
+
+    def sorted_values(self, im_values):
+        """Get the values of the pixels of each object in increasing
+        order."""
+        return self.sort(self.values(im_values))
+
+    def sort(self, values):
+        """Sort `values` within each object."""
+        return values[np.lexsort((values, self.segment_ids))]
+
+    def sum(self, values):
+        """Get the sum of `values` over each object."""
+        return self._reduce(np.add, values)
+
+    def mean(self, values):
+        """Get the mean of `values` over each object."""
+        return self._reduce(np.add, values.astype(float)) / self.counts
+
+    def central_moments(self, values, orders=(2, 3, 4)):
+        """Get the mean and biased central moments of `values` over each
+        segment."""
+        values = values.astype(float)
+        mean = self._reduce(np.add, values) / self.counts
+        dev = values - mean[self.segment_ids]
+        moments = [self._reduce(np.add, dev ** k) / self.counts
+                   for k in orders]
+        return mean, moments
+
+    def quantile(self, sorted_values, q):
+        """Get the q-th quantile of each object of `sorted_values` with the
+        linear interpolation of `numpy.percentile`."""
+        index = self.counts * q + (1 - q) - 1
+        lower = np.floor(index).astype(int)
+        upper = np.minimum(lower + 1, self.counts - 1)
+        gamma = index - lower
+        a = sorted_values[self.starts + lower].astype(float)
+        b = sorted_values[self.starts + upper].astype(float)
+        diff_b_a = b - a
+        return np.where(gamma >= 0.5, b - diff_b_a * (1 - gamma),
+                        a + diff_b_a * gamma)
+
+    def median(self, sorted_values):
+        """Get the median of each object of `sorted_values`."""
+        half = self.starts + self.counts // 2
+        a = sorted_values[half - 1 + self.counts % 2].astype(float)
+        b = sorted_values[half].astype(float)
+        return (a + b) / 2
+
+    def histogram(self, sorted_values, bins):
+        """Get the histogram of each object of `sorted_values` over `bins`
+        equal bins between its minimum and maximum, as `numpy.histogram`
+        computes it."""
+        dtype = sorted_values.dtype
+        if not np.issubdtype(dtype, np.inexact):
+            dtype = np.dtype(float)
+        values = sorted_values.astype(dtype, copy=False)
+
+        first_edge = values[self.starts]
+        last_edge = values[self.starts + self.counts - 1]
+        equal = first_edge == last_edge
+        first_edge = np.where(equal, first_edge - 0.5, first_edge)
+        last_edge = np.where(equal, last_edge + 0.5, last_edge)
+
+        bin_edges = np.linspace(first_edge, last_edge, bins + 1,
+                                axis=1).astype(dtype, copy=False)
+        norm = bins / (last_edge - first_edge)
+
+        seg = self.segment_ids
+        indices = ((values - first_edge[seg]) * norm[seg]).astype(np.intp)
+        indices[indices == bins] -= 1
+
+        # correct for inconsistencies within ~1 ULP of the bin edges
+        indices[values < bin_edges[seg, indices]] -= 1
+        increment = ((values >= bin_edges[seg, indices + 1]) &
+                     (indices != bins - 1))
+        indices[increment] += 1
+
+        hist = np.bincount(seg * bins + indices,
+                           minlength=len(self.starts) * bins)
+        return hist.reshape(-1, bins)
+
+    def _reduce(self, ufunc, values):
+        if not len(values):
+            return np.zeros(0, dtype=values.dtype)
+        return ufunc.reduceat(values, self.starts)
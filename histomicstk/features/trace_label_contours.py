@@ -0,0 +1,236 @@
+import numpy as np
+
+from ._compute_contours_cython import (
+    _trace_label_contours_cython, _convex_hull_areas_cython)
+
+
+class LabelContours(object):
+    """Outer boundaries of all objects of a label image, stored as one array
+    of points with per-object offsets.
+
+    Attributes
+    ----------
+    labels : array_like
+        Labels of the objects in increasing order, which is the order of
+        `skimage.measure.regionprops`.
+    coords : array_like
+        A N x 2 array containing the (row, column) coordinates of the centers
+        of the boundary pixels of all objects. The boundary of each object is
+        ordered clockwise and is implicitly closed.
+    offsets : array_like
+        A (len(labels) + 1)-element array such that the boundary of the i-th
+        object is ``coords[offsets[i]:offsets[i + 1]]``.
+
+    See Also
+    --------
+    histomicstk.features.trace_label_contours
+
+    """
+
+    def __init__(self, labels, coords, offsets):
+
+        self.labels = labels
+        self.coords = coords
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.labels)
+
+    @property
+    def counts(self):
+        """Number of boundary points of each object."""
+        return np.diff(self.offsets)
+
+    def get_contour(self, i):
+        """Get the boundary points of the i-th object."""
+        return self.coords[self.offsets[i]:self.offsets[i + 1]]
+
+    def get_rows(self, labels):
+        """Get the indices of the objects with the given labels."""
+        return np.searchsorted(self.labels, labels)
+
+    def perimeter(self):
+        """Get the length of the closed boundary of each object."""
+        X, Y, starts = self._get_closed_contours()
+        slens = self._get_step_lengths(X, Y, starts)
+        return self._reduce(slens, starts)
+
+    def convex_hull_area(self):
+        """Get the area of the convex hull of the boundary pixels of each
+        object, i.e. of the squares of unit side centered at its boundary
+        points."""
+        corners = np.array([[-0.5, -0.5], [-0.5, 0.5],
+                            [0.5, -0.5], [0.5, 0.5]])
+
+        points = (self.coords[:, None, :] + corners).reshape(-1, 2)
+        segment_ids = np.repeat(np.arange(len(self)), 4 * self.counts)
+
+        order = np.lexsort((points[:, 1], points[:, 0], segment_ids))
+
+        return _convex_hull_areas_cython(
+            np.ascontiguousarray(points[order]), 4 * self.offsets)
+
+    def resample(self, K):
+        """Resample the closed boundary of each object at K + 1 points
+        equally spaced in arc length.
+
+        Parameters
+        ----------
+        K : int
+            Number of boundary segments after resampling.
+
+        Returns
+        -------
+        iX : array_like
+            A len(labels) x (K + 1) array containing the rows of the
+            resampled points. The first and last points of each row are the
+            first boundary point. Rows of objects with less than two boundary
+            points are NaN.
+        iY : array_like
+            A len(labels) x (K + 1) array containing the columns of the
+            resampled points.
+
+        """
+        X, Y, starts = self._get_closed_contours()
+
+        num_objects = len(self)
+        counts = self.counts
+
+        valid = counts >= 2
+
+        iX = np.full((num_objects, K + 1), np.nan)
+        iY = np.full((num_objects, K + 1), np.nan)
+
+        if not np.any(valid):
+            return iX, iY
+
+        # normalized cumulative arc length at each point of each contour
+        slens = self._get_step_lengths(X, Y, starts)
+        total = self._reduce(slens, starts)
+
+        segment_ids = np.repeat(np.arange(num_objects), counts + 1)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slens = slens / total[segment_ids]
+        slens[~valid[segment_ids]] = 0
+
+        cumulative = np.cumsum(slens) - slens
+        cumulative -= cumulative[starts][segment_ids]
+
+        # locate the equally spaced points along each contour as
+        # numpy.digitize does, by merging them with the cumulative lengths
+        interval = np.linspace(0, 1, K + 1)
+        objects = np.flatnonzero(valid)
+
+        query_ids = np.repeat(objects, K + 1)
+        query = np.tile(interval, len(objects))
+
+        keys = np.lexsort((
+            np.r_[np.zeros(len(cumulative)), np.ones(len(query))],
+            np.r_[cumulative, query],
+            np.r_[segment_ids, query_ids]))
+
+        num_before = np.cumsum(keys < len(cumulative))
+        position = np.empty(len(keys), dtype=int)
+        position[keys] = np.arange(len(keys))
+
+        locations = num_before[position[len(cumulative):]] - \
+            starts[query_ids]
+        locations = np.minimum(locations, counts[query_ids])
+
+        # linear interpolation
+        prev = starts[query_ids] + locations - 1
+
+        Lie = (query - cumulative[prev]) / slens[prev]
+
+        iX[objects] = (X[prev] + (X[prev + 1] - X[prev]) * Lie).reshape(
+            -1, K + 1)
+        iY[objects] = (Y[prev] + (Y[prev + 1] - Y[prev]) * Lie).reshape(
+            -1, K + 1)
+
+        return iX, iY
+
+    def _get_closed_contours(self):
+
+        # contours with their first point appended, so the contour of the
+        # i-th object starts at starts[i] and has counts[i] + 1 points
+        counts = self.counts
+        starts = self.offsets[:-1] + np.arange(len(self))
+
+        indices = np.empty(len(self.coords) + len(self), dtype=int)
+
+        closing = starts + counts
+        is_closing = np.zeros(len(indices), dtype=bool)
+        is_closing[closing] = True
+
+        indices[~is_closing] = np.arange(len(self.coords))
+        indices[closing] = self.offsets[:-1]
+
+        X = self.coords[indices, 0].astype(float)
+        Y = self.coords[indices, 1].astype(float)
+
+        return X, Y, starts
+
+    def _get_step_lengths(self, X, Y, starts):
+
+        # length of the step from each point to the next one of the same
+        # contour, and zero at the last point of each contour
+        slens = np.zeros(len(X))
+        slens[:-1] = np.sqrt(np.diff(X) ** 2 + np.diff(Y) ** 2)
+        slens[starts + self.counts] = 0
+
+        return slens
+
+    def _reduce(self, values, starts):
+
+        if not len(starts):
+            return np.zeros(0)
+
+        return np.add.reduceat(values, starts)
+
+
+def trace_label_contours(im_label):
+    """Traces the outer boundaries of all objects of a label image in a
+    single pass.
+
+    Boundaries are traced with the Moore neighbor tracing algorithm during a
+    single raster scan of the label image, instead of cropping, padding and
+    scanning a mask of each object as `trace_object_boundaries` does. Shape
+    features of all objects can then be computed in batch from the returned
+    contours.
+
+    Parameters
+    ----------
+    im_label : array_like
+        A labeled mask image wherein intensity of a pixel is the ID of the
+        object it belongs to. Non-zero values are considered to be foreground
+        objects.
+
+    Returns
+    -------
+    contours : LabelContours
+        The 8-connected outer boundaries of the objects. The first connected
+        component in raster order of an object that has several of them is
+        traced.
+
+    See Also
+    --------
+    histomicstk.segmentation.label.trace_object_boundaries,
+    histomicstk.features.compute_fsd_features,
+    histomicstk.features.compute_morphometry_features
+
+    """
+    coords, offsets, labels = _trace_label_contours_cython(
+        np.ascontiguousarray(im_label, dtype=np.int64))
+
+    # order the contours by label as regionprops does
+    order = np.argsort(labels)
+    counts = np.diff(offsets)[order]
+
+    sorted_offsets = np.zeros(len(labels) + 1, dtype=np.int64)
+    np.cumsum(counts, out=sorted_offsets[1:])
+
+    indices = np.arange(len(coords)) + np.repeat(
+        offsets[:-1][order] - sorted_offsets[:-1], counts)
+
+    return LabelContours(labels[order], coords[indices], sorted_offsets)
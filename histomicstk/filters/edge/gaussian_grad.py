@@ -1,6 +1,6 @@
 import collections
 import numpy as np
-import scipy.signal as signal
+import scipy.ndimage as ndi
 
 
 def gaussian_grad(im_input, sigma):
@@ -44,10 +44,11 @@ def gaussian_grad(im_input, sigma):
         / (sigma * (2 * np.pi) ** 0.5)
 
     # smoothed gradients of input image
-    dx = signal.convolve2d(im_input, xGx, mode='same')
-    dx = signal.convolve2d(dx, yGx, mode='same')
-    dy = signal.convolve2d(im_input, xGy, mode='same')
-    dy = signal.convolve2d(dy, yGy, mode='same')
+    im_input = np.asarray(im_input, dtype=float)
+    dx = ndi.convolve1d(im_input, xGx.ravel(), axis=1, mode='constant')
+    dx = ndi.convolve1d(dx, yGx.ravel(), axis=0, mode='constant')
+    dy = ndi.convolve1d(im_input, xGy.ravel(), axis=1, mode='constant')
+    dy = ndi.convolve1d(dy, yGy.ravel(), axis=0, mode='constant')
 
     # format output
     Output = collections.namedtuple('Output', ['dx', 'dy'])
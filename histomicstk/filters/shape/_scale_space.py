@@ -0,0 +1,90 @@
+"""Helpers shared by the scale-adaptive multiscale blob filters."""
+import numpy as np
+
+from scipy.ndimage.morphology import distance_transform_edt
+
+
+def sigma_upper_bound(im_mask, sigma_min, sigma_max):
+    """Get the largest sigma applicable at each pixel, as 2 times the
+    distance to the nearest background pixel clipped to the sigma range."""
+    im_sigma_ubound = distance_transform_edt(im_mask)
+
+    im_sigma_ubound *= 2.0
+
+    np.clip(im_sigma_ubound, sigma_min, sigma_max, out=im_sigma_ubound)
+
+    return im_sigma_ubound
+
+
+def update_maxima(im_response, sigma, im_response_max, im_sigma_max,
+                  is_update):
+    """Update the maximal response and its sigma in place where the
+    response is larger, using `is_update` as a buffer."""
+    np.greater(im_response, im_response_max, out=is_update)
+
+    np.copyto(im_response_max, im_response, where=is_update)
+    np.copyto(im_sigma_max, sigma, where=is_update)
+
+
+def filter_in_strips(func, im_input, im_sigma_ubound, strip_size, halo,
+                     align=1):
+    """Apply a scale-space filter to overlapping strips of rows.
+
+    Parameters
+    ----------
+    func : callable
+        Filter called as ``func(im_input, im_sigma_ubound, row_offset)`` on
+        each strip, where `row_offset` is the index of the first row of the
+        strip in the image, and returning a tuple of images of the same
+        number of rows.
+    im_input : array_like
+        Input image.
+    im_sigma_ubound : array_like
+        Largest sigma applicable at each pixel of `im_input`.
+    strip_size : int or None
+        Number of rows of the output computed from each strip. The whole
+        image is processed at once if None.
+    halo : int
+        Number of rows added on both sides of each strip, which must cover
+        the support of the filter for the strips to give the same output as
+        the whole image.
+    align : int, optional
+        The first row of each strip, including its halo, is a multiple of
+        `align`, so that strips are downsampled on the same grid as the
+        whole image.
+
+    Returns
+    -------
+    outputs : tuple of array_like
+        Outputs of `func` over the whole image.
+
+    """
+    num_rows = im_input.shape[0]
+
+    if strip_size is None or strip_size >= num_rows:
+        return func(im_input, im_sigma_ubound, 0)
+
+    strip_size = -(-int(strip_size) // align) * align
+    halo = -(-int(halo) // align) * align
+
+    outputs = None
+
+    for start in range(0, num_rows, strip_size):
+
+        stop = min(start + strip_size, num_rows)
+
+        low = max(0, start - halo)
+        high = min(num_rows, stop + halo)
+
+        strip_outputs = func(im_input[low:high], im_sigma_ubound[low:high],
+                             low)
+
+        if outputs is None:
+            outputs = tuple(
+                np.empty((num_rows,) + out.shape[1:], dtype=out.dtype)
+                for out in strip_outputs)
+
+        for out, strip_out in zip(outputs, strip_outputs):
+            out[start:stop] = strip_out[start - low:stop - low]
+
+    return outputs
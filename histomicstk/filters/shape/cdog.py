@@ -2,12 +2,13 @@ import math
 
 import numpy as np
 
-from scipy.ndimage.morphology import distance_transform_edt
 from scipy.ndimage.filters import gaussian_filter
-from skimage.transform import resize
 
+from ._scale_space import filter_in_strips, sigma_upper_bound, update_maxima
 
-def cdog(im_input, im_mask, sigma_min, sigma_max, num_octave_levels=3):
+
+def cdog(im_input, im_mask, sigma_min, sigma_max, num_octave_levels=3,
+         strip_size=None):
     """SCale-adaptive Multiscale Difference-of-Gaussian (DoG) filter for
     nuclei/blob detection.
 
@@ -21,6 +22,11 @@ def cdog(im_input, im_mask, sigma_min, sigma_max, num_octave_levels=3):
     octave is divided into sub-levels. The gaussian images are downsampled by 2
     at the end of each octave to keep the size of convolutional filters small.
 
+    All computations are done in the floating point type of the input, or in
+    float64 for other inputs, in a fixed set of buffers per octave, and the
+    image can be processed in overlapping strips of rows to bound the size of
+    these buffers.
+
     Parameters
     ----------
     im_input : array_like
@@ -36,6 +42,10 @@ def cdog(im_input, im_mask, sigma_min, sigma_max, num_octave_levels=3):
         equal to maximum-blob-radius / sqrt(2).
     num_octave_levels : int
         Number of levels per octave in the scale space.
+    strip_size : int, optional
+        If given, the filter is applied to strips of about this many rows,
+        padded with enough rows on both sides to give the same output as
+        filtering the whole image at once.
 
     Returns
     -------
@@ -56,35 +66,47 @@ def cdog(im_input, im_mask, sigma_min, sigma_max, num_octave_levels=3):
 
     """
 
-    im_input = im_input.astype(np.float)
+    im_input = np.asarray(im_input)
 
-    # generate distance map
-    im_dmap = distance_transform_edt(im_mask)
+    if not np.issubdtype(im_input.dtype, np.floating):
+        im_input = im_input.astype(np.float64)
 
     # compute max sigma at each pixel as 2 times the distance to background
-    im_sigma_ubound = 2.0 * im_dmap
+    im_sigma_ubound = sigma_upper_bound(im_mask, sigma_min, sigma_max)
+
+    levels = _get_levels(sigma_min, sigma_max, num_octave_levels)
+
+    # strips are aligned to the coarsest octave and padded by the support of
+    # the cascaded gaussian filters and of the upsampling of octave maxima
+    align = 2 ** levels[-1][2]
+
+    halo = _gaussian_radius(sigma_min) + align + sum(
+        _gaussian_radius(sigma_conv) * 2 ** n_octave
+        for sigma_cur, sigma_conv, n_octave, is_last, is_octave_end in levels)
+
+    num_rows = im_input.shape[0]
+
+    def func(im_input, im_sigma_ubound, row_offset):
+        return _cdog(im_input, im_sigma_ubound, sigma_min, levels,
+                     row_offset, num_rows)
 
-    # clip max sigma values to specified range
-    im_sigma_ubound = np.clip(im_sigma_ubound, sigma_min, sigma_max)
+    return filter_in_strips(func, im_input, im_sigma_ubound, strip_size,
+                            halo, align)
+
+
+def _get_levels(sigma_min, sigma_max, num_octave_levels):
+    """Get the (sigma, sigma_conv, n_octave, is_last, is_octave_end) of
+    each level of the scale space, where sigma_conv is the sigma of the
+    gaussian filter producing the next level at the octave resolution."""
 
     # compute number of levels in the scale space
     sigma_ratio = 2 ** (1.0 / num_octave_levels)
 
     k = int(math.log(float(sigma_max) / sigma_min, sigma_ratio)) + 1
 
-    # Compute maximal DoG filter response accross the scale space
-    sigma_cur = sigma_min
-    im_gauss_cur = gaussian_filter(im_input, sigma_cur)
-    im_sigma_ubound_cur = im_sigma_ubound.copy()
+    levels = []
 
-    MIN_FLOAT = np.finfo(im_input.dtype).min
-
-    im_dog_max = np.zeros_like(im_input)
-    im_dog_max[:, :] = MIN_FLOAT
-    im_dog_octave_max = im_dog_max.copy()
-
-    im_sigma_max = np.zeros_like(im_input)
-    im_sigma_octave_max = np.zeros_like(im_input)
+    sigma_cur = sigma_min
 
     n_level = 0
     n_octave = 0
@@ -99,77 +121,129 @@ def cdog(im_input, im_mask, sigma_min, sigma_max, num_octave_levels=3):
         sigma_conv = np.sqrt(sigma_next ** 2 - sigma_cur ** 2)
         sigma_conv /= 2.0 ** n_octave
 
-        im_gauss_next = gaussian_filter(im_gauss_cur, sigma_conv)
+        n_level += 1
 
-        # compute DoG
-        im_dog_cur = im_gauss_next - im_gauss_cur
+        levels.append((sigma_cur, sigma_conv, n_octave, i == k,
+                       n_level == num_octave_levels))
 
-        # constrain response
-        im_dog_cur[im_sigma_ubound_cur < sigma_cur] = MIN_FLOAT
+        sigma_cur = sigma_next
 
-        # update maxima
-        max_update_pixels = np.where(im_dog_cur > im_dog_octave_max)
+        if n_level == num_octave_levels:
+            n_level = 0
+            n_octave += 1
 
-        if len(max_update_pixels[0]) > 0:
+    return levels
 
-            im_dog_octave_max[max_update_pixels] = im_dog_cur[max_update_pixels]
-            im_sigma_octave_max[max_update_pixels] = sigma_cur
 
-            # print np.unique(im_sigma_octave_max)
+def _gaussian_radius(sigma):
 
-        # update cur sigma
-        sigma_cur = sigma_next
-        im_gauss_cur = im_gauss_next
+    # radius of the kernel of scipy.ndimage.gaussian_filter
+    return int(4.0 * sigma + 0.5)
 
-        # udpate level
-        n_level += 1
 
-        # Do additional processing at the end of each octave
-        if i == k or n_level == num_octave_levels:
+def _resize_index(start, stop, size, n_octave):
+    """Get the index in the grid downsampled n_octave times by [::2] of
+    each position from start to stop in a grid of the given size, with the
+    nearest neighbor rule of skimage.transform.resize(order=0) upsampling the
+    downsampled grid of the whole image back to its size."""
 
-            # update maxima
-            if num_octave_levels > 0:
+    coarse_size = -(-size // 2 ** n_octave)
 
-                im_dog_octave_max_rszd = resize(
-                    im_dog_octave_max, im_dog_max.shape, order=0)
+    # ndimage.zoom in grid mode, which resize uses, with order 0 rounding
+    zoom = float(coarse_size) / size
 
-            else:
+    index = np.floor((np.arange(start, stop) + 0.5) * zoom - 0.5 + 0.5)
 
-                im_dog_octave_max_rszd = im_dog_octave_max
+    return np.clip(index.astype(int), 0, coarse_size - 1)
 
-            max_pixels = np.where(
-                im_dog_octave_max_rszd > im_dog_max)
 
-            if len(max_pixels[0]) > 0:
+def _cdog(im_input, im_sigma_ubound, sigma_min, levels, row_offset=0,
+          num_rows=None):
 
-                im_dog_max[max_pixels] = \
-                    im_dog_octave_max_rszd[max_pixels]
+    if num_rows is None:
+        num_rows = im_input.shape[0]
 
-                if num_octave_levels > 0:
+    MIN_FLOAT = np.finfo(im_input.dtype).min
+
+    shape = im_input.shape
+
+    # Compute maximal DoG filter response accross the scale space
+    im_gauss_cur = gaussian_filter(im_input, sigma_min)
+    im_sigma_ubound_cur = im_sigma_ubound
+
+    im_dog_max = np.full(shape, MIN_FLOAT, dtype=im_input.dtype)
+    im_dog_octave_max = im_dog_max.copy()
+
+    im_sigma_max = np.zeros(shape, dtype=im_input.dtype)
+    im_sigma_octave_max = im_sigma_max.copy()
+
+    is_max_update = np.empty(shape, dtype=bool)
+
+    # buffers at the resolution of the current octave
+    im_gauss_next = np.empty_like(im_gauss_cur)
+    im_dog_cur = np.empty_like(im_gauss_cur)
+    is_update = np.empty(im_gauss_cur.shape, dtype=bool)
+
+    for sigma_cur, sigma_conv, n_octave, is_last, is_octave_end in levels:
+
+        gaussian_filter(im_gauss_cur, sigma_conv, output=im_gauss_next)
+
+        # compute DoG
+        np.subtract(im_gauss_next, im_gauss_cur, out=im_dog_cur)
 
-                    im_sigma_octave_max_rszd = resize(
-                        im_sigma_octave_max, im_dog_max.shape, order=0)
+        # constrain response
+        np.less(im_sigma_ubound_cur, sigma_cur, out=is_update)
+        np.copyto(im_dog_cur, MIN_FLOAT, where=is_update)
+
+        # update maxima
+        update_maxima(im_dog_cur, sigma_cur,
+                      im_dog_octave_max, im_sigma_octave_max, is_update)
+
+        # update cur sigma
+        im_gauss_cur, im_gauss_next = im_gauss_next, im_gauss_cur
+
+        # Do additional processing at the end of each octave
+        if is_last or is_octave_end:
 
-                else:
+            # update maxima, upsampling the octave maxima to the input
+            # resolution by nearest neighbor interpolation. The rows are
+            # mapped as for the whole image and shifted to the strip.
+            if n_octave > 0:
 
-                    im_sigma_octave_max_rszd = im_sigma_octave_max
+                rows = _resize_index(row_offset, row_offset + shape[0],
+                                     num_rows, n_octave)
+                rows -= row_offset >> n_octave
+                np.clip(rows, 0, im_dog_octave_max.shape[0] - 1, out=rows)
+
+                cols = _resize_index(0, shape[1], shape[1], n_octave)
+
+                im_dog_octave_max_rszd = im_dog_octave_max[rows[:, None],
+                                                           cols]
+                im_sigma_octave_max_rszd = im_sigma_octave_max[rows[:, None],
+                                                               cols]
+
+            else:
+
+                im_dog_octave_max_rszd = im_dog_octave_max
+                im_sigma_octave_max_rszd = im_sigma_octave_max
 
-                im_sigma_max[max_pixels] = \
-                    im_sigma_octave_max_rszd[max_pixels]
+            update_maxima(im_dog_octave_max_rszd, im_sigma_octave_max_rszd,
+                          im_dog_max, im_sigma_max, is_max_update)
 
-            # downsample images by 2 at the end of each octave
-            if n_level == num_octave_levels:
+        # downsample images by 2 at the end of each octave
+        if is_octave_end and not is_last:
 
-                im_gauss_cur = im_gauss_next[::2, ::2]
-                im_sigma_ubound_cur = im_sigma_ubound_cur[::2, ::2]
+            im_gauss_cur = np.ascontiguousarray(im_gauss_cur[::2, ::2])
+            im_sigma_ubound_cur = im_sigma_ubound_cur[::2, ::2]
 
-                im_dog_octave_max = im_dog_octave_max[::2, ::2]
-                im_sigma_octave_max = im_sigma_octave_max[::2, ::2]
+            im_dog_octave_max = im_dog_octave_max[::2, ::2].copy()
+            im_sigma_octave_max = im_sigma_octave_max[::2, ::2].copy()
 
-                n_level = 0
-                n_octave += 1
+            im_gauss_next = np.empty_like(im_gauss_cur)
+            im_dog_cur = np.empty_like(im_gauss_cur)
+            is_update = np.empty(im_gauss_cur.shape, dtype=bool)
 
     # set min vals to min response
-    im_dog_max[im_dog_max == MIN_FLOAT] = 0
+    np.copyto(im_dog_max, 0, where=im_dog_max == MIN_FLOAT)
 
     return im_dog_max, im_sigma_max
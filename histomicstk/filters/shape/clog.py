@@ -1,10 +1,11 @@
 import numpy as np
 
 from scipy.ndimage.filters import gaussian_laplace
-from scipy.ndimage.morphology import distance_transform_edt
 
+from ._scale_space import filter_in_strips, sigma_upper_bound, update_maxima
 
-def clog(im_input, im_mask, sigma_min, sigma_max):
+
+def clog(im_input, im_mask, sigma_min, sigma_max, strip_size=None):
     """Constrainted Laplacian of Gaussian filter.
 
     Takes as input a grayscale nuclear image and binary mask of cell nuclei,
@@ -26,15 +27,19 @@ def clog(im_input, im_mask, sigma_min, sigma_max):
     sigma_max : double
         Maximum sigma value for the scale space. For blob detection, set this
         equal to maximum-blob-radius / sqrt(2).
+    strip_size : int, optional
+        If given, the filter is applied to strips of about this many rows,
+        padded with enough rows on both sides to give the same output as
+        filtering the whole image at once.
 
     Returns
     -------
     im_log_max : array_like
-        An intensity image containing the maximal LoG filter response accross
-        all scales for each pixel
+        An intensity image containing the maximal LoG filter response
+        accross all scales for each pixel
     im_sigma_max : array_like
-        An intensity image containing the sigma value corresponding to the
-        maximal LoG response at each pixel. The nuclei/blob radius value for
+        An intensity image containing the sigma value corresponding to
+        the maximal LoG response at each pixel. The nuclei/blob radius value for
         a given sigma can be estimated to be equal to sigma * sqrt(2).
 
     References
@@ -45,50 +50,53 @@ def clog(im_input, im_mask, sigma_min, sigma_max):
 
     """
 
-    # convert intensity image type to float
-    im_input = im_input.astype(np.float)
-
-    # generate distance map
-    im_dmap = distance_transform_edt(im_mask)
+    im_input = np.asarray(im_input, dtype=np.float64)
 
     # compute max sigma at each pixel as 2 times the distance to background
-    im_sigma_ubound = 2.0 * im_dmap
-
-    # clip max sigma values to specified range
-    im_sigma_ubound = np.clip(im_sigma_ubound, sigma_min, sigma_max)
-
-    # initialize log filter response array
-    MIN_FLOAT = np.finfo(im_input.dtype).min
-
-    im_log_max = np.zeros_like(im_input)
-    im_log_max[:, :] = MIN_FLOAT
-
-    im_sigma_max = np.zeros_like(im_input)
+    im_sigma_ubound = sigma_upper_bound(im_mask, sigma_min, sigma_max)
 
     # Compute maximal LoG filter response across the scale space
     sigma_start = np.floor(sigma_min)
     sigma_end = np.ceil(sigma_max)
 
     sigma_list = np.linspace(sigma_start, sigma_end,
-                             sigma_end - sigma_start + 1)
+                             int(sigma_end - sigma_start) + 1)
+
+    def func(im_input, im_sigma_ubound, row_offset):
+        return _clog(im_input, im_sigma_ubound, sigma_list)
+
+    # radius of the kernels of scipy.ndimage.gaussian_laplace
+    halo = int(4.0 * sigma_end + 0.5)
+
+    return filter_in_strips(func, im_input, im_sigma_ubound, strip_size,
+                            halo)
+
+
+def _clog(im_input, im_sigma_ubound, sigma_list):
+
+    # initialize log filter response array
+    MIN_FLOAT = np.finfo(im_input.dtype).min
+
+    im_log_max = np.full(im_input.shape, MIN_FLOAT, dtype=im_input.dtype)
+    im_sigma_max = np.zeros(im_input.shape, dtype=im_input.dtype)
+
+    im_log_cur = np.empty(im_input.shape, dtype=im_input.dtype)
+    is_update = np.empty(im_input.shape, dtype=bool)
 
     for sigma in sigma_list:
 
         # generate normalized filter response
-        im_log_cur = sigma**2 * gaussian_laplace(im_input, sigma, mode='mirror')
+        gaussian_laplace(im_input, sigma, output=im_log_cur, mode='mirror')
+        im_log_cur *= sigma ** 2
 
         # constrain LoG response
-        im_log_cur[im_sigma_ubound < sigma] = MIN_FLOAT
+        np.less(im_sigma_ubound, sigma, out=is_update)
+        np.copyto(im_log_cur, MIN_FLOAT, where=is_update)
 
         # update maxima
-        max_update_pixels = np.where(im_log_cur > im_log_max)
-
-        if len(max_update_pixels[0]) > 0:
-
-            im_log_max[max_update_pixels] = im_log_cur[max_update_pixels]
-            im_sigma_max[max_update_pixels] = sigma
+        update_maxima(im_log_cur, sigma, im_log_max, im_sigma_max, is_update)
 
     # replace min floats
-    im_log_max[im_log_max == MIN_FLOAT] = 0
+    np.copyto(im_log_max, 0, where=im_log_max == MIN_FLOAT)
 
     return im_log_max, im_sigma_max
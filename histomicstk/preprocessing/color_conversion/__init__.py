@@ -13,11 +13,13 @@ from .lab_to_rgb import lab_to_rgb
 from .rgb_to_hsi import rgb_to_hsi
 
 from .lab_mean_std import lab_mean_std  # after rgb_to_lab
+from .lab_moments import LabMoments  # after rgb_to_lab
 
 # list out things that are available for public use
 __all__ = (
 
     # functions and classes of this package
+    'LabMoments',
     'lab_mean_std',
     'lab_to_rgb',
     'od_to_rgb',
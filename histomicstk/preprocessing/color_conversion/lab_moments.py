@@ -0,0 +1,142 @@
+"""Mergeable accumulator of the LAB color statistics of RGB pixels."""
+
+import numpy as np
+
+from .rgb_to_lab import rgb_to_lab
+
+
+class LabMoments(object):
+    """Streaming accumulator of the mean and standard deviation of RGB pixels
+    in LAB color space.
+
+    Pixels are added in batches with `update` and partial accumulators, e.g.
+    computed by different tasks on different tiles of a slide, are combined
+    with `merge`. The batch and merge updates are those of Welford / Chan et
+    al., so the statistics are numerically stable and only the count, mean
+    and sum of squared deviations of each channel are kept in memory
+    regardless of the number of pixels.
+
+    Attributes
+    ----------
+    count : int
+        Number of pixels accumulated so far.
+    mean : array_like
+        A 3-element array containing the mean of each LAB channel.
+    m2 : array_like
+        A 3-element array containing the sum of squared deviations from the
+        mean of each LAB channel.
+
+    See Also
+    --------
+    histomicstk.preprocessing.color_conversion.lab_mean_std,
+    histomicstk.preprocessing.color_normalization.reinhard_stats
+
+    References
+    ----------
+    .. [#] T. F. Chan, G. H. Golub, R. J. LeVeque, "Updating formulae and a
+       pairwise algorithm for computing sample variances," Technical Report
+       STAN-CS-79-773, Stanford University, 1979.
+
+    """
+
+    def __init__(self):
+
+        self.count = 0
+        self.mean = np.zeros(3)
+        self.m2 = np.zeros(3)
+
+    def update(self, im_rgb, mask=None):
+        """Add pixels to the accumulator.
+
+        Parameters
+        ----------
+        im_rgb : array_like
+            An RGB image or an N x 3 array of RGB pixels.
+        mask : array_like, optional
+            A boolean mask of the pixels of `im_rgb` to add. All pixels are
+            added if None.
+
+        Returns
+        -------
+        self : LabMoments
+            The updated accumulator.
+
+        """
+        im_rgb = np.asarray(im_rgb)[..., :3]
+
+        if mask is not None:
+            im_rgb = im_rgb[np.asarray(mask, dtype=bool)]
+
+        pixels = np.reshape(im_rgb, (-1, 3))
+
+        if not len(pixels):
+            return self
+
+        pixels_lab = np.reshape(rgb_to_lab(pixels[None]), (-1, 3))
+
+        batch_mean = pixels_lab.mean(0)
+        batch_m2 = ((pixels_lab - batch_mean) ** 2).sum(0)
+
+        self._combine(len(pixels_lab), batch_mean, batch_m2)
+
+        return self
+
+    def merge(self, other):
+        """Add the pixels of another accumulator to this one.
+
+        Parameters
+        ----------
+        other : LabMoments
+            The accumulator to merge.
+
+        Returns
+        -------
+        self : LabMoments
+            The updated accumulator.
+
+        """
+        if other.count:
+            self._combine(other.count, other.mean, other.m2)
+
+        return self
+
+    @classmethod
+    def merge_all(cls, accumulators):
+        """Merge a sequence of accumulators into a new one.
+
+        Parameters
+        ----------
+        accumulators : list of LabMoments
+            The accumulators to merge.
+
+        Returns
+        -------
+        merged : LabMoments
+            An accumulator of all pixels of `accumulators`.
+
+        """
+        merged = cls()
+
+        for accumulator in accumulators:
+            merged.merge(accumulator)
+
+        return merged
+
+    @property
+    def std(self):
+        """A 3-element array containing the standard deviation of each LAB
+        channel."""
+        if not self.count:
+            return np.full(3, np.nan)
+
+        return np.sqrt(self.m2 / self.count)
+
+    def _combine(self, count, mean, m2):
+
+        total = self.count + count
+        delta = mean - self.mean
+
+        self.mean = self.mean + delta * (float(count) / total)
+        self.m2 = self.m2 + m2 + delta ** 2 * (
+            float(self.count) * count / total)
+        self.count = total
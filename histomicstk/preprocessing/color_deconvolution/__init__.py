@@ -19,6 +19,7 @@ from .color_deconvolution import color_deconvolution
 from .color_deconvolution import stain_unmixing_routine
 from .color_deconvolution import color_deconvolution_routine
 from .color_deconvolution import _reorder_stains
+from .reinhard_color_deconvolution import reinhard_color_deconvolution
 
 #: A dictionary of names for reference stain vectors
 stain_color_map = _stain_color_map.stain_color_map
@@ -31,6 +32,7 @@ __all__ = (
     'color_deconvolution',
     'stain_unmixing_routine',
     'color_deconvolution_routine',
+    'reinhard_color_deconvolution',
     'complement_stain_matrix',
     'find_stain_index',
     'separate_stains_macenko_pca',
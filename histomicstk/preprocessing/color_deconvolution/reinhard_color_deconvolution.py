@@ -0,0 +1,163 @@
+"""Reinhard color normalization and color deconvolution fused in one pass."""
+import numpy as np
+
+from histomicstk.preprocessing import color_conversion
+from histomicstk.preprocessing.color_conversion.rgb_to_lab import (
+    _rgb2lms, _lms2lab)
+from histomicstk.preprocessing.color_conversion.lab_to_rgb import (
+    _lms2rgb, _lab2lms)
+
+from ._linalg import normalize
+from .complement_stain_matrix import complement_stain_matrix
+
+
+def reinhard_color_deconvolution(im_rgb, w, target_mu, target_sigma,
+                                 src_mu=None, src_sigma=None, stains=(0,),
+                                 chunk_size=None, out=None):
+    """Perform Reinhard color normalization followed by color deconvolution
+    in a single pass.
+
+    This is equivalent to
+
+    ``color_deconvolution(reinhard(im_rgb, target_mu, target_sigma, src_mu,
+    src_sigma), w).Stains[..., stains]``
+
+    but the consecutive linear transforms of both steps are folded into a
+    few 3x3 matrices, the stain images that are not requested are never
+    computed and the arithmetic is done in float32 on buffers of at most
+    `chunk_size` pixels, so no full-size RGB, LAB or optical density
+    intermediate is allocated.
+
+    Parameters
+    ----------
+    im_rgb : array_like
+        An RGB image of type unsigned char.
+    w : array_like
+        A 3x3 matrix containing the color vectors in columns.
+        For two stain images the third column is zero and will be
+        complemented using cross-product.
+    target_mu : array_like
+        A 3-element array containing the means of the target image channels
+        in LAB color space.
+    target_sigma : array_like
+        A 3-element array containing the standard deviations of the target
+        image channels in LAB color space.
+    src_mu : array_like, optional
+        A 3-element array containing the means of the source image channels
+        in LAB color space. Derived from `im_rgb` if not provided.
+    src_sigma : array_like, optional
+        A 3-element array containing the standard deviations of the source
+        image channels in LAB color space. Derived from `im_rgb` if not
+        provided.
+    stains : sequence of int, optional
+        Indices of the columns of `w` whose stain images are computed.
+        Default value = (0,).
+    chunk_size : int, optional
+        Maximum number of pixels processed at once. The whole image is
+        processed at once if None.
+    out : array_like, optional
+        A preallocated float32 array of shape (m, n, len(stains)) in which
+        the output is stored.
+
+    Returns
+    -------
+    im_stains : array_like
+        A float32 image (m x n x len(stains)) whose channels contain the
+        images of the requested stains with the values of the `Stains` output
+        of `color_deconvolution`, i.e. integers in the range [0, 255].
+
+    See Also
+    --------
+    histomicstk.preprocessing.color_normalization.reinhard,
+    histomicstk.preprocessing.color_deconvolution.color_deconvolution
+
+    """
+    im_rgb = np.asarray(im_rgb)[..., :3]
+    stains = list(stains)
+
+    if (src_mu is None) or (src_sigma is None):
+        src_mu, src_sigma = color_conversion.lab_mean_std(im_rgb)
+
+    # the LAB normalization is an affine transform of log(LMS), so the LAB
+    # round trip folds into a single matrix and offset in log(LMS) space
+    scale = np.asarray(target_sigma, float) / np.asarray(src_sigma, float)
+    offset = np.asarray(target_mu, float) - scale * np.asarray(src_mu, float)
+
+    loglms_mat = np.dot(_lab2lms, scale[:, None] * _lms2lab)
+    loglms_offset = np.dot(_lab2lms, offset)
+
+    # complement and invert the stain matrix, keeping requested rows only
+    if np.linalg.norm(w[:, 2]) <= 1e-16:
+        wc = complement_stain_matrix(w)
+    else:
+        wc = w
+
+    deconv_mat = np.linalg.inv(normalize(wc))[stains]
+
+    # optical density of the quantized normalized RGB values
+    od_lut = color_conversion.rgb_to_sda(
+        np.arange(256, dtype=float), None).astype(np.float32)
+
+    # transposed matrices for right-multiplication of N x 3 pixel arrays
+    rgb2lms_t = _rgb2lms.T.astype(np.float32)
+    loglms_mat_t = loglms_mat.T.astype(np.float32)
+    loglms_offset = loglms_offset.astype(np.float32)
+    lms2rgb_t = _lms2rgb.T.astype(np.float32)
+    deconv_mat_t = deconv_mat.T.astype(np.float32)
+
+    shape = im_rgb.shape[:2] + (len(stains),)
+
+    if out is None:
+        out = np.empty(shape, dtype=np.float32)
+    elif out.shape != shape or out.dtype != np.float32:
+        raise ValueError('out must be a float32 array of shape %s'
+                         % (shape,))
+
+    pixels = im_rgb.reshape(-1, 3)
+    out_pixels = out.reshape(-1, len(stains))
+
+    num_pixels = len(pixels)
+    chunk_size = max(1, min(chunk_size or num_pixels, num_pixels))
+
+    buf = np.empty((chunk_size, 3), dtype=np.float32)
+    buf2 = np.empty((chunk_size, 3), dtype=np.float32)
+    buf_ind = np.empty((chunk_size, 3), dtype=np.uint8)
+
+    log_i0 = np.float32(np.log(256))
+
+    for start in range(0, num_pixels, chunk_size):
+
+        chunk = pixels[start:start + chunk_size]
+        n = len(chunk)
+        b, b2, ind = buf[:n], buf2[:n], buf_ind[:n]
+        o = out_pixels[start:start + n]
+
+        # RGB to log(LMS)
+        np.matmul(chunk, rgb2lms_t, out=b)
+        b[b == 0] = np.spacing(1)
+        np.log(b, out=b)
+
+        # normalization in LAB space and back to LMS
+        np.matmul(b, loglms_mat_t, out=b2)
+        b2 += loglms_offset
+        np.exp(b2, out=b2)
+
+        # LMS to RGB, quantized as reinhard does
+        np.matmul(b2, lms2rgb_t, out=b)
+        np.clip(b, 0, 255, out=b)
+        ind[...] = b
+
+        # RGB to optical density to stains
+        np.take(od_lut, ind, out=b)
+        np.matmul(b, deconv_mat_t, out=o)
+
+        # stains back to intensities, i.e. sda_to_rgb(o, None), quantized
+        # as color_deconvolution does
+        o *= -log_i0 / 255
+        o += log_i0
+        np.exp(o, out=o)
+        o -= 1
+        np.clip(o, 0, 255, out=o)
+        np.floor(o, out=o)
+
+    return out
@@ -1,11 +1,17 @@
 import collections
-import numpy as np
-from histomicstk.utils import sample_pixels
+import dask
+from histomicstk.utils.sample_pixels import _get_sample_pixels_tasks
 from histomicstk.preprocessing import color_conversion
 
 
+ReinhardStats = collections.namedtuple('ReinhardStats', ['Mu', 'Sigma'])
+
+# number of partial moments merged by each task of the reduction
+_merge_fan_in = 8
+
+
 def reinhard_stats(slide_path, sample_fraction, magnification=None,
-                   tissue_seg_mag=1.25):
+                   tissue_seg_mag=1.25, seed=None):
     """Samples a whole-slide-image to determine colorspace statistics (mean,
     variance) needed to perform global Reinhard color normalization.
 
@@ -21,14 +27,18 @@ def reinhard_stats(slide_path, sample_fraction, magnification=None,
     ----------
     slide_path : str
         path and filename of slide.
-    sample_fraction : double
-       Fraction of pixels to sample (range (0, 1]).
+    sample_fraction : double or None
+       Fraction of pixels to sample (range (0, 1]). If None, the exact
+       statistics of all foreground pixels are computed.
     magnification : scalar
         Desired magnification for sampling. Defaults to native scan
         magnification.
     tissue_seg_mag: double, optional
         low resolution magnification at which foreground will be segmented.
         Default value = 1.25.
+    seed: int, optional
+        Seed of the random number generator used to sample pixels. Set it to
+        get the same statistics on every run. Default value = None.
 
     Returns
     -------
@@ -43,6 +53,10 @@ def reinhard_stats(slide_path, sample_fraction, magnification=None,
     -----
     Returns a namedtuple.
 
+    The Lab moments of the sampled pixels are accumulated per group of tiles
+    and tree-reduced, so memory use does not grow with the number of sampled
+    pixels.
+
     See Also
     --------
     histomicstk.preprocessing.color_conversion.lab_mean_std
@@ -50,23 +64,29 @@ def reinhard_stats(slide_path, sample_fraction, magnification=None,
 
     """
 
-    # generate a sampling of sample_pixels_rgb pixels from whole-slide image
-    sample_pixels_rgb = sample_pixels(
-        slide_path,
-        sample_fraction=sample_fraction,
-        magnification=magnification,
-        tissue_seg_mag=tissue_seg_mag
-    )
+    # each task accumulates the Lab moments of the pixels sampled from a
+    # group of tiles so that the samples are never gathered in one place
+    moments = _get_sample_pixels_tasks(
+        slide_path, sample_fraction, magnification, tissue_seg_mag,
+        min_coverage=0 if sample_fraction is None else 0.1,
+        background=False, sample_approximate_total=None, tile_grouping=256,
+        seed=seed, accumulator=color_conversion.LabMoments)
+
+    # tree-reduce the partial moments
+    while len(moments) > 1:
+        moments = [dask.delayed(color_conversion.LabMoments.merge_all)(
+            moments[i:i + _merge_fan_in])
+            for i in range(0, len(moments), _merge_fan_in)]
 
-    # reshape the Nx3 pixel array into a 1 x N x 3 image for lab_mean_std
-    sample_pixels_rgb = np.reshape(sample_pixels_rgb,
-                                   (1, sample_pixels_rgb.shape[0], 3))
+    if moments:
+        moments = moments[0].compute()
+    else:
+        print("Sampling could not identify any foreground regions.")
+        moments = color_conversion.LabMoments()
 
-    # compute mean and stddev of sample pixels in Lab space
-    Mu, Sigma = color_conversion.lab_mean_std(sample_pixels_rgb)
+    Mu, Sigma = moments.mean, moments.std
 
     # build named tuple for output
-    ReinhardStats = collections.namedtuple('ReinhardStats', ['Mu', 'Sigma'])
     stats = ReinhardStats(Mu, Sigma)
 
     return stats
@@ -5,6 +5,7 @@ masks produced by segmentation algorithms.
 
 # make functions available at the package level using shadow imports
 # since we mostly have one function per file
+from .cleanup import cleanup
 from .compact import compact
 from .dilate_xor import dilate_xor
 from .condense import condense
@@ -24,6 +25,7 @@ __all__ = (
 
     # functions and classes of this package
     'area_open',
+    'cleanup',
     'compact',
     'dilate_xor',
     'condense',
@@ -0,0 +1,116 @@
+"""Helpers relabeling label images with lookup tables indexed by label."""
+import numpy as np
+import skimage.measure
+
+
+def label_counts(im_label):
+    """Get the number of pixels of each label, indexed by label."""
+    labels = np.asarray(im_label).ravel()
+
+    if labels.size and labels.min() < 0:
+        raise ValueError("Labels must be non-negative")
+
+    return np.bincount(labels, minlength=1)
+
+
+def open_areas(counts):
+    """Get the areas that `area_open` compares to the minimum area, indexed
+    by condensed label, from the number of pixels of each label.
+
+    `area_open` has always counted pixels with np.histogram over as many
+    bins as condensed labels plus one, spanning the smallest to the largest
+    label. Without background pixels the bins are narrower than one label
+    and shift, so these areas differ from the pixel counts. They are kept
+    so that segmentations do not change.
+    """
+    counts = np.asarray(counts)
+
+    areas = counts[1:][counts[1:] > 0]
+
+    if counts[0] > 0:
+        areas = np.concatenate(([counts[0]], areas))
+
+    num_labels = np.count_nonzero(counts[1:])
+
+    values = np.arange(num_labels + 1 - len(areas), num_labels + 1)
+
+    hist, _ = np.histogram(values, bins=num_labels + 1, weights=areas)
+
+    return hist.astype(np.int64)
+
+
+def condense_lut(keep, dtype):
+    """Get a lookup table mapping the labels where `keep` is True to
+    consecutive labels in increasing order, and other labels to 0."""
+    keep = np.asarray(keep, dtype=bool).copy()
+    keep[0] = False
+
+    lut = np.cumsum(keep).astype(dtype)
+    lut[~keep] = 0
+
+    return lut
+
+
+def relabel(im_label, lut):
+    """Map each label of `im_label` through `lut` in a single pass, keeping
+    the dtype of the lookup table."""
+    return lut[im_label]
+
+
+def get_border_labels(im_label):
+    """Get the labels of the pixels on the border of `im_label`."""
+    return np.unique(np.concatenate((
+        im_label[0, :], im_label[-1, :], im_label[:, 0], im_label[:, -1])))
+
+
+def connectivity(conn):
+    """Get the skimage connectivity of a 4 or 8 neighborhood."""
+    if conn == 8:
+        return 2
+    elif conn == 4:
+        return 1
+    else:
+        raise ValueError("Input 'conn' must be 4 or 8")
+
+
+def split_components(im_label, conn):
+    """Label the connected components of each object of `im_label` in a
+    single pass.
+
+    Returns
+    -------
+    im_comp : array_like
+        Image of the connected components, numbered in raster order of their
+        first pixel.
+    split_lut : array_like
+        Lookup table mapping each component to its label after splitting.
+        The first component of the i-th object in condensed order keeps
+        label i, and further components are numbered after the last object,
+        by object and then in raster order.
+
+    """
+    im_comp, num_comps = skimage.measure.label(
+        im_label, background=0, connectivity=connectivity(conn),
+        return_num=True)
+
+    # condensed object label of each component
+    counts = label_counts(im_label)
+
+    comp_labels = np.zeros(num_comps + 1, dtype=np.int64)
+    comp_labels[im_comp.ravel()] = im_label.ravel()
+    comp_labels = condense_lut(counts > 0, np.int64)[comp_labels]
+
+    num_objects = comp_labels.max() if num_comps else 0
+
+    # order the components by object, the first of each keeping its label
+    order = np.lexsort((np.arange(num_comps), comp_labels[1:])) + 1
+    sorted_labels = comp_labels[order]
+
+    is_first = np.ones(num_comps, dtype=bool)
+    is_first[1:] = sorted_labels[1:] != sorted_labels[:-1]
+
+    split_lut = np.zeros(num_comps + 1, dtype=np.int64)
+    split_lut[order] = np.where(
+        is_first, sorted_labels, num_objects + np.cumsum(~is_first))
+
+    return im_comp, split_lut
@@ -1,7 +1,6 @@
 import numpy as np
-import scipy.ndimage.measurements as ms
 
-from .condense import condense
+from ._relabel import condense_lut, label_counts, open_areas, relabel
 
 
 def area_open(im_label, min_area):
@@ -18,12 +17,16 @@ def area_open(im_label, min_area):
     Returns
     -------
     im_open : array_like
-        A uint32 label where objects with pixels < min_area are removed.
+        A label image of the dtype of `im_label` where objects with pixels <
+        min_area are removed.
 
     Notes
     -----
-    Objects are assumed to have positive nonzero values. im_label image will be
-    condensed during processing.
+    Objects are assumed to have positive nonzero values. The output is
+    condensed. Areas are counted with a histogram of the condensed labels,
+    whose bins do not match the labels when `im_label` has no background
+    pixels, so that objects can then be removed even if they have more than
+    `min_area` pixels.
 
     See Also
     --------
@@ -34,30 +37,11 @@ def area_open(im_label, min_area):
 
     """
 
-    # copy input image
-    im_open = im_label.copy()
+    # zero small objects and condense in a single lookup
+    counts = label_counts(im_label)
 
-    # condense label image
-    if np.unique(im_open).size-1 != im_open.max():
-        im_open = condense(im_open)
+    condensed = condense_lut(counts > 0, np.intp)
 
-    # count pixels in each object
-    Counts, Edges = np.histogram(im_open, bins=im_open.max()+1)
+    keep = (counts > 0) & (open_areas(counts)[condensed] >= min_area)
 
-    # get locations of objects in initial image
-    Locations = ms.find_objects(im_open)
-
-    # iterate through objects, zeroing where needed
-    for i in np.arange(1, Counts.size):
-        if Counts[i] < min_area:
-
-            # extract object from label image
-            Template = im_open[Locations[i-1]]
-
-            # label mask of object 'i'
-            Template[Template == i] = 0
-
-    # condense to fill gaps
-    im_open = condense(im_open)
-
-    return im_open
+    return relabel(im_label, condense_lut(keep, im_label.dtype))
@@ -0,0 +1,64 @@
+import numpy as np
+
+from ._relabel import condense_lut, get_border_labels, open_areas, \
+    relabel, split_components
+
+
+def cleanup(im_label, conn=8, min_area=0, delete_border=False):
+    """Splits discontiguous objects, removes small objects and optionally
+    objects touching the image border, relabeling the image once.
+
+    This gives the same result as calling `split`, `area_open` and
+    `delete_border` in sequence, but labels the connected components of all
+    objects in a single pass and maps them to their final labels with a
+    lookup table instead of relabeling the image at each step.
+
+    Parameters
+    ----------
+    im_label : array_like
+        A label image generated by segmentation methods.
+    conn : int
+        Neighborhood connectivity to define contiguity. Valid values are 4 or
+        8. Default value = 8.
+    min_area : int
+        Minimum area of the objects after splitting. Objects with fewer than
+        `min_area` pixels are zeroed. Default value = 0.
+    delete_border : bool
+        Delete the objects touching the border of the image after removing
+        small objects. Default value = False.
+
+    Returns
+    -------
+    im_clean : array_like
+        A condensed label image of the dtype of `im_label`.
+
+    Notes
+    -----
+    Objects are assumed to have positive nonzero values. Areas are counted
+    as in `area_open`, including when there are no background pixels.
+
+    See Also
+    --------
+    histomicstk.segmentation.label.split,
+    histomicstk.segmentation.label.area_open,
+    histomicstk.segmentation.label.delete_border
+
+    """
+
+    im_comp, split_lut = split_components(im_label, conn)
+
+    # number of pixels of each split label, which are consecutive
+    counts = np.zeros(len(split_lut), dtype=np.int64)
+    counts[split_lut] = np.bincount(im_comp.ravel(),
+                                    minlength=len(split_lut))
+
+    # split labels to keep
+    keep_split = open_areas(counts) >= min_area
+
+    if delete_border and im_comp.size:
+        keep_split[split_lut[get_border_labels(im_comp)]] = False
+
+    # condense the split labels of the kept components
+    lut = condense_lut(keep_split, im_label.dtype)[split_lut]
+
+    return relabel(im_comp, lut)
@@ -1,5 +1,4 @@
-import numpy as np
-import scipy.ndimage.measurements as ms
+from ._relabel import condense_lut, label_counts, relabel
 
 
 def condense(im_label):
@@ -15,7 +14,8 @@ def condense(im_label):
     Returns
     -------
     Condensed : array_like
-        A label image where all values > 0 are shifted down to fill gaps.
+        A label image where all values > 0 are shifted down to fill gaps. It
+        has the dtype of `im_label`.
 
     See Also
     --------
@@ -23,20 +23,7 @@ def condense(im_label):
 
     """
 
-    # initialize output
-    Condensed = im_label.copy()
+    # map present labels to consecutive values with a lookup table
+    counts = label_counts(im_label)
 
-    # get extent of each object
-    Locations = ms.find_objects(Condensed)
-
-    # initialize counter
-    Counter = 1
-
-    # fill in new values
-    for i in np.arange(1, len(Locations)+1):
-        if Locations[i-1] is not None:
-            Patch = Condensed[Locations[i-1]]
-            Patch[Patch == i] = Counter
-            Counter += 1
-
-    return Condensed
+    return relabel(im_label, condense_lut(counts > 0, im_label.dtype))
@@ -1,5 +1,6 @@
 import numpy as np
-import scipy.ndimage.measurements as ms
+
+from ._relabel import relabel
 
 
 def delete(im_label, indices):
@@ -31,16 +32,13 @@ def delete(im_label, indices):
 
     """
 
-    # initialize output
-    Deleted = im_label.copy()
+    if im_label.size == 0:
+        return im_label.copy()
 
-    # get extent of each object
-    Locations = ms.find_objects(Deleted)
+    # zero the deleted labels in an identity lookup table
+    lut = np.arange(im_label.max() + 1, dtype=im_label.dtype)
 
-    # fill in new values
-    for i in np.arange(indices.size):
-        if Locations[indices[i]-1] is not None:
-            Patch = Deleted[Locations[indices[i] - 1]]
-            Patch[Patch == indices[i]] = 0
+    indices = np.asarray(indices).ravel()
+    lut[indices[indices < len(lut)]] = 0
 
-    return Deleted
+    return relabel(im_label, lut)
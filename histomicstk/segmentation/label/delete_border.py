@@ -1,7 +1,7 @@
 import numpy as np
 
-from .delete import delete
-from .condense import condense
+from ._relabel import (
+    condense_lut, get_border_labels, label_counts, relabel)
 
 
 def delete_border(im_label):
@@ -25,22 +25,17 @@ def delete_border(im_label):
 
     """
 
-    im_label_del = np.zeros_like(im_label)
+    if not np.any(im_label):
+        return np.zeros_like(im_label)
 
-    if np.any(im_label):
+    border_indices = get_border_labels(im_label)
+    border_indices = border_indices[border_indices > 0]
 
-        im_border_mask = np.zeros_like(im_label)
-        im_border_mask[:, 0] = 1
-        im_border_mask[:, -1] = 1
-        im_border_mask[0, :] = 1
-        im_border_mask[-1, :] = 1
+    if len(border_indices) == 0:
+        return im_label
 
-        border_indices = np.unique(im_label[im_border_mask > 0])
-        border_indices = border_indices[border_indices > 0]
+    # delete and condense in a single lookup
+    keep = label_counts(im_label) > 0
+    keep[border_indices] = False
 
-        if len(border_indices) == 0:
-            return im_label
-
-        im_label_del = condense(delete(im_label, border_indices))
-
-    return im_label_del
+    return relabel(im_label, condense_lut(keep, im_label.dtype))
@@ -1,7 +1,4 @@
-import numpy as np
-import scipy.ndimage.measurements as ms
-
-from .condense import condense
+from ._relabel import relabel, split_components
 
 
 def split(im_label, conn=8):
@@ -14,7 +11,7 @@ def split(im_label, conn=8):
         A uint32 type label image generated by segmentation methods.
     conn : int
         Neighborhood connectivity to define contiguity. Valid values are 4 or
-        8. Default value = 4.
+        8. Default value = 8.
 
     Notes
     -----
@@ -23,7 +20,10 @@ def split(im_label, conn=8):
     Returns
     -------
     Split : array_like
-        A uint32 label where discontiguous objects are split and relabeled.
+        A label image of the dtype of `im_label` where discontiguous objects
+        are split and relabeled. Objects are condensed, the first portion in
+        raster order of each object keeps its label and other portions are
+        numbered after the last object.
 
     See Also
     --------
@@ -33,43 +33,8 @@ def split(im_label, conn=8):
 
     """
 
-    # copy input image
-    Split = im_label.copy()
-
-    # define kernel for neighborhood
-    if conn == 8:
-        Kernel = np.ones((3, 3), dtype=np.bool)
-    elif conn == 4:
-        Kernel = np.zeros((3, 3), dtype=np.bool)
-        Kernel[1, :] = True
-        Kernel[:, 1] = True
-    else:
-        raise ValueError("Input 'conn' must be 4 or 8")
-
-    # condense label image
-    if np.unique(Split).size-1 != Split.max():
-        Split = condense(Split)
-
-    # get locations of objects in initial image
-    Locations = ms.find_objects(Split)
-
-    # initialize number of labeled objects
-    Total = Split.max()
-
-    # iterate through objects, replicating where needed
-    for i in np.arange(1, len(Locations)+1):
-
-        # extract object from label image
-        Template = Split[Locations[i-1]]
-
-        # label mask of object 'i'
-        L, Count = ms.label(Template == i, Kernel)
-
-        # relabel if necessary
-        if(Count > 1):
-            Template[L == 1] = i
-            for i in np.arange(2, Count+1):
-                Template[L == i] = Total + 1
-                Total += 1
+    # label the components of all objects at once and map them to their
+    # split labels
+    im_comp, split_lut = split_components(im_label, conn)
 
-    return Split
+    return relabel(im_comp, split_lut.astype(im_label.dtype))
@@ -0,0 +1,104 @@
+import numpy as np
+import scipy.ndimage as ndi
+from scipy.ndimage.morphology import distance_transform_edt as dtx
+
+# number of pixels around a box needed to evaluate the level set updates,
+# which nest two central differences, exactly on the box
+HALO = 2
+
+
+def _extend(box, halo, shape):
+
+    # extends the slices of box by halo pixels on each side within the image,
+    # keeping at least 4 pixels so that the edge extrapolation of del2 uses
+    # the same values as on the whole image. Returns the extended slices and
+    # the slices of box within them.
+    ext = []
+    inner = []
+
+    for sl, size in zip(box, shape):
+        start = max(0, sl.start - halo)
+        stop = min(size, sl.stop + halo)
+
+        if stop - start < 4:
+            start = max(0, stop - 4)
+            stop = min(size, start + 4)
+
+        ext.append(slice(start, stop))
+        inner.append(slice(sl.start - start, sl.stop - start))
+
+    return tuple(ext), tuple(inner)
+
+
+def _front(im_sign):
+
+    # pixels with a 4-neighbor of different sign, between which the zero level
+    # set lies
+    front = np.zeros(im_sign.shape, dtype=bool)
+
+    change = im_sign[1:, :] != im_sign[:-1, :]
+    front[1:, :] |= change
+    front[:-1, :] |= change
+
+    change = im_sign[:, 1:] != im_sign[:, :-1]
+    front[:, 1:] |= change
+    front[:, :-1] |= change
+
+    return front
+
+
+def band_boxes(im_phi, width):
+    """Returns the bounding boxes of the pixels within width of each
+    connected component of the zero level set of im_phi."""
+
+    front = _front(im_phi > 0)
+
+    im_label, num_fronts = ndi.label(front, structure=np.ones((3, 3)))
+
+    reach = int(np.ceil(width))
+
+    return [_extend(box, reach, im_phi.shape)[0]
+            for box in ndi.find_objects(im_label)]
+
+
+def signed_distance(im_phi, boxes, width, out):
+    """Writes the signed distance to the zero level set of im_phi, clipped to
+    [-width, width] and positive where im_phi > 0, into out.
+
+    The distance is measured as in `mask_to_sdf`, from the pixels of each box
+    extended by one pixel. As the boxes extend the fronts by width, the box of
+    the nearest front contains it for each pixel within width of the zero
+    level set, and the smallest distance is kept. The values of im_phi,
+    clipped to [-1, 1], are kept on the pixels next to the zero level set, so
+    that it does not move to the nearest pixel edges. out may be im_phi, whose
+    sign is preserved.
+    """
+
+    im_sign = im_phi > 0
+    front = _front(im_sign)
+
+    front_phi = np.clip(im_phi[front], -1, 1)
+
+    out[...] = np.where(im_sign, width, -width)
+
+    for box in boxes:
+        ext, inner = _extend(box, 1, im_phi.shape)
+
+        im_mask = ~im_sign[ext]
+        sdf = (dtx(~im_mask) - dtx(im_mask) + im_mask - 1 / 2)[inner]
+
+        # keep the distance to the nearest front
+        sub = out[box]
+        closer = np.abs(sdf) < np.abs(sub)
+        sub[closer] = sdf[closer]
+
+    out[front] = front_phi
+
+
+def evaluate_boxes(func, shape, boxes, out):
+    """Writes func(ext) restricted to each box into out, where ext are the
+    slices of the box extended by HALO pixels."""
+
+    for box in boxes:
+        ext, inner = _extend(box, HALO, shape)
+        out[box] = func(ext)[inner]
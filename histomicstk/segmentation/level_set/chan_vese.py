@@ -2,9 +2,12 @@ import numpy as np
 from scipy.ndimage.morphology import distance_transform_edt as dtx
 import scipy.ndimage.filters as filters
 
+from . import _narrow_band as nb
+
 
 def chan_vese(im_input, im_mask, sigma,
-              dt=1.0, mu=0.2, lambda1=1, lambda2=1, iter=100):
+              dt=1.0, mu=0.2, lambda1=1, lambda2=1, iter=100, band=None,
+              tol=None):
     """Region-based level sets.
 
     Region-based level set implementation based on the Chan-Vese method.
@@ -12,6 +15,13 @@ def chan_vese(im_input, im_mask, sigma,
     the zero level-set, and the variance of external intensities. Robust to
     initialization.
 
+    With `band`, the level-set function is only evolved in a narrow band of
+    pixels within `band` pixels of its zero level set, and is clipped to
+    [-band, band] outside. The band and the signed distance function inside
+    it are recomputed every `band` / 4 iterations in the bounding boxes of
+    the band around each contour, and the force is normalized over the band.
+    New contours can then only appear within the band.
+
     Parameters
     ----------
     im_input : array_like
@@ -33,7 +43,14 @@ def chan_vese(im_input, im_mask, sigma,
     iter : double
         Number of iterations to evolve curve level set function over. Default
         value = 100.
-
+    band : double
+        Half-width in pixels of the narrow band to evolve the level-set
+        function in, or None to evolve it on the whole image. Should be at
+        least 4. Default value = None.
+    tol : double
+        With `band`, stop when at most this fraction of the band pixels
+        changed sign between two updates of the band, or None to run all
+        iterations. Default value = None.
 
     Returns
     -------
@@ -60,6 +77,10 @@ def chan_vese(im_input, im_mask, sigma,
     # generate signed distance map
     im_phi = mask_to_sdf(im_mask)
 
+    if band is not None:
+        return _chan_vese_band(im_input, im_phi, dt, mu, lambda1, lambda2,
+                               iter, band, tol)
+
     # evolve level set function
     for i in range(0, iter):
 
@@ -77,6 +98,75 @@ def chan_vese(im_input, im_mask, sigma,
     return im_phi
 
 
+def _chan_vese_band(im_input, im_phi, dt, mu, lambda1, lambda2, iter, band,
+                    tol):
+    # evolves the level set function in a narrow band
+
+    im_phi = np.clip(im_phi, -band, band)
+    flat_phi = im_phi.ravel()
+    flat_input = im_input.ravel()
+
+    # boxes of the band and linear indices of the band pixels
+    boxes = nb.band_boxes(im_phi, band)
+    indices = np.flatnonzero(np.abs(im_phi) < band)
+
+    # sums for the interior and exterior averages, updated as pixels of the
+    # band change sign
+    inside = flat_phi > 0
+    in_sum = np.sum(flat_input[inside])
+    in_count = np.count_nonzero(inside)
+    total_sum = np.sum(flat_input)
+
+    Curvature = np.zeros(im_phi.shape)
+
+    interval = max(1, int(band) // 4)
+    sign = flat_phi[indices] > 0
+
+    for i in range(0, iter):
+
+        if not len(indices):
+            break
+
+        # interior and exterior averages
+        C1 = in_sum / (in_count + 1e-10)
+        C2 = (total_sum - in_sum) / (im_phi.size - in_count + 1e-10)
+        Input = flat_input[indices]
+        Force = lambda2 * (Input - C2) ** 2 - lambda1 * (Input - C1) ** 2
+
+        # curvature on the boxes of the band
+        nb.evaluate_boxes(lambda ext: kappa(im_phi[ext]), im_phi.shape,
+                          boxes, Curvature)
+
+        # evolve
+        Phi = flat_phi[indices]
+        was_inside = Phi > 0
+        Phi += dt * Force / np.max(np.abs(Force)) + \
+            mu * Curvature.ravel()[indices]
+        flat_phi[indices] = Phi
+
+        is_inside = Phi > 0
+        gained = is_inside & ~was_inside
+        lost = was_inside & ~is_inside
+        in_sum += np.sum(Input[gained]) - np.sum(Input[lost])
+        in_count += np.count_nonzero(gained) - np.count_nonzero(lost)
+
+        if (i + 1) % interval:
+            continue
+
+        # stop when the zero level set barely moves
+        changed = np.count_nonzero(is_inside != sign)
+        if tol is not None and changed <= tol * len(indices):
+            break
+
+        # move the band and reinitialize the signed distance function in it
+        boxes = nb.band_boxes(im_phi, band)
+        nb.signed_distance(im_phi, boxes, band, im_phi)
+        indices = np.flatnonzero(np.abs(im_phi) < band)
+        sign = flat_phi[indices] > 0
+
+    return im_phi
+
+
 def mask_to_sdf(im_mask):
     # convert binary mask to signed distance function
 
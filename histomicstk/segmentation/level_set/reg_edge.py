@@ -2,9 +2,11 @@ import histomicstk.utils as htk_utls
 import numpy as np
 import scipy.ndimage.filters as filters
 
+from . import _narrow_band as nb
+
 
 def reg_edge(im_input, im_phi, well='double', sigma=1.5, dt=1.0, mu=0.2,
-             lamda=1, alpha=-3, epsilon=1.5, iter=100):
+             lamda=1, alpha=-3, epsilon=1.5, iter=100, band=None, tol=None):
     """Distance-regularized edge-based level sets.
 
     Distance-regularization is used in this edge-based level set implementation
@@ -13,6 +15,12 @@ def reg_edge(im_input, im_phi, well='double', sigma=1.5, dt=1.0, mu=0.2,
     function. Foreground objects are assumed to have larger intensity values
     than background.
 
+    With `band`, the level-set function is only evolved in a narrow band of
+    pixels within `band` pixels of its zero level set, which is recomputed
+    every `band` / 4 iterations in its bounding boxes around each contour. The
+    distance regularization keeps the level-set function flat away from the
+    zero level set, where the evolution then leaves it unchanged.
+
     Parameters
     ----------
     im_input : array_like
@@ -44,6 +52,14 @@ def reg_edge(im_input, im_phi, well='double', sigma=1.5, dt=1.0, mu=0.2,
     iter: double
         Number of iterations to evolve curve level set function over. Default
         value = 100.
+    band : double
+        Half-width in pixels of the narrow band to evolve the level-set
+        function in, or None to evolve it on the whole image. Should be at
+        least 4. Default value = None.
+    tol : double
+        With `band`, stop when at most this fraction of the band pixels
+        changed sign between two updates of the band, or None to run all
+        iterations. Default value = None.
 
     Returns
     -------
@@ -70,39 +86,101 @@ def reg_edge(im_input, im_phi, well='double', sigma=1.5, dt=1.0, mu=0.2,
     G = 1/(1 + dsI[0]**2 + dsI[1]**2)
     dG = np.gradient(G)
 
+    if band is not None:
+        return _reg_edge_band(im_phi, G, dG, well, dt, mu, lamda, alpha,
+                              epsilon, iter, band, tol)
+
     # perform regularized level-set evolutions with time step dt
     for i in range(0, iter):
 
         # fix boundary conditions
         im_phi = neumann_bounds(im_phi)
 
-        # calculate gradient of level set image
-        dPhi = np.gradient(im_phi)
-        mPhi = (dPhi[0]**2 + dPhi[1]**2)**0.5  # gradient magnitude
-        Curve = np.gradient(dPhi[0] / (mPhi + 1e-10))[0] + \
-            np.gradient(dPhi[1] / (mPhi + 1e-10))[1]  # divergence
-
-        # build regularization function
-        if well == 'single':
-            Reg = single_well(im_phi, Curve)
-        elif well == 'double':
-            Reg = double_well(im_phi, dPhi, mPhi, Curve, i)
-        else:
-            Reg = np.zeros(im_phi.shape)
-
-        # area and boundary-length energy function terms
-        iPhi = impulse(im_phi, epsilon)
-        Area = iPhi * G
-        Edge = iPhi * (dG[0] * (dPhi[0] / (mPhi + 1e-10)) +
-                       dG[1] * (dPhi[1] / (mPhi + 1e-10))) + iPhi * G * Curve
-
         # evolve level-set function
-        im_phi = im_phi + dt * (mu * Reg + lamda * Edge + alpha * Area)
+        im_phi = im_phi + dt * _update(im_phi, G, dG, well, mu, lamda, alpha,
+                                       epsilon, i)
 
     # return evolved level-set function following iterations
     return im_phi
 
 
+def _update(im_phi, G, dG, well, mu, lamda, alpha, epsilon, i):
+    # time derivative of the level-set function
+
+    # calculate gradient of level set image
+    dPhi = np.gradient(im_phi)
+    mPhi = (dPhi[0]**2 + dPhi[1]**2)**0.5  # gradient magnitude
+    Curve = np.gradient(dPhi[0] / (mPhi + 1e-10))[0] + \
+        np.gradient(dPhi[1] / (mPhi + 1e-10))[1]  # divergence
+
+    # build regularization function
+    if well == 'single':
+        Reg = single_well(im_phi, Curve)
+    elif well == 'double':
+        Reg = double_well(im_phi, dPhi, mPhi, Curve, i)
+    else:
+        Reg = np.zeros(im_phi.shape)
+
+    # area and boundary-length energy function terms
+    iPhi = impulse(im_phi, epsilon)
+    Area = iPhi * G
+    Edge = iPhi * (dG[0] * (dPhi[0] / (mPhi + 1e-10)) +
+                   dG[1] * (dPhi[1] / (mPhi + 1e-10))) + iPhi * G * Curve
+
+    return mu * Reg + lamda * Edge + alpha * Area
+
+
+def _reg_edge_band(im_phi, G, dG, well, dt, mu, lamda, alpha, epsilon, iter,
+                   band, tol):
+    # evolves the level-set function in a narrow band
+
+    im_phi = np.array(im_phi, dtype=float)
+    flat_phi = im_phi.ravel()
+
+    # boxes of the band and linear indices of the band pixels
+    Dist = np.zeros(im_phi.shape)
+    boxes = nb.band_boxes(im_phi, band)
+    nb.signed_distance(im_phi, boxes, band, Dist)
+    indices = np.flatnonzero(np.abs(Dist) < band)
+
+    Update = np.zeros(im_phi.shape)
+
+    interval = max(1, int(band) // 4)
+    sign = flat_phi[indices] > 0
+
+    for i in range(0, iter):
+
+        if not len(indices):
+            break
+
+        # fix boundary conditions
+        im_phi = neumann_bounds(im_phi)
+
+        # evolve level-set function on the boxes of the band
+        nb.evaluate_boxes(
+            lambda ext: _update(im_phi[ext], G[ext], [dG[0][ext], dG[1][ext]],
+                                well, mu, lamda, alpha, epsilon, i),
+            im_phi.shape, boxes, Update)
+
+        flat_phi[indices] += dt * Update.ravel()[indices]
+
+        if (i + 1) % interval:
+            continue
+
+        # stop when the zero level set barely moves
+        changed = np.count_nonzero((flat_phi[indices] > 0) != sign)
+        if tol is not None and changed <= tol * len(indices):
+            break
+
+        # move the band
+        boxes = nb.band_boxes(im_phi, band)
+        nb.signed_distance(im_phi, boxes, band, Dist)
+        indices = np.flatnonzero(np.abs(Dist) < band)
+        sign = flat_phi[indices] > 0
+
+    return im_phi
+
+
 def initialize(Mask, c0=2):
     # initialize scaled binary-step image
     Phi0 = np.zeros(Mask.shape)
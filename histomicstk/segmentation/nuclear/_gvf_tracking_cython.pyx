@@ -0,0 +1,142 @@
+import numpy as np
+cimport numpy as np
+cimport cython
+
+from libc.math cimport acos, round, M_PI
+from libcpp.vector cimport vector
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def _gvf_steps_cython(double[:, ::1] dx not None, double[:, ::1] dy not None,
+                      unsigned char[:, ::1] mask not None,
+                      long row_start, long row_stop,
+                      long[:, ::1] next_ind not None,
+                      unsigned char[:, ::1] is_end not None):
+
+    # computes the pixel reached by a unit step along the normalized gradient
+    # from each foreground pixel of rows [row_start, row_stop), as a linear
+    # index or -1 when it leaves the image, and whether tracking ends there
+    # because it leaves the foreground or turns by at least pi / 2
+    cdef long nrows = dx.shape[0]
+    cdef long ncols = dx.shape[1]
+
+    cdef long r, c, qr, qc
+    cdef double phi
+
+    with nogil:
+        for r in range(row_start, row_stop):
+            for c in range(ncols):
+
+                if not mask[r, c]:
+                    continue
+
+                qr = r + <long>round(dy[r, c])
+                qc = c + <long>round(dx[r, c])
+
+                if qr < 0 or qr > nrows - 1 or qc < 0 or qc > ncols - 1:
+                    next_ind[r, c] = -1
+                    is_end[r, c] = 1
+                    continue
+
+                next_ind[r, c] = qr * ncols + qc
+
+                if not mask[qr, qc]:
+                    is_end[r, c] = 1
+                else:
+                    phi = acos(dy[r, c] * dy[qr, qc] + dx[r, c] * dx[qr, qc])
+                    is_end[r, c] = not (phi < M_PI / 2)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def _gvf_track_cython(long[:, ::1] next_ind not None,
+                      unsigned char[:, ::1] is_end not None,
+                      unsigned char[:, ::1] mask not None):
+
+    # follows the steps from each foreground pixel in raster order until
+    # tracking ends or reaches a pixel mapped by an earlier trajectory, whose
+    # label is then given to the whole trajectory. Pixels already mapped are
+    # not tracked again, and a step back into the current trajectory closes a
+    # cycle whose last point is a sink.
+    cdef long nrows = next_ind.shape[0]
+    cdef long ncols = next_ind.shape[1]
+
+    segmentation = np.zeros((nrows, ncols), dtype=np.int32)
+
+    cdef int[::1] seg = segmentation.ravel()
+    cdef long[::1] next_flat = np.asarray(next_ind).ravel()
+    cdef unsigned char[::1] end_flat = np.asarray(is_end).ravel()
+    cdef unsigned char[::1] mask_flat = np.asarray(mask).ravel()
+
+    # index of the trajectory that visited each pixel, 0 if not mapped
+    cdef long[::1] visited = np.zeros(nrows * ncols, dtype=np.int64)
+
+    cdef vector[long] trajectory
+    cdef vector[long] sinks
+
+    cdef long start, p, q, k, num_tracked = 0
+    cdef int lab
+    cdef unsigned char stop
+
+    with nogil:
+        for start in range(nrows * ncols):
+
+            if not mask_flat[start] or visited[start]:
+                continue
+
+            num_tracked += 1
+
+            trajectory.clear()
+            trajectory.push_back(start)
+            visited[start] = num_tracked
+
+            p = start
+            lab = 0
+
+            while True:
+
+                q = next_flat[p]
+
+                # leaves the image
+                if q < 0:
+                    break
+
+                if visited[q]:
+
+                    # closes a cycle
+                    if visited[q] == num_tracked:
+                        p = q
+
+                    # joins an earlier trajectory
+                    else:
+                        lab = seg[q]
+
+                    break
+
+                trajectory.push_back(q)
+                visited[q] = num_tracked
+
+                stop = end_flat[p]
+                p = q
+
+                if stop:
+                    break
+
+            # new sink at the last point
+            if lab == 0:
+                sinks.push_back(p)
+                lab = sinks.size()
+
+            for k in range(trajectory.size()):
+                seg[trajectory[k]] = lab
+
+    sink_coords = np.empty((sinks.size(), 2), dtype=np.int64)
+
+    cdef long[:, ::1] sink_view = sink_coords
+
+    for k in range(sinks.size()):
+        sink_view[k, 0] = sinks[k] % ncols
+        sink_view[k, 1] = sinks[k] // ncols
+
+    return segmentation, sink_coords
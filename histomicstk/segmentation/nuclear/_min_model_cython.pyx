@@ -0,0 +1,260 @@
+import numpy as np
+cimport numpy as np
+cimport cython
+
+from libcpp.vector cimport vector
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def _trace_contours_cython(double[:, ::1] im not None,
+                           long[::1] seed_x not None,
+                           long[::1] seed_y not None,
+                           double[::1] seed_min not None,
+                           double[::1] seed_max not None,
+                           long max_length):
+
+    # traces the 4-connected boundary of the region of pixels with values in
+    # [seed_min[i], seed_max[i]] around each seed, within a window of half
+    # size ceil(max_length / 2), with the improved simple boundary follower.
+    # The neighbors of the current pixel are read directly from the image in
+    # the frame of the tracing direction instead of from rotated copies of a
+    # padded window. Closed contours of at most max_length points are kept,
+    # and seeds lying on a kept contour are not traced.
+    cdef long nrows = im.shape[0]
+    cdef long ncols = im.shape[1]
+
+    cdef long half = (max_length + 1) // 2
+
+    cdef unsigned char[:, ::1] covered = np.zeros((nrows, ncols),
+                                                  dtype=np.uint8)
+
+    cdef vector[long] bx
+    cdef vector[long] by
+
+    cdef vector[long] contour_x
+    cdef vector[long] contour_y
+    cdef vector[long] offsets
+
+    cdef long i, k, x, y, size
+    cdef long r0, r1, c0, c1
+    cdef double lo, hi
+
+    offsets.push_back(0)
+
+    with nogil:
+        for i in range(seed_x.shape[0]):
+
+            x = seed_x[i]
+            y = seed_y[i]
+
+            if covered[y, x]:
+                continue
+
+            r0 = max(0, y - half)
+            r1 = min(nrows, y + half + 1)
+            c0 = max(0, x - half)
+            c1 = min(ncols, x + half + 1)
+
+            lo = seed_min[i]
+            hi = seed_max[i]
+
+            if not _isbf(im, r0, r1, c0, c1, lo, hi, x, y, max_length,
+                         bx, by):
+                continue
+
+            size = bx.size()
+
+            if size > max_length or bx[0] != bx[size - 1] or \
+                    by[0] != by[size - 1]:
+                continue
+
+            for k in range(size):
+                contour_x.push_back(bx[k])
+                contour_y.push_back(by[k])
+                covered[by[k], bx[k]] = 1
+
+            offsets.push_back(contour_x.size())
+
+    cX = np.empty(contour_x.size(), dtype=np.int64)
+    cY = np.empty(contour_y.size(), dtype=np.int64)
+    contour_offsets = np.empty(offsets.size(), dtype=np.int64)
+
+    cdef long[::1] cX_view = cX
+    cdef long[::1] cY_view = cY
+    cdef long[::1] offsets_view = contour_offsets
+
+    for k in range(contour_x.size()):
+        cX_view[k] = contour_x[k]
+        cY_view[k] = contour_y[k]
+
+    for k in range(offsets.size()):
+        offsets_view[k] = offsets[k]
+
+    return cX, cY, contour_offsets
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef inline bint _inside(double[:, ::1] im, long r0, long r1, long c0,
+                         long c1, double lo, double hi,
+                         long x, long y) nogil:
+
+    return r0 <= y < r1 and c0 <= x < c1 and lo <= im[y, x] <= hi
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef bint _isbf(double[:, ::1] im, long r0, long r1, long c0, long c1,
+                double lo, double hi, long x_start, long y_start,
+                long max_length, vector[long] &bx, vector[long] &by) nogil:
+
+    # improved simple boundary follower. Offsets (cx, cy) in the frame where
+    # the tracing direction points up map to image offsets
+    # (c * cx - s * cy, s * cx + c * cy) for the rotation (c, s) of the
+    # direction. Returns False for isolated pixels, which have no contour.
+    cdef long DX = 1, DY = 0
+    cdef long c, s, x, y, t, num_moves, num_turns = 0
+    cdef long mx[2]
+    cdef long my[2]
+    cdef bint h00, h01, h10, h20, h21
+    cdef long size, fx1, fx2, fy1, fy2, lx1, lx2, lx3, lx4, ly1, ly2, ly3, ly4
+
+    bx.clear()
+    by.clear()
+
+    bx.push_back(x_start)
+    by.push_back(y_start)
+
+    while True:
+
+        if DX == 1 and DY == 0:
+            c = 0
+            s = 1
+        elif DX == 0 and DY == -1:
+            c = 1
+            s = 0
+        elif DX == -1 and DY == 0:
+            c = 0
+            s = -1
+        else:
+            c = -1
+            s = 0
+
+        x = bx.back()
+        y = by.back()
+
+        # front-left, front, left, rear-left and rear neighbors
+        h00 = _inside(im, r0, r1, c0, c1, lo, hi,
+                      x - c + s, y - s - c)
+        h01 = _inside(im, r0, r1, c0, c1, lo, hi, x + s, y - c)
+        h10 = _inside(im, r0, r1, c0, c1, lo, hi, x - c, y - s)
+        h20 = _inside(im, r0, r1, c0, c1, lo, hi,
+                      x - c - s, y - s + c)
+        h21 = _inside(im, r0, r1, c0, c1, lo, hi, x - s, y + c)
+
+        num_moves = 1
+
+        if h10:
+            # left neighbor
+            mx[0] = -1
+            my[0] = 0
+            DX = -1
+            DY = 0
+        elif h20 and not h21:
+            # inner-outer corner at left-rear
+            mx[0] = -1
+            my[0] = 1
+            DX = 0
+            DY = 1
+        elif h00:
+            if h01:
+                # inner corner at front
+                mx[0] = 0
+                my[0] = -1
+                mx[1] = -1
+                my[1] = 0
+                num_moves = 2
+            else:
+                # inner-outer corner at front-left
+                mx[0] = -1
+                my[0] = -1
+            DX = 0
+            DY = -1
+        elif h01:
+            # front neighbor
+            mx[0] = 0
+            my[0] = -1
+            DX = 1
+            DY = 0
+        else:
+            # outer corner
+            num_moves = 0
+            DX = 0
+            DY = 1
+
+        if num_moves == 0:
+            num_turns += 1
+            if num_turns == 4:
+                return False
+        else:
+            num_turns = 0
+
+        for t in range(num_moves):
+            bx.push_back(bx.back() + c * mx[t] - s * my[t])
+            by.push_back(by.back() + s * mx[t] + c * my[t])
+
+        x = c * DX - s * DY
+        DY = s * DX + c * DY
+        DX = x
+
+        size = bx.size()
+
+        if size > 3:
+
+            fx1 = bx[0]
+            fx2 = bx[1]
+            fy1 = by[0]
+            fy2 = by[1]
+            lx1 = bx[size - 1]
+            ly1 = by[size - 1]
+            lx2 = bx[size - 2]
+            ly2 = by[size - 2]
+            lx3 = bx[size - 3]
+            ly3 = by[size - 3]
+            lx4 = bx[size - 4]
+            ly4 = by[size - 4]
+
+            # stop when too long or when the first edge is revisited
+            if size > max_length or (lx1 == fx2 and lx2 == fx1 and
+                                     ly1 == fy2 and ly2 == fy1):
+                bx.pop_back()
+                by.pop_back()
+                return True
+
+            if num_moves == 2:
+                if lx2 == fx2 and lx3 == fx1 and ly2 == fy2 and ly3 == fy1:
+                    bx.pop_back()
+                    by.pop_back()
+                    bx.pop_back()
+                    by.pop_back()
+                    return True
+
+            # detect cycle and turn clockwise
+            if lx1 == lx3 and ly1 == ly3 and lx2 == lx4 and ly2 == ly4:
+                bx.pop_back()
+                by.pop_back()
+                bx.pop_back()
+                by.pop_back()
+                if DX == 0 and DY == 1:
+                    DX = -1
+                    DY = 0
+                elif DX == 1 and DY == 0:
+                    DX = 0
+                    DY = 1
+                elif DX == 0 and DY == -1:
+                    DX = 1
+                    DY = 0
+                else:
+                    DX = 0
+                    DY = -1
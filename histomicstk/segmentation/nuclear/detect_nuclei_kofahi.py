@@ -6,7 +6,8 @@ import histomicstk as htk
 
 
 def detect_nuclei_kofahi(im_nuclei_stain, im_nuclei_fgnd_mask, min_radius,
-                         max_radius, min_nucleus_area, local_max_search_radius):
+                         max_radius, min_nucleus_area, local_max_search_radius,
+                         ignore_border_nuclei=False):
 
     """Performs a nuclear segmentation using kofahi's method.
 
@@ -30,11 +31,13 @@ def detect_nuclei_kofahi(im_nuclei_stain, im_nuclei_fgnd_mask, min_radius,
         Minimum area that each nucleus should have
     local_max_search_radius : float
         Local max search radius used for detection seed points in nuclei
+    ignore_border_nuclei : bool, optional
+        Delete the nuclei touching the border of the image.
 
     Returns
     -------
     im_nuclei_seg_mask : array_like
-        A 2D array mask of the nuclei segmentation.
+        A 2D int32 label image of the nuclei segmentation.
 
     References
     ----------
@@ -56,7 +59,7 @@ def detect_nuclei_kofahi(im_nuclei_stain, im_nuclei_fgnd_mask, min_radius,
         im_nuclei_fgnd_mask)
 
     if not np.any(im_nuclei_fgnd_mask):
-        return im_nuclei_fgnd_mask
+        return np.zeros(im_nuclei_fgnd_mask.shape, dtype=np.int32)
 
     # run adaptive multi-scale LoG filter
     im_log_max, im_sigma_max = htk_shape_filters.cdog(
@@ -69,15 +72,15 @@ def detect_nuclei_kofahi(im_nuclei_stain, im_nuclei_fgnd_mask, min_radius,
     im_nuclei_seg_mask, seeds, maxima = htk.segmentation.nuclear.max_clustering(
         im_log_max, im_nuclei_fgnd_mask, local_max_search_radius)
 
+    im_nuclei_seg_mask = im_nuclei_seg_mask.astype(np.int32)
+
     if seeds is None:
         return im_nuclei_seg_mask
 
-    # split any objects with disconnected fragments
-    im_nuclei_seg_mask = htk.segmentation.label.split(im_nuclei_seg_mask,
-                                                      conn=8)
-
-    # filter out small objects
-    im_nuclei_seg_mask = htk.segmentation.label.area_open(
-        im_nuclei_seg_mask, min_nucleus_area).astype(np.int)
+    # split any objects with disconnected fragments, filter out small
+    # objects and optionally border objects with a single relabeling
+    im_nuclei_seg_mask = htk.segmentation.label.cleanup(
+        im_nuclei_seg_mask, conn=8, min_area=min_nucleus_area,
+        delete_border=ignore_border_nuclei)
 
     return im_nuclei_seg_mask
@@ -1,7 +1,7 @@
 import collections
 import numpy as np
 import sklearn.cluster as cl
-import scipy.signal as signal
+import scipy.ndimage as ndi
 
 import histomicstk as htk
 
@@ -13,8 +13,9 @@ def gaussian_voting(I, rmax=35, rmin=10, sSigma=5, Tau=5, bw=15, Psi=0.3):
     as input a hematoxylin-deconvolved image and uses the gradient signal to
     cast directed votes towards the center of cell nuclei. These votes are
     blurred by a gaussian kernel, and are spatially clustered using the
-    mean-shift algorithm. Convolutions are performed separably to reduce
-    compute time.
+    mean-shift algorithm. Votes are accumulated with a single bincount,
+    convolutions are performed separably and mean-shift clusters the local
+    maxima of the votes to reduce compute time.
 
     Parameters
     ----------
@@ -61,67 +62,63 @@ def gaussian_voting(I, rmax=35, rmin=10, sSigma=5, Tau=5, bw=15, Psi=0.3):
     """
 
     # calculate standard deviation of voting kernel
-    vSigma = (rmax - rmin) / 3
+    vSigma = (rmax - rmin) / 3.0
 
     # calculate voting radius
-    r = (rmax + rmin) / 2
+    r = (rmax + rmin) / 2.0
 
     # generate separable gaussian derivative kernels
     Grad = htk.filters.edge.gaussian_grad(I, sSigma)
-    dMag = (Grad.dX**2 + Grad.dY**2)**0.5
+    dMag = (Grad.dx**2 + Grad.dy**2)**0.5
 
     # threshold gradient image to identify voting pixels
-    dMask = dMag >= Tau
-    Voting = dMask.nonzero()
+    dMask = (dMag >= Tau) & (dMag > 0)
+    vY, vX = dMask.nonzero()
+    Weights = dMag[dMask]
 
-    # initialize voting field - pad by 'r' along each edge
-    Votes = np.zeros((I.shape[0] + 2 * r, I.shape[1] + 2 * r))
-    for i in range(Voting[0].size):
+    # calculate center points of voting regions
+    muX = np.round(vX + r * Grad.dx[dMask] / Weights).astype(int)
+    muY = np.round(vY + r * Grad.dy[dMask] / Weights).astype(int)
 
-        # calculate center point of voting region
-        mux = round(Voting[1][i] + r * Grad.dX[Voting[0][i]][Voting[1][i]] /
-                    dMag[Voting[0][i]][Voting[1][i]])
-        muy = round(Voting[0][i] + r * Grad.dY[Voting[0][i]][Voting[1][i]] /
-                    dMag[Voting[0][i]][Voting[1][i]])
+    # accumulate weighted votes in a voting field padded along each edge
+    pad = int(np.ceil(r))
+    Shape = (I.shape[0] + 2 * pad, I.shape[1] + 2 * pad)
 
-        # enter weighted votes at these locations
-        Votes[r+muy, r+mux] = Votes[r+muy, r+mux] + \
-            dMag[Voting[0][i]][Voting[1][i]]
+    Votes = np.bincount(
+        np.ravel_multi_index((muY + pad, muX + pad), Shape),
+        weights=Weights, minlength=Shape[0] * Shape[1]).reshape(Shape)
 
     # create voting kernel
-    x = np.linspace(0, 2*3*vSigma, 2*3*vSigma + 1)  # independent variables
-    y = np.linspace(0, 2*3*vSigma, 2*3*vSigma + 1)
-    x -= 2*3*vSigma/2  # center at zero
-    y -= 2*3*vSigma/2
-    x = np.reshape(x, (1, x.size))  # reshape to 2D row and column vectors
-    y = np.reshape(y, (y.size, 1))
-    xK = np.exp(-x**2 / (2 * vSigma**2)) / (sSigma * (2 * np.pi) ** 0.5)
-    yK = np.exp(-y**2 / (2 * vSigma**2)) / (sSigma * (2 * np.pi) ** 0.5)
-
-    # perform convolutions with voting kernel for vote-smoothing
-    Votes = signal.convolve2d(Votes, xK, mode='full', boundary='fill')
-    Votes = signal.convolve2d(Votes, yK, mode='full', boundary='fill')
+    x = np.arange(-np.ceil(3 * vSigma), np.ceil(3 * vSigma) + 1)
+    K = np.exp(-x**2 / (2 * vSigma**2)) / (sSigma * (2 * np.pi) ** 0.5)
+
+    # perform separable convolutions with voting kernel for vote-smoothing
+    Votes = ndi.convolve1d(Votes, K, axis=1, mode='constant')
+    Votes = ndi.convolve1d(Votes, K, axis=0, mode='constant')
 
     # crop voting image to size of original input image
-    Votes = Votes[r+np.floor(x.size/2):-(r+np.ceil(x.size/2)),
-                  r+np.floor(x.size/2):-(r+np.ceil(x.size/2))]
+    Votes = Votes[pad:pad + I.shape[0], pad:pad + I.shape[1]]
+
+    # reduce the votes to their local maxima above the lowest threshold, each
+    # repeated once per nested threshold it passes
+    Thresholds = np.arange(np.floor(10 * Psi) / 10, 0.9, 0.1) * Votes.max()
+
+    Peaks = (Votes == ndi.maximum_filter(Votes, size=3)) & \
+        (Votes >= Thresholds[0]) & (Votes > 0)
+
+    Counts = np.searchsorted(Thresholds, Votes[Peaks], side='right')
+    Seeds = np.repeat(np.column_stack(np.nonzero(Peaks)), Counts, axis=0)
 
-    # generate sets of potential seed points
-    Seeds = [None]*np.arange(np.floor(10 * Psi) / 10, 0.9, 0.1).size
-    for i, p in enumerate(np.arange(np.floor(10 * Psi) / 10, 0.9, 0.1)):
-        Points = np.nonzero(Votes >= p * Votes.max())
-        Seeds[i] = np.column_stack((Points[0].transpose(),
-                                    Points[1].transpose()))
+    # build output tuple
+    Output = collections.namedtuple('Output', ['X', 'Y'])
 
-    # concatenate seed point lists
-    Seeds = np.vstack(Seeds)
+    if not len(Seeds):
+        return Output(np.zeros(0), np.zeros(0)), Votes
 
     # run mean-shift algorithm to collect
     ms = cl.MeanShift(bandwidth=bw, bin_seeding=True)
     ms.fit(Seeds)
 
-    # build output tuple
-    Output = collections.namedtuple('Output', ['X', 'Y'])
     Nuclei = Output(ms.cluster_centers_[:, 1], ms.cluster_centers_[:, 0])
 
     return Nuclei, Votes
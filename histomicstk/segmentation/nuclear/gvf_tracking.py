@@ -1,11 +1,15 @@
+from concurrent.futures import ThreadPoolExecutor
+
 from histomicstk.utils import gradient_diffusion
 import numpy as np
 import skimage.morphology as mp
 from skimage import measure as ms
 
+from ._gvf_tracking_cython import _gvf_steps_cython, _gvf_track_cython
+
 
 def gvf_tracking(I, Mask, K=1000, Diffusions=10, Mu=5, Lambda=5, Iterations=10,
-                 dT=0.05):
+                 dT=0.05, num_threads=1, Method='explicit', Tol=1e-5):
     """
     Performs gradient-field tracking to segment smoothed images of cell nuclei.
 
@@ -24,7 +28,8 @@ def gvf_tracking(I, Mask, K=1000, Diffusions=10, Mu=5, Lambda=5, Iterations=10,
         objects have value 0. Used to restrict influence of background vectors
         on diffusion process and to reduce tracking computations.
     K : float
-        Number of steps to check for tracking cycle. Default value = 1000.
+        Unused. Cycles are detected as soon as a trajectory steps back onto
+        itself. Default value = 1000.
     Mu : float
         Weight parmeter from Navier-Stokes diffusion - weights divergence and
         Laplacian terms. Default value = 5.
@@ -36,15 +41,32 @@ def gvf_tracking(I, Mask, K=1000, Diffusions=10, Mu=5, Lambda=5, Iterations=10,
         10.
     dT : float
         Timestep to be used in Navier-Stokes diffusion. Default value = 0.05.
+    num_threads : int
+        Number of threads computing the tracking steps of blocks of rows.
+        Default value = 1.
+    Method : {'explicit', 'implicit'}
+        Navier-Stokes diffusion by `Diffusions` explicit time-steps, or by
+        solving directly for its steady state if Diffusions > 0. Default
+        value = 'explicit'.
+    Tol : float
+        Relative residual tolerance of the implicit diffusion. Default value =
+        1e-5.
 
     Returns
     -------
     Segmentation : array_like
-        Label image where positive values correspond to foreground pixels that
-        share mutual sinks.
+        An int32 label image where positive values correspond to foreground
+        pixels that share mutual sinks.
     Sinks : array_like
-        N x 2 array containing the (x,y) locations of the tracking sinks. Each
-        row is an (x,y) pair - in that order.
+        N x 2 integer array containing the (x,y) locations of the tracking
+        sinks. Each row is an (x,y) pair - in that order.
+
+    Notes
+    -----
+    Pixels are tracked in raster order in a compiled kernel that releases
+    the GIL. A trajectory stops as soon as it reaches a pixel mapped by an
+    earlier trajectory, whose label it takes, and pixels already mapped are
+    not tracked again.
 
     See Also
     --------
@@ -58,9 +80,8 @@ def gvf_tracking(I, Mask, K=1000, Diffusions=10, Mu=5, Lambda=5, Iterations=10,
 
     """
 
-    # get image shape
+    # get number of rows
     M = I.shape[0]
-    N = I.shape[1]
 
     # calculate gradient
     dy, dx = np.gradient(I)
@@ -68,120 +89,34 @@ def gvf_tracking(I, Mask, K=1000, Diffusions=10, Mu=5, Lambda=5, Iterations=10,
     # diffusion iterations
     if Diffusions > 0:
         dx, dy = gradient_diffusion(dx, dy, Mask, Mu, Lambda, Diffusions,
-                                    dT)
+                                    dT, method=Method, tol=Tol)
 
     # normalize to unit magnitude
     Mag = ((dx**2 + dy**2)**0.5 + np.finfo(float).eps)
     dy = dy / Mag
     dx = dx / Mag
 
-    # define mask to track pixels that are mapped to a sink
-    Mapped = np.zeros(I.shape)
-
-    # define label image
-    Segmentation = np.zeros(I.shape)
-
-    # initialize lists of sinks
-    Sinks = []
-
-    # define coordinates for foreground pixels (Mask == 1)
-    i, j = np.nonzero(Mask)
-
-    # track pixels
-    for index, (x, y) in enumerate(zip(j, i)):
-
-        # initialize angle, trajectory length, novel flag, and allocation count
-        phi = 0
-        points = 1
-        novel = 1
-        alloc = 1
-
-        # initialize trajectory
-        Trajectory = np.zeros((K, 2))
-        Trajectory[0, 0] = x
-        Trajectory[0, 1] = y
-
-        # track while angle defined by successive steps is < np.pi / 2
-        while(phi < np.pi / 2):
-
-            # calculate step
-            xStep = round_float(dx[Trajectory[points-1, 1],
-                                Trajectory[points-1, 0]])
-            yStep = round_float(dy[Trajectory[points-1, 1],
-                                Trajectory[points-1, 0]])
-
-            # check image edge
-            if ((Trajectory[points-1, 0] + xStep < 0) or
-                    (Trajectory[points-1, 0] + xStep > N-1) or
-                    (Trajectory[points-1, 1] + yStep < 0) or
-                    (Trajectory[points-1, 1] + yStep > M-1)):
-                break
-
-            # add new point to trajectory list
-            if points < K:  # buffer is not overrun
-                Trajectory[points, 0] = Trajectory[points-1, 0] + xStep
-                Trajectory[points, 1] = Trajectory[points-1, 1] + yStep
-
-            else:  # buffer overrun
-
-                # check for cycle
-                cycle = detect_cycle(Trajectory, points)
-
-                if cycle == points:  # no cycle, simple overflow. grow buffer.
-
-                    # copy and reallocate
-                    temp = Trajectory
-                    Trajectory = np.zeros((K*alloc, 2))
-                    Trajectory[K*(alloc-1):K*alloc, ] = temp
-                    alloc += 1
-
-                    # add new point
-                    Trajectory[points, 0] = Trajectory[points-1, 0] + xStep
-                    Trajectory[points, 1] = Trajectory[points-1, 1] + yStep
-
-                else:  # overflow due to cycle, terminate tracking
-                    points = cycle
-
-            # check mapping
-            if Mapped[Trajectory[points, 1], Trajectory[points, 0]] == 1:
-                novel = 0
-                phi = np.pi
-            elif Mask[Trajectory[points, 1], Trajectory[points, 0]] == 0:
-                phi = np.pi
-            else:
-                phi = np.arccos(dy[Trajectory[points-1, 1],
-                                   Trajectory[points-1, 0]] *
-                                dy[Trajectory[points, 1],
-                                   Trajectory[points, 0]] +
-                                dx[Trajectory[points-1, 1],
-                                   Trajectory[points-1, 0]] *
-                                dx[Trajectory[points, 1],
-                                   Trajectory[points, 0]])
-
-            # increment trajectory length counter
-            points += 1
-
-        # determine if sink is novel
-        if novel == 1:
-
-            # record sinks
-            Sinks.append(Trajectory[points-1, ])
-
-            # add trajectory to label image with new sink value, add mapping
-            for j in range(points):
-                Segmentation[Trajectory[j, 1], Trajectory[j, 0]] = len(Sinks)
-                Mapped[Trajectory[j, 1], Trajectory[j, 0]] = 1
-
-        else:
-
-            # add trajectory to label image with sink value of final point
-            for j in range(points):
-                Segmentation[Trajectory[j, 1], Trajectory[j, 0]] = \
-                    Segmentation[Trajectory[points-1, 1],
-                                 Trajectory[points-1, 0]]
-
-    # convert Sinks to numpy array
-    Sinks = np.asarray(Sinks)
+    dx = np.ascontiguousarray(dx, dtype=np.float64)
+    dy = np.ascontiguousarray(dy, dtype=np.float64)
+    Mask = np.ascontiguousarray(Mask, dtype=np.uint8)
+
+    # compute the step and end condition of every foreground pixel in row
+    # blocks, then track pixels to their sinks
+    Next = np.full(I.shape, -1, dtype=np.int64)
+    End = np.zeros(I.shape, dtype=np.uint8)
+
+    blocks = np.linspace(0, M, max(1, min(num_threads, M)) + 1).astype(int)
+
+    def track_steps(k):
+        _gvf_steps_cython(dx, dy, Mask, blocks[k], blocks[k + 1], Next, End)
+
+    if len(blocks) > 2:
+        with ThreadPoolExecutor(max_workers=num_threads) as executor:
+            list(executor.map(track_steps, range(len(blocks) - 1)))
+    else:
+        track_steps(0)
+
+    Segmentation, Sinks = _gvf_track_cython(Next, End, Mask)
 
     return Segmentation, Sinks
 
@@ -240,41 +175,3 @@ def merge_sinks(Label, Sinks, Radius=5):
             Merged[Coords[:, 0], Coords[:, 1]] = i
 
     return Merged
-
-
-def detect_cycle(Trajectory, points):
-
-    # initialize trajectory length
-    length = 0
-
-    # identify trajectory bounding box
-    xMin = np.min(Trajectory[0:points, 0])
-    xMax = np.max(Trajectory[0:points, 0])
-    xRange = xMax - xMin + 1
-    yMin = np.min(Trajectory[0:points, 1])
-    yMax = np.max(Trajectory[0:points, 1])
-    yRange = yMax - yMin + 1
-
-    # fill in trajectory map
-    Map = np.zeros((yRange, xRange))
-    for i in range(points):
-        if Map[Trajectory[i, 1]-yMin, Trajectory[i, 0]-xMin] == 1:
-            break
-        else:
-            Map[Trajectory[i, 1]-yMin, Trajectory[i, 0]-xMin] = 1
-        length += 1
-
-    return length
-
-
-def round_float(x):
-    if x >= 0.0:
-        t = np.ceil(x)
-        if t - x > 0.5:
-            t -= 1.0
-        return t
-    else:
-        t = np.ceil(-x)
-        if t + x > 0.5:
-            t -= 1.0
-        return -t
@@ -50,6 +50,8 @@ def max_clustering(im_response, im_fgnd_mask, r=10):
 
     """
 
+    im_response = np.asarray(im_response, dtype=np.float64)
+
     # find local maxima of all foreground pixels
     mval, mind = _max_clustering_cython(
         im_response, im_fgnd_mask.astype(np.int32), r
@@ -71,46 +73,75 @@ def max_clustering(im_response, im_fgnd_mask, r=10):
 
     im_response_nmzd = (im_response - min_resp) / resp_range
 
-    # compute object properties
-    obj_props = skimage.measure.regionprops(im_label, im_response_nmzd)
+    # group the pixels of each object, in raster order
+    im_label_flat = im_label.ravel()
+
+    obj_ind = np.flatnonzero(im_label_flat)
+    obj_ind = obj_ind[np.argsort(im_label_flat[obj_ind], kind='stable')]
+    obj_labels = im_label_flat[obj_ind]
+    obj_rows, obj_cols = np.unravel_index(obj_ind, im_label.shape)
+
+    starts = np.flatnonzero(np.r_[True, np.diff(obj_labels) != 0])
+    segment_ids = np.cumsum(np.r_[False, np.diff(obj_labels) != 0])
+
+    # compute the weighted centroids of all objects at once, relative to
+    # the top left corner of their bounding box as
+    # skimage.measure.regionprops does
+    weights = im_response_nmzd.ravel()[obj_ind]
+
+    corners = np.stack([np.minimum.reduceat(obj_rows, starts),
+                        np.minimum.reduceat(obj_cols, starts)], 1)
 
-    obj_props = [prop for prop in obj_props if np.isfinite(prop.weighted_centroid).all()]
+    weight_sums = np.add.reduceat(weights, starts)
 
-    num_labels = len(obj_props)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        centroids = corners + np.stack([
+            np.add.reduceat(
+                weights * (obj_rows - corners[segment_ids, 0]), starts),
+            np.add.reduceat(
+                weights * (obj_cols - corners[segment_ids, 1]), starts),
+        ], 1) / weight_sums[:, None]
+
+    is_valid = np.isfinite(centroids).all(1)
+
+    labels = obj_labels[starts[is_valid]]
+
+    num_labels = len(labels)
 
     if num_labels == 0:
         return im_label, None, None
 
     # extract object seeds
-    seeds = np.array(
-        [obj_props[i].weighted_centroid for i in range(num_labels)])
-    seeds = np.round(seeds).astype(np.int)
+    seeds = np.round(centroids[is_valid]).astype(int)
 
     # fix seeds outside the object region - happens for non-convex objects
-    for i in range(num_labels):
+    is_outside = np.zeros(len(starts), dtype=bool)
+    is_outside[is_valid] = im_label[seeds[:, 0], seeds[:, 1]] != labels
 
-        sy = seeds[i, 0]
-        sx = seeds[i, 1]
+    if np.any(is_outside):
 
-        if im_label[sy, sx] == obj_props[i].label:
-            continue
+        # find object point with closest manhattan distance to center of
+        # mass, taking the first one in raster order in case of ties
+        outside_seeds = np.zeros((len(starts), 2), dtype=int)
+        outside_seeds[is_outside] = seeds[is_outside[is_valid]]
 
-        # find object point with closest manhattan distance to center of mass
-        pts = obj_props[i].coords
+        sel = is_outside[segment_ids]
+        pt_ids, pt_rows, pt_cols = \
+            segment_ids[sel], obj_rows[sel], obj_cols[sel]
 
-        ydist = np.abs(pts[:, 0] - sy)
-        xdist = np.abs(pts[:, 1] - sx)
+        dist = np.abs(pt_rows - outside_seeds[pt_ids, 0]) + \
+            np.abs(pt_cols - outside_seeds[pt_ids, 1])
 
-        seeds[i, :] = pts[np.argmin(xdist + ydist), :]
+        order = np.lexsort((dist, pt_ids))
+        nearest = order[np.r_[True, np.diff(pt_ids[order]) != 0]]
 
-        assert im_label[seeds[i, 0], seeds[i, 1]] == obj_props[i].label
+        seeds[is_outside[is_valid]] = np.stack([pt_rows[nearest],
+                                                pt_cols[nearest]], 1)
 
     # get seed responses
     max_response = im_response[seeds[:, 0], seeds[:, 1]]
 
     # set label of each foreground pixel to the label of its nearest peak
-    im_label_flat = im_label.ravel()
-
     pind = np.flatnonzero(im_fgnd_mask)
 
     mind_flat = mind.ravel()
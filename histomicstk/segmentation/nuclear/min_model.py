@@ -6,6 +6,8 @@ import scipy.ndimage.morphology as mp
 import skimage.morphology as mo
 from skimage.draw import polygon
 
+from ._min_model_cython import _trace_contours_cython
+
 
 def min_model(I, Delta=0.3, MaxLength=255, Compaction=3,
               MinArea=100, MinWidth=5, MinDepth=2, MinConcavity=np.inf):
@@ -76,20 +78,19 @@ def min_model(I, Delta=0.3, MaxLength=255, Compaction=3,
     X, Y, Min, Max = seed_contours(I, Delta)
 
     # trace contours from seeds
-    cXs, cYs = trace_contours(I, X, Y, Min, Max, MaxLength=255)
+    cX, cY, Offsets = trace_contours(I, X, Y, Min, Max, MaxLength=MaxLength)
 
     # score successfully traced contours
-    Scores = score_contours(I, cXs, cYs)
+    Scores = score_contours(I, cX, cY, Offsets)
 
     # construct label image from scored contours
-    Label = label_contour(I.shape, cXs, cYs, Scores)
+    Label = label_contour(I.shape, cX, cY, Offsets, Scores)
 
     # compact contours to remove spurs - the paper calls this "optimization"
     Label = label.compact(Label, Compaction)
 
     # cleanup label image
-    Label = label.split(Label)
-    Label = label.area_open(Label, MinArea)
+    Label = label.cleanup(Label, min_area=MinArea)
     Label = label.width_open(Label, MinWidth)
 
     # split objects with concavities
@@ -147,104 +148,76 @@ def seed_contours(I, Delta=0.3):
 
     """
 
-    # initialize outputs
-    X = []
-    Y = []
-    Min = []
-    Max = []
-
-    # for each image row
-    for i in np.arange(I.shape[0]):
-
-        # calculate gradient
-        Gradient = np.hstack((np.nan, I[i, 2:] - I[i, 0:-2], np.nan))
-
-        # identify local maxima and minimia of row 'i' of 'I'
-        Maxima = ((I[i, 1:-1] >= I[i, 0:-2]) &
-                  (I[i, 1:-1] > I[i, 2:])).nonzero()[0] + 1
-        Minima = ((I[i, 1:-1] < I[i, 0:-2]) &
-                  (I[i, 1:-1] <= I[i, 2:])).nonzero()[0] + 1
-
-        # identify transitions - start of intervals of monotonic non-increase
-        dI = np.sign(I[i, 1:] - I[i, 0:-1])
-        dI = np.hstack((dI, dI[-1]))
-        Transitions = np.nonzero(dI == 1)[0]
-        Transitions = np.hstack((Transitions, I.shape[1]-1))
-
-        # define min/max neighbor pairs
-        MinPair = []
-        MaxPair = []
-        if(Minima.size > 0) & (Maxima.size > 0):
-
-            # initialize initial positions of min/max & transition indices
-            MinPos = 0
-            MaxPos = 0
-            TranPos = 0
-
-            # iterate through maxima, identifying relevant minima for each
-            while MaxPos < Maxima.size:
-                Index = np.nonzero(Minima > Maxima[MaxPos])[0]
-                if Index.size:  # minima found beyond current maxima
-
-                    # get position of next minimum in array 'Minima'
-                    MinPos = Index[0]
-
-                    # increment transition point to beyond current maxima
-                    while ((TranPos < Transitions.size) &
-                           (Transitions[TranPos] < Maxima[MaxPos])):
-                        TranPos += 1
-
-                    # add minima to current maxima until transition is reached
-                    while Minima[MinPos] <= Transitions[TranPos]:
-                        MinPair.append(Minima[MinPos])
-                        MaxPair.append(Maxima[MaxPos])
-                        MinPos += 1
-                        if(MinPos == Minima.size):
-                            break
-
-                    # increment maxima
-                    MaxPos += 1
-
-                else:  # no minima beyond current maxima - quit
-                    break
-
-        # convert maxima/minima pairs to numpy arrays
-        Maxima = np.asarray(MaxPair)
-        Minima = np.asarray(MinPair)
-
-        # remove pairs that do not have at least one pixel between them
-        Close = ((Minima - Maxima) < 2).nonzero()
-        Maxima = np.delete(Maxima, Close)
-        Minima = np.delete(Minima, Close)
-
-        # remove pairs that do not have sufficient intensity transitions
-        if(Delta is not None):
-            if np.issubdtype(I.dtype, np.integer):
-                Range = Delta * 255.0
-            elif np.issubdtype(I.dtype, np.float):
-                Range = Delta * 1.0
-            Shallow = ((I[i, Maxima] - I[i, Minima] < Range)).nonzero()
-            Maxima = np.delete(Maxima, Shallow)
-            Minima = np.delete(Minima, Shallow)
-
-        # identify max gradient locations within paired maxima/minima
-        MinGrad = np.zeros(Maxima.shape, dtype=int)
-        for j in np.arange(Maxima.size):
-            MinGrad[j] = np.argmin(Gradient[Maxima[j]+1:Minima[j]]) + \
-                Maxima[j]+1
-
-        # capture min, max values and add to list with seed coordinates
-        if(Maxima.size > 0):
-            X.extend(MinGrad)
-            Y.extend(i * np.ones((Maxima.size)))
-            Min.extend(I[i, Minima])
-            Max.extend(I[i, MinGrad])
-
-    # convert outputs from lists to numpy arrays
-    X = np.array(X, dtype=np.uint)
-    Y = np.array(Y, dtype=np.uint)
-    Min = np.array(Min, dtype=I.dtype)
-    Max = np.array(Max, dtype=I.dtype)
+    im = np.asarray(I)
+
+    num_cols = im.shape[1]
+
+    # calculate gradient along rows
+    Gradient = im[:, 2:] - im[:, 0:-2]
+
+    # identify local maxima and minima of each row of 'im'
+    Maxima = np.nonzero((im[:, 1:-1] >= im[:, 0:-2]) &
+                        (im[:, 1:-1] > im[:, 2:]))
+    Minima = np.nonzero((im[:, 1:-1] < im[:, 0:-2]) &
+                        (im[:, 1:-1] <= im[:, 2:]))
+
+    # identify transitions - start of intervals of monotonic non-increase,
+    # the last pixel of each row ending the last interval
+    dI = np.sign(im[:, 1:] - im[:, 0:-1])
+    dI = np.hstack((dI, np.ones_like(dI[:, -1:])))
+    Transitions = np.flatnonzero(dI == 1)
+
+    # positions of maxima and minima in the flattened image
+    MaxFlat = Maxima[0] * num_cols + Maxima[1] + 1
+    MinFlat = Minima[0] * num_cols + Minima[1] + 1
+
+    # pair each maximum with the minima following it up to the next
+    # transition, which is in the same row
+    Next = Transitions[np.searchsorted(Transitions, MaxFlat)]
+
+    First = np.searchsorted(MinFlat, MaxFlat, side='right')
+    Last = np.searchsorted(MinFlat, Next, side='right')
+
+    Counts = Last - First
+    MaxFlat = np.repeat(MaxFlat, Counts)
+    MinFlat = MinFlat[np.arange(Counts.sum()) +
+                      np.repeat(First - np.cumsum(Counts) + Counts, Counts)]
+
+    Rows = MaxFlat // num_cols
+    Maxima = MaxFlat % num_cols
+    Minima = MinFlat % num_cols
+
+    # remove pairs that do not have at least one pixel between them
+    Keep = (Minima - Maxima) >= 2
+
+    # remove pairs that do not have sufficient intensity transitions
+    if(Delta is not None):
+        if np.issubdtype(im.dtype, np.integer):
+            Range = Delta * 255.0
+        elif np.issubdtype(im.dtype, np.floating):
+            Range = Delta * 1.0
+        Keep &= ~(im[Rows, Maxima] - im[Rows, Minima] < Range)
+
+    Rows = Rows[Keep]
+    Maxima = Maxima[Keep]
+    Minima = Minima[Keep]
+
+    # identify max gradient locations within paired maxima/minima, the
+    # first one for ties
+    Lengths = Minima - Maxima - 1
+    Pair = np.repeat(np.arange(len(Rows)), Lengths)
+    Cols = np.arange(Lengths.sum()) + \
+        np.repeat(Maxima + 1 - np.cumsum(Lengths) + Lengths, Lengths)
+
+    Order = np.lexsort((Cols, Gradient[Rows[Pair], Cols - 1], Pair))
+    Starts = np.cumsum(Lengths) - Lengths
+    MinGrad = Cols[Order[Starts]]
+
+    # seed coordinates, min and max values
+    X = MinGrad.astype(np.uint)
+    Y = Rows.astype(np.uint)
+    Min = im[Rows, Minima].astype(im.dtype)
+    Max = im[Rows, MinGrad].astype(im.dtype)
 
     # return seed pixels positions and intensity range intervals
     return X, Y, Min, Max
@@ -275,17 +248,23 @@ def trace_contours(I, X, Y, Min, Max, MaxLength=255):
 
     Notes
     -----
-    Can be computationally expensive for large numbers of contours. Use
-    smoothing and delta thresholding when seeding contours to reduce burden.
+    Seeds are traced in order with the 4-connected improved simple boundary
+    follower, within a window of size MaxLength around each seed. Contours
+    that are not closed or are longer than MaxLength are discarded, and seeds
+    lying on a contour that was kept are not traced. Use smoothing and delta
+    thresholding when seeding contours to reduce burden.
 
     Returns
     -------
-    cXs : list
-        A list of 1D numpy arrays defining the horizontal coordinates of object
-        boundaries.
-    cYs : list
-        A list of 1D numpy arrays defining the vertical coordinates of object
-        boundaries.
+    cX : array_like
+        A 1D array of the horizontal coordinates of the boundaries of all
+        objects. Each boundary is closed by repeating its first point.
+    cY : array_like
+        A 1D array of the vertical coordinates of the boundaries of all
+        objects.
+    Offsets : array_like
+        A 1D array such that the boundary of the i-th object is
+        cX[Offsets[i]:Offsets[i+1]], cY[Offsets[i]:Offsets[i+1]].
 
     See Also
     --------
@@ -299,53 +278,19 @@ def trace_contours(I, X, Y, Min, Max, MaxLength=255):
 
     """
 
-    # initialize list of lists containing contours
-    cXs = []
-    cYs = []
-
-    # process each seed pixel sequentially
-    for i in np.arange(X.size):
-
-        # capture window surrounding (X[i], Y[i])
-        W = I[max(0, Y[i]-np.ceil(MaxLength/2.0)):
-              min(I.shape[0]+1, Y[i]+np.ceil(MaxLength/2.0)+1),
-              max(0, X[i]-np.ceil(MaxLength/2.0)):
-              min(I.shape[1]+1, X[i]+np.ceil(MaxLength/2.0))+1]
-
-        # binary threshold corresponding to seed pixel 'i'
-        W = (W <= Max[i]) & (W >= Min[i])
-
-        # embed with center pixel in middle of padded window
-        Embed = np.zeros((W.shape[0]+2, W.shape[1]+2), dtype=np.bool)
-        Embed[1:-1, 1:-1] = W
+    # trace all seeds in a single compiled pass
+    cX, cY, Offsets = _trace_contours_cython(
+        np.ascontiguousarray(I, dtype=np.float64),
+        np.ascontiguousarray(X, dtype=np.int64),
+        np.ascontiguousarray(Y, dtype=np.int64),
+        np.ascontiguousarray(Min, dtype=np.float64),
+        np.ascontiguousarray(Max, dtype=np.float64),
+        int(MaxLength))
 
-        # calculate location of (X[i], Y[i]) in 'Embed'
-        pX = X[i] - max(0, X[i]-np.ceil(MaxLength/2.0)) + 1
-        pY = Y[i] - max(0, Y[i]-np.ceil(MaxLength/2.0)) + 1
+    return cX, cY, Offsets
 
-        # trace boundary, check stopping condition, append to list of contours
-        cX, cY = label.trace_object_boundaries(Embed, conn=4,
-                                               x_start=pX, y_start=pY,
-                                               MaxLength=MaxLength)
-        if cX[0][0] == cX[0][-1] and cY[0][0] == cY[0][-1] and\
-                len(cX[0]) <= MaxLength:
 
-            # add window offset to contour coordinates
-            cX[0] = [
-                x + max(0, X[i]-np.ceil(MaxLength/2.0)) - 1 for x in cX[0]
-            ]
-            cY[0] = [
-                y + max(0, Y[i]-np.ceil(MaxLength/2.0)) - 1 for y in cY[0]
-            ]
-
-            # append to list of candidate contours
-            cXs.append(np.array(cX[0], dtype=np.uint32))
-            cYs.append(np.array(cY[0], dtype=np.uint32))
-
-    return cXs, cYs
-
-
-def score_contours(I, cXs, cYs):
+def score_contours(I, cX, cY, Offsets):
     """Scores boundary contours using gradient information. Implemented from
     the reference below. Each contour is weighted by the average gradient and
     number of local gradient maxima along its path.
@@ -355,12 +300,15 @@ def score_contours(I, cXs, cYs):
     I : array_like
         An intensity image used for analyzing local minima/maxima and
         gradients. Dimensions M x N.
-    cXs : list
-        A list of 1D numpy arrays defining the horizontal coordinates of object
-        boundaries.
-    cYs : list
-        A list of 1D numpy arrays defining the vertical coordinates of object
-        boundaries.
+    cX : array_like
+        A 1D array of the horizontal coordinates of the boundaries of all
+        objects.
+    cY : array_like
+        A 1D array of the vertical coordinates of the boundaries of all
+        objects.
+    Offsets : array_like
+        A 1D array such that the boundary of the i-th object is
+        cX[Offsets[i]:Offsets[i+1]], cY[Offsets[i]:Offsets[i+1]].
 
     Notes
     -----
@@ -369,8 +317,7 @@ def score_contours(I, cXs, cYs):
     Returns
     -------
     Scores : array_like
-        A 1D array of horizontal coordinates of contour seed pixels for
-        tracing.
+        A 1D array of the scores of the contours.
 
     See Also
     --------
@@ -384,8 +331,11 @@ def score_contours(I, cXs, cYs):
 
     """
 
-    # initialize output
-    Scores = np.zeros((len(cXs)))
+    # number of points of each contour
+    Counts = np.diff(Offsets)
+
+    if not len(Counts):
+        return np.zeros(0)
 
     # generate Sobel filter response from input intensity image 'I'
     Gradients = ft.sobel(I, mode='mirror')
@@ -393,26 +343,23 @@ def score_contours(I, cXs, cYs):
     # generate local max in 3 x 3 window of Gradients
     Maxima = ft.maximum_filter(Gradients, size=3, mode='mirror')
 
-    # generate score for each contour
-    for i in np.arange(len(cXs)):
-
-        # get gradient pixels, local max gradient pixels
-        cG = Gradients[cYs[i], cXs[i]]
-        cMax = Maxima[cYs[i], cXs[i]]
+    # get gradient pixels, local max gradient pixels of all contours
+    cG = Gradients[cY, cX]
+    cMax = Maxima[cY, cX]
 
-        # calculate mean gradient
-        MG = np.sum(np.abs(Gradients[cYs[i], cXs[i]])) / len(cXs[i])
+    # calculate mean gradient
+    MG = np.add.reduceat(np.abs(cG), Offsets[:-1]) / Counts
 
-        # calculate gradient fit
-        GF = np.sum(cG == cMax) / len(cXs[i])
+    # calculate gradient fit
+    GF = np.add.reduceat(cG == cMax, Offsets[:-1]) / Counts
 
-        # compute score as product of mean gradient and gradient fit
-        Scores[i] = MG * GF
+    # compute score as product of mean gradient and gradient fit
+    Scores = MG * GF
 
     return Scores
 
 
-def label_contour(Shape, cXs, cYs, Scores):
+def label_contour(Shape, cX, cY, Offsets, Scores):
     """Constructs a label image from scored contours. Masks for contours with
     low priority/score are placed first into the label image and then are
     overwritten by higher priority contours.
@@ -421,15 +368,18 @@ def label_contour(Shape, cXs, cYs, Scores):
     ----------
     Shape : tuple
         The shape tuple of the desired label image (height, width).
-    cXs : list
-        A list of 1D numpy arrays defining the horizontal coordinates of object
-        boundaries.
-    cYs : list
-        A list of 1D numpy arrays defining the vertical coordinates of object
-        boundaries.
+    cX : array_like
+        A 1D array of the horizontal coordinates of the boundaries of all
+        objects.
+    cY : array_like
+        A 1D array of the vertical coordinates of the boundaries of all
+        objects.
+    Offsets : array_like
+        A 1D array such that the boundary of the i-th object is
+        cX[Offsets[i]:Offsets[i+1]], cY[Offsets[i]:Offsets[i+1]].
     Scores : array_like
-        A 1D array of horizontal coordinates of contour seed pixels for
-        tracing.
+        A 1D array of the scores of the contours, as produced by
+        `score_contours`, determining the order in which they are placed.
 
     Notes
     -----
@@ -460,23 +410,25 @@ def label_contour(Shape, cXs, cYs, Scores):
     # sort contours by scores
     Order = np.argsort(Scores)
 
-    # loop over sorted contours, from least to most prominently scores
-    for i in np.arange(len(cXs)):
+    # bounding boxes of contours
+    Starts = Offsets[:-1]
+    xMin = np.minimum.reduceat(cX, Starts) if len(cX) else Starts
+    xMax = np.maximum.reduceat(cX, Starts) if len(cX) else Starts
+    yMin = np.minimum.reduceat(cY, Starts) if len(cY) else Starts
+    yMax = np.maximum.reduceat(cY, Starts) if len(cY) else Starts
 
-        # get limits on contour
-        xMin = np.min(cXs[Order[i]])
-        xMax = np.max(cXs[Order[i]])
-        yMin = np.min(cYs[Order[i]])
-        yMax = np.max(cYs[Order[i]])
+    # loop over sorted contours, from least to most prominently scores
+    for i, j in enumerate(Order):
 
         # extract portion of existing label image
-        T = Label[yMin:yMax+1, xMin:xMax+1]
+        T = Label[yMin[j]:yMax[j]+1, xMin[j]:xMax[j]+1]
 
-        # generate mask for object 'Order[i]' from polygon
-        Mask = polygon(cYs[Order[i]]-yMin, cXs[Order[i]]-xMin, T.shape)
+        # generate mask for object 'j' from polygon
+        Mask = polygon(cY[Offsets[j]:Offsets[j+1]] - yMin[j],
+                       cX[Offsets[j]:Offsets[j+1]] - xMin[j], T.shape)
 
-        # replace non-zero areas with value 'i'
-        T[Mask] = i
+        # replace non-zero areas with value 'i + 1'
+        T[Mask] = i + 1
 
     return Label
 
@@ -555,7 +507,13 @@ def split_concavities(Label, MinDepth=4, MinConcavity=np.inf):  # noqa: C901
         Hull = mo.convex_hull_image(Mask)
 
         # generate boundary coordinates, trim duplicate point
-        X, Y = label.trace_object_boundaries(Mask, conn=8)
+        Y, X = label.trace_object_boundaries(Mask, conn=8)
+
+        # skip objects without a boundary, e.g. lines removed as spurs
+        if not len(X):
+            i = i + 1
+            continue
+
         X = np.array(X[0][:-1], dtype=np.uint32)
         Y = np.array(Y[0][:-1], dtype=np.uint32)
 
@@ -7,6 +7,7 @@ import large_image
 import numpy as np
 
 from ..preprocessing.color_conversion import rgb_to_hsi
+from ..utils.tile_source_pool import get_tile_source
 
 
 # This can be an enum in Python >= 3.4
@@ -133,7 +134,7 @@ def _combine(results):
 
 
 def _count_tiles(slide_path, params, kwargs, position, count):
-    ts = large_image.getTileSource(slide_path)
+    ts = get_tile_source(slide_path)
     lpotf = len(OutputTotals._fields)
     total = [0] * lpotf
     for pos in range(position, position + count):
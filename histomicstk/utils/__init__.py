@@ -5,6 +5,7 @@ all other sub-packages of histomicstk
 
 # make functions available at the package level using shadow imports
 # since we mostly have one function per file
+from .artifact_cache import ArtifactCache
 from .compute_tile_foreground_fraction import compute_tile_foreground_fraction
 from .convert_image_to_matrix import convert_image_to_matrix
 from .convert_matrix_to_image import convert_matrix_to_image
@@ -16,6 +17,9 @@ from .hessian import hessian
 from .merge_colinear import merge_colinear
 from .fit_poisson_mixture import fit_poisson_mixture
 from .simple_mask import simple_mask
+from .tile_source_pool import get_tile_source
+from .tile_source_pool import set_tile_source_pool_size
+from .tile_source_pool import tile_source_pool_info
 from .sample_pixels import sample_pixels  # must import after SimpleMask
 # from .manage_skin import parse_filename
 from . import general_utils
@@ -25,6 +29,7 @@ from . import girder_convenience_utils
 __all__ = (
 
     # functions and classes of this package
+    'ArtifactCache',
     'compute_tile_foreground_fraction',
     'convert_matrix_to_image',
     'convert_image_to_matrix',
@@ -35,8 +40,11 @@ __all__ = (
     'hessian',
     'merge_colinear',
     'fit_poisson_mixture',
+    'get_tile_source',
     'sample_pixels',
+    'set_tile_source_pool_size',
     'simple_mask',
+    'tile_source_pool_info',
     'general_utils',
     'girder_convenience_utils',
 #     'parse_filename',
@@ -0,0 +1,189 @@
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+
+import numpy as np
+
+
+def _get_key(obj):
+
+    # JSON-serializable identity of the parameters json cannot serialize
+    if isinstance(obj, np.ndarray):
+        obj = np.ascontiguousarray(obj)
+        return [obj.dtype.str, obj.shape,
+                hashlib.sha256(obj.view(np.uint8)).hexdigest()]
+
+    if isinstance(obj, np.generic):
+        return obj.item()
+
+    return str(obj)
+
+
+class ArtifactCache(object):
+    """A persistent, content-addressed on-disk cache of per-slide artifacts.
+
+    Artifacts such as the low-res foreground mask, the tile foreground
+    fractions or the Reinhard color statistics of a slide only depend on the
+    slide and a few parameters, so they can be reused across runs that vary
+    other (e.g. segmentation) parameters. Each artifact is stored in a file
+    named after a hash of the slide identity, the artifact name, the version
+    of the code computing it and its parameters. The least recently used
+    artifacts are evicted when the total size of the cache exceeds
+    `max_size`.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Directory in which artifacts are stored. It is created if needed.
+    max_size : int, optional
+        Maximum total size of the cache in bytes. Default value = 1 GiB.
+    hash_contents : bool, optional
+        If True, slides are identified by a hash of their contents, which
+        survives copying and renaming but requires reading the whole file.
+        Otherwise the absolute path, size and modification time are used.
+        Default value = False.
+
+    """
+
+    def __init__(self, cache_dir, max_size=1024 ** 3, hash_contents=False):
+
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.hash_contents = hash_contents
+        self._slide_ids = {}
+
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def get_or_compute(self, slide_path, name, version, params, func, *args,
+                       **kwargs):
+        """Get an artifact of a slide from the cache, computing and storing it
+        if it is not present.
+
+        Parameters
+        ----------
+        slide_path : str
+            path to the slide the artifact was derived from
+        name : str
+            name of the artifact, e.g. 'reinhard_stats'
+        version : int or str
+            version of the code computing the artifact, which must change
+            whenever its result changes so that artifacts computed by older
+            code are not returned
+        params : dict
+            JSON-serializable parameters the artifact depends on, which
+            should include all arguments of func other than the slide.
+            Arrays are identified by a hash of their contents.
+        func : callable
+            function computing the artifact, called as
+            ``func(*args, **kwargs)`` on a cache miss
+
+        Returns
+        -------
+        artifact :
+            The cached or newly computed artifact.
+
+        """
+        path = self._get_artifact_path(slide_path, name, version, params)
+
+        try:
+            with open(path, 'rb') as fptr:
+                artifact = pickle.load(fptr)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            pass
+        else:
+            # record the hit for least recently used eviction
+            try:
+                os.utime(path, None)
+            except OSError:
+                pass
+            return artifact
+
+        artifact = func(*args, **kwargs)
+
+        self._store(path, artifact)
+
+        return artifact
+
+    def clear(self):
+        """Remove all artifacts from the cache."""
+
+        for path, _, _ in self._list_artifacts():
+            os.remove(path)
+
+    def _get_slide_id(self, slide_path):
+
+        stat = os.stat(slide_path)
+        key = (os.path.abspath(slide_path), stat.st_size, stat.st_mtime)
+
+        if not self.hash_contents:
+            return list(key)
+
+        if key not in self._slide_ids:
+            sha = hashlib.sha256()
+            with open(slide_path, 'rb') as fptr:
+                for chunk in iter(lambda: fptr.read(1024 ** 2), b''):
+                    sha.update(chunk)
+            self._slide_ids[key] = sha.hexdigest()
+
+        return self._slide_ids[key]
+
+    def _get_artifact_path(self, slide_path, name, version, params):
+
+        key = json.dumps(
+            [self._get_slide_id(slide_path), name, version, params],
+            sort_keys=True, default=_get_key)
+
+        digest = hashlib.sha256(key.encode('utf8')).hexdigest()
+
+        return os.path.join(self.cache_dir, '%s-%s.pkl' % (name, digest))
+
+    def _store(self, path, artifact):
+
+        # write atomically so that concurrent runs never see partial files
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fptr:
+                pickle.dump(artifact, fptr, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
+        self._evict()
+
+    def _list_artifacts(self):
+
+        artifacts = []
+
+        for fname in os.listdir(self.cache_dir):
+            if not fname.endswith('.pkl'):
+                continue
+            path = os.path.join(self.cache_dir, fname)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            artifacts.append((path, stat.st_size, stat.st_mtime))
+
+        return artifacts
+
+    def _evict(self):
+
+        artifacts = sorted(self._list_artifacts(), key=lambda a: a[2])
+
+        total_size = sum(size for _, size, _ in artifacts)
+
+        for path, size, _ in artifacts:
+
+            if total_size <= self.max_size:
+                break
+
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+            total_size -= size
@@ -1,8 +1,18 @@
+from collections import OrderedDict
+import hashlib
+import json
+import os
+
 import numpy as np
-import dask
-import dask.distributed
 
-import large_image
+from .tile_source_pool import get_tile_source
+
+
+# cache of the foreground fractions of all tiles of recently seen slides; it
+# lives as long as the process, but holds only one float per tile for at most
+# `_tile_fgnd_frac_cache_size` slides, evicting the least recently used one
+_tile_fgnd_frac_cache = OrderedDict()
+_tile_fgnd_frac_cache_size = 16
 
 
 def compute_tile_foreground_fraction(slide_path, im_fgnd_mask_lres,
@@ -39,45 +49,57 @@ def compute_tile_foreground_fraction(slide_path, im_fgnd_mask_lres,
         is set to None, then a 1D array containing the foreground fraction of
         all tiles will be returned.
 
+    Notes
+    -----
+    No tile pixels are read: the low-res window of each tile is derived from
+    the geometry of the tile grid and all fractions are computed from a
+    single summed-area table of `im_fgnd_mask_lres`. The result for all tiles
+    is cached in memory per slide, mask, scale and `it_kwargs` for the 16
+    most recently used combinations.
+
     """
 
     if tile_position is None:
 
-        # get slide tile source
-        ts = large_image.getTileSource(slide_path)
-
-        num_tiles = ts.getSingleTile(**it_kwargs)['iterator_range']['position']
+        cache_key = _get_cache_key(slide_path, im_fgnd_mask_lres,
+                                   fgnd_seg_scale, it_kwargs)
 
-        # broadcasting fgnd mask to all dask workers
-        try:
-            c = dask.distributed.get_client()
+        if cache_key in _tile_fgnd_frac_cache:
+            _tile_fgnd_frac_cache.move_to_end(cache_key)
+            return _tile_fgnd_frac_cache[cache_key].copy()
 
-            [im_fgnd_mask_lres] = c.scatter([im_fgnd_mask_lres],
-                                            broadcast=True)
-        except ValueError:
-            pass
+        # get slide tile source
+        ts = get_tile_source(slide_path)
 
-        # compute tile foreground fraction in parallel
-        tile_fgnd_frac = []
+        # get the geometry of all tiles without reading their pixels
+        tile_bounds = {}
 
-        for tile_position in range(num_tiles):
+        for tile in ts.tileIterator(**it_kwargs):
+            tile_bounds[tile['tile_position']['position']] = (
+                tile['gx'], tile['gy'], tile['gwidth'], tile['gheight'])
 
-            tile_fgnd_frac.append(
-                dask.delayed(_compute_tile_foreground_fraction_single)(
-                    slide_path, im_fgnd_mask_lres, fgnd_seg_scale,
-                    it_kwargs, tile_position
-                ))
+        tile_bounds = np.array([tile_bounds[i]
+                                for i in range(len(tile_bounds))],
+                               dtype=np.float64).reshape(-1, 4)
 
-        tile_fgnd_frac = dask.delayed(tile_fgnd_frac).compute()
+        tile_fgnd_frac = _compute_region_foreground_fraction(
+            ts, im_fgnd_mask_lres, fgnd_seg_scale, tile_bounds)
 
-        tile_fgnd_frac = np.array(tile_fgnd_frac)
+        _tile_fgnd_frac_cache[cache_key] = tile_fgnd_frac.copy()
+        while len(_tile_fgnd_frac_cache) > _tile_fgnd_frac_cache_size:
+            _tile_fgnd_frac_cache.popitem(last=False)
 
     elif np.isscalar(tile_position):
 
-        tile_fgnd_frac = _compute_tile_foreground_fraction_single(
-            slide_path, im_fgnd_mask_lres, fgnd_seg_scale,
-            it_kwargs, tile_position
-        )
+        ts = get_tile_source(slide_path)
+
+        tile = ts.getSingleTile(tile_position=tile_position, **it_kwargs)
+
+        tile_fgnd_frac = _compute_region_foreground_fraction(
+            ts, im_fgnd_mask_lres, fgnd_seg_scale,
+            np.array([[tile['gx'], tile['gy'],
+                       tile['gwidth'], tile['gheight']]], dtype=np.float64)
+        )[0]
 
     else:
 
@@ -87,40 +109,112 @@ def compute_tile_foreground_fraction(slide_path, im_fgnd_mask_lres,
     return tile_fgnd_frac
 
 
-def _compute_tile_foreground_fraction_single(slide_path, im_fgnd_mask_lres,
-                                             fgnd_seg_scale, it_kwargs,
-                                             tile_position):
+def _get_cache_key(slide_path, im_fgnd_mask_lres, fgnd_seg_scale, it_kwargs):
 
-    # get slide tile source
-    ts = large_image.getTileSource(slide_path)
+    try:
+        mtime = os.path.getmtime(slide_path)
+    except (OSError, TypeError):
+        mtime = None
 
-    # get requested tile
-    tile = ts.getSingleTile(tile_position=tile_position,
-                            format=large_image.tilesource.TILE_FORMAT_NUMPY,
-                            **it_kwargs)
+    im_fgnd_mask_lres = np.asarray(im_fgnd_mask_lres)
+    mask_digest = hashlib.sha1(
+        np.packbits(im_fgnd_mask_lres != 0)).hexdigest()
 
-    # get current region in base_pixels
-    rgn_hres = {'left': tile['gx'], 'top': tile['gy'],
-                'right': tile['gx'] + tile['gwidth'],
-                'bottom': tile['gy'] + tile['gheight'],
-                'units': 'base_pixels'}
+    return (slide_path, mtime, im_fgnd_mask_lres.shape, mask_digest,
+            json.dumps(fgnd_seg_scale, sort_keys=True, default=str),
+            json.dumps(it_kwargs, sort_keys=True, default=str))
 
-    # get foreground mask for current tile at low resolution
-    rgn_lres = ts.convertRegionScale(rgn_hres,
-                                     targetScale=fgnd_seg_scale,
-                                     targetUnits='mag_pixels')
 
-    top = np.int(rgn_lres['top'])
-    bottom = np.int(rgn_lres['bottom'])
-    left = np.int(rgn_lres['left'])
-    right = np.int(rgn_lres['right'])
+def _compute_region_foreground_fraction(ts, im_fgnd_mask_lres,
+                                        fgnd_seg_scale, bounds):
+    """Compute the foreground fraction of many regions at once.
 
-    im_tile_fgnd_mask_lres = im_fgnd_mask_lres[top:bottom, left:right]
+    `bounds` is an N x 4 array of left, top, width and height of regions in
+    base pixels.
 
-    # compute foreground fraction
-    tile_fgnd_frac = im_tile_fgnd_mask_lres.mean()
+    """
+    top, bottom, left, right = _get_region_windows_lres(
+        ts, im_fgnd_mask_lres, fgnd_seg_scale, bounds).T
 
-    if np.isnan(tile_fgnd_frac):
-        tile_fgnd_frac = 0
+    height, width = np.shape(im_fgnd_mask_lres)[:2]
 
-    return tile_fgnd_frac
+    # summed-area table of the mask
+    sat = np.zeros((height + 1, width + 1), dtype=np.int64)
+    np.cumsum(np.cumsum(np.asarray(im_fgnd_mask_lres) != 0, axis=0),
+              axis=1, out=sat[1:, 1:])
+
+    num_fgnd = (sat[bottom, right] - sat[top, right] -
+                sat[bottom, left] + sat[top, left])
+
+    num_pixels = np.maximum(bottom - top, 0) * np.maximum(right - left, 0)
+
+    fgnd_frac = np.zeros(len(bounds))
+    nonempty = num_pixels > 0
+    fgnd_frac[nonempty] = num_fgnd[nonempty] / num_pixels[nonempty].astype(
+        np.float64)
+
+    return fgnd_frac
+
+
+def _get_region_windows_lres(ts, im_fgnd_mask_lres, fgnd_seg_scale, bounds):
+    """Get the windows of many regions in a low-res mask.
+
+    `bounds` is an N x 4 array of left, top, width and height of regions in
+    base pixels. Returns an N x 4 array of top, bottom, left and right
+    slicing bounds in the mask.
+
+    """
+    metadata = ts.getMetadata()
+
+    left, right = _convert_extents_lres(
+        ts, metadata, fgnd_seg_scale, bounds[:, 0], bounds[:, 2], 'x')
+    top, bottom = _convert_extents_lres(
+        ts, metadata, fgnd_seg_scale, bounds[:, 1], bounds[:, 3], 'y')
+
+    # clip windows the same way numpy slicing does
+    height, width = np.shape(im_fgnd_mask_lres)[:2]
+    left, right = np.clip(left, 0, width), np.clip(right, 0, width)
+    top, bottom = np.clip(top, 0, height), np.clip(bottom, 0, height)
+
+    return np.stack([top, bottom, left, right], axis=1)
+
+
+def _convert_extents_lres(ts, metadata, fgnd_seg_scale, starts, sizes, axis):
+    """Convert the horizontal or vertical extents of many regions from base
+    pixels to low-res mask pixels.
+
+    The extents of a region along each axis are converted independently of
+    each other, and the tiles of a grid share only a few distinct columns
+    and rows, so each distinct extent is converted once with
+    `convertRegionScale` exactly as it was for every tile when slicing the
+    mask one tile at a time.
+
+    """
+    if axis == 'x':
+        start_key, stop_key = 'left', 'right'
+    else:
+        start_key, stop_key = 'top', 'bottom'
+
+    extents, inverse = np.unique(
+        np.stack([starts, starts + sizes], axis=1).reshape(-1, 2),
+        axis=0, return_inverse=True)
+
+    windows = np.zeros((len(extents), 2), dtype=np.int64)
+
+    for i, (start, stop) in enumerate(extents):
+
+        rgn_hres = {'left': 0, 'top': 0,
+                    'right': metadata['sizeX'], 'bottom': metadata['sizeY'],
+                    'units': 'base_pixels'}
+        rgn_hres[start_key] = start
+        rgn_hres[stop_key] = stop
+
+        rgn_lres = ts.convertRegionScale(rgn_hres,
+                                         targetScale=fgnd_seg_scale,
+                                         targetUnits='mag_pixels')
+
+        windows[i] = int(rgn_lres[start_key]), int(rgn_lres[stop_key])
+
+    windows = windows[np.ravel(inverse)]
+
+    return windows[:, 0], windows[:, 1]
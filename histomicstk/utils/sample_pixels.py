@@ -1,15 +1,18 @@
 import dask
 import dask.distributed
 import large_image
-import PIL.Image
 import numpy as np
 
 from .simple_mask import simple_mask
+from .compute_tile_foreground_fraction import (
+    _compute_region_foreground_fraction, _get_region_windows_lres)
+from .tile_source_pool import get_tile_source
 
 
 def sample_pixels(slide_path, sample_fraction=None, magnification=None,
                   tissue_seg_mag=1.25, min_coverage=0.1, background=False,
-                  sample_approximate_total=None, tile_grouping=256):
+                  sample_approximate_total=None, tile_grouping=256,
+                  seed=None):
     """Generates a sampling of pixels from a whole-slide image.
 
     Useful for generating statistics or Reinhard color-normalization or
@@ -39,6 +42,10 @@ def sample_pixels(slide_path, sample_fraction=None, magnification=None,
         sample. The fewer tiles are excluded, the more accurate this will be.
     tile_grouping: int, optional
         Number of tiles to process as part of a single task.
+    seed: int, optional
+        Seed of the random number generator. Set it to get the same sample
+        of pixels on every run regardless of how the computation is
+        distributed. Default value = None.
 
     Returns
     -------
@@ -49,6 +56,10 @@ def sample_pixels(slide_path, sample_fraction=None, magnification=None,
     -----
     If Dask is configured, it is used to distribute the computation.
 
+    Tiles are selected from the low-res foreground mask before any of them is
+    read, and pixels are sampled without replacement unless more samples than
+    foreground pixels are requested.
+
     See Also
     --------
     histomicstk.preprocessing.color_normalization.reinhard
@@ -59,6 +70,33 @@ def sample_pixels(slide_path, sample_fraction=None, magnification=None,
         raise ValueError('Exactly one of sample_fraction and ' +
                          'sample_approximate_total must have a value.')
 
+    sample_pixels = _get_sample_pixels_tasks(
+        slide_path, sample_fraction, magnification, tissue_seg_mag,
+        min_coverage, background, sample_approximate_total, tile_grouping,
+        seed)
+
+    # concatenate pixel values in list
+    if sample_pixels:
+        sample_pixels = (dask.delayed(np.concatenate)(sample_pixels, 0)
+                         .compute())
+    else:
+        print("Sampling could not identify any foreground regions.")
+
+    return sample_pixels
+
+
+def _get_sample_pixels_tasks(slide_path, sample_fraction, magnification,
+                             tissue_seg_mag, min_coverage, background,
+                             sample_approximate_total, tile_grouping, seed,
+                             accumulator=None):
+    """Get the delayed sampling tasks of the tiles of a slide.
+
+    Each task returns the pixels sampled from a group of tiles or, if
+    `accumulator` is given, an instance of it updated with those pixels. All
+    foreground pixels are taken if both `sample_fraction` and
+    `sample_approximate_total` are None.
+
+    """
     ts = large_image.getTileSource(slide_path)
 
     if magnification is None:
@@ -74,13 +112,35 @@ def sample_pixels(slide_path, sample_fraction=None, magnification=None,
 
     # compute foreground mask of whole-slide image at low-res.
     # it will actually be a background mask if background is set.
-    im_fgnd_mask_lres = bool(background) ^ simple_mask(im_lres)
+    im_fgnd_mask_lres = bool(background) ^ simple_mask(im_lres, seed=seed)
 
     if sample_approximate_total is not None:
         scale_ratio = float(magnification) / tissue_seg_mag
         total_fgnd_pixels = np.count_nonzero(im_fgnd_mask_lres) * scale_ratio ** 2
         sample_fraction = sample_approximate_total / total_fgnd_pixels
 
+    # decide which tiles to sample from the low-res mask alone so that only
+    # the tiles with enough coverage are ever read
+    iter_args = dict(scale=dict(magnification=magnification),
+                     format=large_image.tilesource.TILE_FORMAT_NUMPY)
+
+    tile_bounds = {}
+
+    for tile in ts.tileIterator(**iter_args):
+        tile_bounds[tile['tile_position']['position']] = (
+            tile['gx'], tile['gy'], tile['gwidth'], tile['gheight'])
+
+    tile_bounds = np.array([tile_bounds[i] for i in range(len(tile_bounds))],
+                           dtype=np.float64).reshape(-1, 4)
+
+    tile_fgnd_frac = _compute_region_foreground_fraction(
+        ts, im_fgnd_mask_lres, scale_lres, tile_bounds)
+
+    tile_windows_lres = _get_region_windows_lres(
+        ts, im_fgnd_mask_lres, scale_lres, tile_bounds)
+
+    tile_positions = np.flatnonzero(tile_fgnd_frac > min_coverage)
+
     # broadcasting fgnd mask to all dask workers
     try:
         c = dask.distributed.get_client()
@@ -90,88 +150,114 @@ def sample_pixels(slide_path, sample_fraction=None, magnification=None,
     except ValueError:
         pass
 
-    # generate sample pixels
-    sample_pixels = []
+    # generate sample pixels of groups of tiles
+    tasks = []
 
-    iter_args = dict(scale=dict(magnification=magnification),
-                     format=large_image.tilesource.TILE_FORMAT_NUMPY)
+    for i in range(0, len(tile_positions), tile_grouping):
 
-    total_tiles = ts.getSingleTile(**iter_args)['iterator_range']['position']
+        positions = tile_positions[i:i + tile_grouping]
 
-    for position in range(0, total_tiles, tile_grouping):
+        tasks.append(dask.delayed(_sample_pixels_tile)(
+            slide_path, iter_args, positions, tile_windows_lres[positions],
+            sample_fraction, im_fgnd_mask_lres, seed, accumulator))
 
-        sample_pixels.append(dask.delayed(_sample_pixels_tile)(
-            slide_path, iter_args,
-            (position, min(tile_grouping, total_tiles - position)),
-            sample_fraction, tissue_seg_mag, min_coverage,
-            im_fgnd_mask_lres))
+    return tasks
 
-    # concatenate pixel values in list
-    if sample_pixels:
-        sample_pixels = (dask.delayed(np.concatenate)(sample_pixels, 0)
-                         .compute())
-    else:
-        print("Sampling could not identify any foreground regions.")
 
-    return sample_pixels
-
-
-def _sample_pixels_tile(slide_path, iter_args, positions, sample_fraction,
-                        tissue_seg_mag, min_coverage, im_fgnd_mask_lres):
-    start_position, position_count = positions
+def _sample_pixels_tile(slide_path, iter_args, positions, windows_lres,
+                        sample_fraction, im_fgnd_mask_lres, seed=None,
+                        accumulator=None):
     sample_pixels = [np.empty((0, 3))]
-    ts = large_image.getTileSource(slide_path)
-    for position in range(start_position, start_position + position_count):
-        tile = ts.getSingleTile(tile_position=position, **iter_args)
-        # get current region in base_pixels
-        rgn_hres = {'left': tile['gx'], 'top': tile['gy'],
-                    'right': tile['gx'] + tile['gwidth'],
-                    'bottom': tile['gy'] + tile['gheight'],
-                    'units': 'base_pixels'}
-
-        # get foreground mask for current tile at low resolution
-        rgn_lres = ts.convertRegionScale(rgn_hres,
-                                         targetScale={'magnification':
-                                                      tissue_seg_mag},
-                                         targetUnits='mag_pixels')
-
-        top = np.int(rgn_lres['top'])
-        bottom = np.int(rgn_lres['bottom'])
-        left = np.int(rgn_lres['left'])
-        right = np.int(rgn_lres['right'])
+    if accumulator is not None:
+        sample_pixels = accumulator()
+    ts = get_tile_source(slide_path)
+    for position, (top, bottom, left, right) in zip(positions, windows_lres):
+        tile = ts.getSingleTile(tile_position=int(position), **iter_args)
+
+        # get current tile image
+        im_tile = tile['tile'][:, :, :3]
 
         tile_fgnd_mask_lres = im_fgnd_mask_lres[top:bottom, left:right]
 
-        # skip tile if there is not enough foreground in the slide
-        cur_fgnd_frac = tile_fgnd_mask_lres.mean()
+        if sample_fraction is None:
+            # take all foreground pixels
+            rows, cols = _get_upsampling_maps(tile_fgnd_mask_lres.shape,
+                                              im_tile.shape[:2])
+            tile_sample = im_tile[tile_fgnd_mask_lres[rows][:, cols] != 0]
+        else:
+            # one generator per tile so that samples do not depend on how
+            # tiles are grouped into tasks
+            rng = np.random.default_rng(
+                None if seed is None else [seed, int(position)])
 
-        if np.isnan(cur_fgnd_frac) or cur_fgnd_frac <= min_coverage:
-            continue
+            rows, cols = _sample_mask_pixels(
+                tile_fgnd_mask_lres, im_tile.shape[:2], sample_fraction, rng)
 
-        # get current tile image
-        im_tile = tile['tile'][:, :, :3]
+            tile_sample = im_tile[rows, cols]
+
+        # add rgb triplet of sample pixels
+        if accumulator is not None:
+            sample_pixels.update(tile_sample)
+        else:
+            sample_pixels.append(tile_sample)
 
-        # get tile foreground mask at resolution of current tile
-        tile_fgnd_mask = np.array(PIL.Image.fromarray(tile_fgnd_mask_lres).resize(
-            im_tile.shape[:2],
-            resample=PIL.Image.NEAREST
-        ))
+    if accumulator is not None:
+        return sample_pixels
 
-        # generate linear indices of sample pixels in fgnd mask
-        nz_ind = np.nonzero(tile_fgnd_mask.flatten())[0]
+    return np.concatenate(sample_pixels, 0)
 
-        # Handle fractions in the desired sample size by rounding up
-        # or down, weighted by the fractional amount.
-        float_samples = sample_fraction * nz_ind.size
-        num_samples = int(np.floor(float_samples))
-        num_samples += np.random.binomial(1, float_samples - num_samples)
 
-        sample_ind = np.random.choice(nz_ind, num_samples)
+def _get_upsampling_maps(shape_lres, shape):
+    """Get the low-res row and column of each row and column of an image of
+    size `shape` under nearest-neighbor upsampling."""
+    return tuple(((np.arange(size) + 0.5) * size_lres / size).astype(int)
+                 for size_lres, size in zip(shape_lres, shape))
 
-        # convert rgb tile image to Nx3 array
-        tile_pix_rgb = np.reshape(im_tile, (-1, 3))
 
-        # add rgb triplet of sample pixels
-        sample_pixels.append(tile_pix_rgb[sample_ind, :])
+def _sample_mask_pixels(mask_lres, shape, sample_fraction, rng):
+    """Sample pixel coordinates from the foreground of a low-res mask that is
+    upsampled to `shape` with nearest-neighbor interpolation.
 
-    return np.concatenate(sample_pixels, 0)
+    The upsampled mask is never materialized: each low-res pixel covers a
+    rectangular block of pixels, so samples are drawn from a virtual
+    enumeration of the foreground pixels of all blocks and mapped back to
+    row and column coordinates.
+
+    """
+    mask_height, mask_width = mask_lres.shape
+
+    # number of pixels of each low-res row and column after upsampling
+    row_map, col_map = _get_upsampling_maps(mask_lres.shape, shape)
+    row_counts = np.bincount(row_map, minlength=mask_height)
+    col_counts = np.bincount(col_map, minlength=mask_width)
+
+    block_size = (mask_lres != 0) * np.outer(row_counts, col_counts)
+
+    blocks = np.flatnonzero(block_size)
+    block_end = np.cumsum(block_size.flat[blocks])
+    num_fgnd = int(block_end[-1]) if len(block_end) else 0
+
+    # Handle fractions in the desired sample size by rounding up
+    # or down, weighted by the fractional amount.
+    float_samples = sample_fraction * num_fgnd
+    num_samples = int(np.floor(float_samples))
+    num_samples += rng.binomial(1, float_samples - num_samples)
+
+    if num_samples == 0:
+        return np.empty(0, dtype=int), np.empty(0, dtype=int)
+
+    # sample without replacement unless more samples than pixels are asked
+    ind = rng.choice(num_fgnd, num_samples, replace=num_samples > num_fgnd)
+
+    # map indices to blocks and to offsets within blocks
+    k = np.searchsorted(block_end, ind, side='right')
+    offset = ind - (block_end[k] - block_size.flat[blocks[k]])
+    block_row, block_col = np.divmod(blocks[k], mask_width)
+
+    block_width = col_counts[block_col]
+    rows = (np.cumsum(row_counts) - row_counts)[block_row] + \
+        offset // block_width
+    cols = (np.cumsum(col_counts) - col_counts)[block_col] + \
+        offset % block_width
+
+    return rows, cols
@@ -8,7 +8,7 @@ from scipy import signal
 
 def simple_mask(im_rgb, bandwidth=2, bgnd_std=2.5, tissue_std=30,
                 min_peak_width=10, max_peak_width=25,
-                fraction=0.10, min_tissue_prob=0.05):
+                fraction=0.10, min_tissue_prob=0.05, seed=None):
     """Performs segmentation of the foreground (tissue)
     Uses a simple two-component Gaussian mixture model to mask tissue areas
     from background in brightfield H&E images. Kernel-density estimation is
@@ -44,6 +44,9 @@ def simple_mask(im_rgb, bandwidth=2, bgnd_std=2.5, tissue_std=30,
         model. Default value = 0.10.
     min_tissue_prob : double, optional
         Minimum probability to qualify as tissue pixel. Default value = 0.05.
+    seed : int, optional
+        Seed of the random number generator used to sample pixels. The
+        global numpy random state is used if None. Default value = None.
 
     Returns
     -------
@@ -60,7 +63,8 @@ def simple_mask(im_rgb, bandwidth=2, bgnd_std=2.5, tissue_std=30,
     im_rgb = 255 * color.rgb2gray(im_rgb)
     im_rgb = im_rgb.astype(np.uint8)
     num_samples = np.int(fraction * im_rgb.size)
-    sI = np.random.choice(im_rgb.flatten(), num_samples)[:, np.newaxis]
+    rng = np.random if seed is None else np.random.default_rng(seed)
+    sI = rng.choice(im_rgb.flatten(), num_samples)[:, np.newaxis]
 
     # kernel-density smoothed histogram
     KDE = KernelDensity(kernel='gaussian', bandwidth=bandwidth).fit(sI)
@@ -0,0 +1,188 @@
+from collections import OrderedDict, namedtuple
+import os
+import threading
+
+import large_image
+
+
+TileSourcePoolInfo = namedtuple('TileSourcePoolInfo', [
+    'hits',
+    'misses',
+    'evictions',
+    'size',
+    'maxsize',
+])
+
+
+class TileSourcePool(object):
+    """A thread-safe, LRU-bounded pool of open large_image tile sources.
+
+    Tile sources are keyed by the path of the slide and its modification
+    time, so a slide that is rewritten on disk is re-opened rather than
+    served from a stale tile source.
+
+    Parameters
+    ----------
+    maxsize : int, optional
+        Maximum number of tile sources kept open at any given time. The
+        least recently used tile source is evicted when this is exceeded.
+        Default value = 8.
+
+    """
+
+    def __init__(self, maxsize=8):
+
+        if maxsize < 1:
+            raise ValueError('maxsize must be a positive integer')
+
+        self.maxsize = maxsize
+        self._sources = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, slide_path):
+        """Get a tile source for slide_path, opening it if necessary.
+
+        Parameters
+        ----------
+        slide_path : str
+            path to an image or slide
+
+        Returns
+        -------
+        ts : large_image.tilesource.TileSource
+            The tile source of the slide
+
+        """
+        key = _pool_key(slide_path)
+
+        with self._lock:
+            ts = self._sources.get(key)
+            if ts is not None:
+                self._sources.move_to_end(key)
+                self._hits += 1
+                return ts
+            self._misses += 1
+
+        # open outside of the lock so that other slides are not blocked
+        ts = large_image.getTileSource(slide_path)
+
+        with self._lock:
+            self._sources[key] = ts
+            self._sources.move_to_end(key)
+            self._evict()
+
+        return ts
+
+    def resize(self, maxsize):
+        """Change the maximum number of tile sources kept open.
+
+        Parameters
+        ----------
+        maxsize : int
+            Maximum number of tile sources kept open at any given time.
+
+        """
+        if maxsize < 1:
+            raise ValueError('maxsize must be a positive integer')
+
+        with self._lock:
+            self.maxsize = maxsize
+            self._evict()
+
+    def info(self):
+        """Get the hit/miss counters and occupancy of the pool.
+
+        Returns
+        -------
+        info : TileSourcePoolInfo
+            hits, misses, evictions, current size and maximum size of the
+            pool.
+
+        """
+        with self._lock:
+            return TileSourcePoolInfo(
+                hits=self._hits,
+                misses=self._misses,
+                evictions=self._evictions,
+                size=len(self._sources),
+                maxsize=self.maxsize,
+            )
+
+    def clear(self):
+        """Drop all pooled tile sources and reset the counters."""
+        with self._lock:
+            self._sources.clear()
+            self._hits = self._misses = self._evictions = 0
+
+    def _evict(self):
+
+        while len(self._sources) > self.maxsize:
+            self._sources.popitem(last=False)
+            self._evictions += 1
+
+
+def _pool_key(slide_path):
+
+    try:
+        mtime = os.path.getmtime(slide_path)
+    except (OSError, TypeError):
+        mtime = None
+
+    return slide_path, mtime
+
+
+# one pool per process, i.e. per dask worker
+_default_pool = TileSourcePool()
+
+
+def get_tile_source(slide_path):
+    """Get a tile source from the worker-local tile source pool.
+
+    This is meant to be used in place of `large_image.getTileSource` by
+    per-tile tasks so that each worker opens and parses a slide once rather
+    than once per tile.
+
+    Parameters
+    ----------
+    slide_path : str
+        path to an image or slide
+
+    Returns
+    -------
+    ts : large_image.tilesource.TileSource
+        The tile source of the slide
+
+    See Also
+    --------
+    histomicstk.utils.tile_source_pool_info
+
+    """
+    return _default_pool.get(slide_path)
+
+
+def tile_source_pool_info():
+    """Get the counters of the worker-local tile source pool.
+
+    Returns
+    -------
+    info : TileSourcePoolInfo
+        hits, misses, evictions, current size and maximum size of the
+        pool.
+
+    """
+    return _default_pool.info()
+
+
+def set_tile_source_pool_size(maxsize):
+    """Set the maximum number of tile sources kept open by this worker.
+
+    Parameters
+    ----------
+    maxsize : int
+        Maximum number of tile sources kept open at any given time.
+
+    """
+    _default_pool.resize(maxsize)
@@ -17,13 +17,16 @@
 #  limitations under the License.
 ###############################################################################
 
+import math
 import os
 import unittest
 
 import numpy as np
+from scipy.ndimage import distance_transform_edt, gaussian_filter
 
 from histomicstk.filters.shape import clog, cdog
 from skimage.feature import peak_local_max
+from skimage.transform import resize
 
 TEST_DATA_DIR = os.path.join(os.environ['GIRDER_TEST_DATA_PREFIX'],
                              'plugins/HistomicsTK')
@@ -57,6 +60,67 @@ def assert_array_almost_equal_neighborhood_lines(im, gt, decimal=4):
     np.testing.assert_array_almost_equal(min_array, np.zeros_like(im), decimal=decimal)
 
 
+def _cdog_resize(im_input, im_mask, sigma_min, sigma_max, num_octave_levels=3):
+    """Reference cdog upsampling the maxima of each octave with
+    skimage.transform.resize, as cdog originally did."""
+    im_sigma_ubound = np.clip(2.0 * distance_transform_edt(im_mask),
+                              sigma_min, sigma_max)
+
+    sigma_ratio = 2 ** (1.0 / num_octave_levels)
+    k = int(math.log(float(sigma_max) / sigma_min, sigma_ratio)) + 1
+
+    MIN_FLOAT = np.finfo(im_input.dtype).min
+
+    sigma_cur = sigma_min
+    im_gauss_cur = gaussian_filter(im_input, sigma_cur)
+    im_sigma_ubound_cur = im_sigma_ubound
+
+    im_dog_max = np.full_like(im_input, MIN_FLOAT)
+    im_sigma_max = np.zeros_like(im_input)
+    im_dog_octave_max = im_dog_max.copy()
+    im_sigma_octave_max = im_sigma_max.copy()
+
+    n_level = 0
+    n_octave = 0
+
+    for i in range(k + 1):
+        sigma_next = sigma_cur * sigma_ratio
+        sigma_conv = np.sqrt(sigma_next ** 2 - sigma_cur ** 2) / 2.0 ** n_octave
+
+        im_gauss_next = gaussian_filter(im_gauss_cur, sigma_conv)
+        im_dog_cur = im_gauss_next - im_gauss_cur
+        im_dog_cur[im_sigma_ubound_cur < sigma_cur] = MIN_FLOAT
+
+        update = im_dog_cur > im_dog_octave_max
+        im_dog_octave_max[update] = im_dog_cur[update]
+        im_sigma_octave_max[update] = sigma_cur
+
+        sigma_cur = sigma_next
+        im_gauss_cur = im_gauss_next
+        n_level += 1
+
+        if i == k or n_level == num_octave_levels:
+            im_dog_rszd = resize(im_dog_octave_max, im_dog_max.shape, order=0)
+            im_sigma_rszd = resize(im_sigma_octave_max, im_dog_max.shape,
+                                   order=0)
+
+            update = im_dog_rszd > im_dog_max
+            im_dog_max[update] = im_dog_rszd[update]
+            im_sigma_max[update] = im_sigma_rszd[update]
+
+            if n_level == num_octave_levels:
+                im_gauss_cur = im_gauss_next[::2, ::2]
+                im_sigma_ubound_cur = im_sigma_ubound_cur[::2, ::2]
+                im_dog_octave_max = im_dog_octave_max[::2, ::2]
+                im_sigma_octave_max = im_sigma_octave_max[::2, ::2]
+                n_level = 0
+                n_octave += 1
+
+    im_dog_max[im_dog_max == MIN_FLOAT] = 0
+
+    return im_dog_max, im_sigma_max
+
+
 def _sort_list(input_list):
     return input_list[input_list[:, 0].argsort()]
 
@@ -133,3 +197,59 @@ class BlobDetectionFiltersTest(unittest.TestCase):
             os.path.join(TEST_DATA_DIR, 'Easy1_cdog_sigma_max.npz'))
         im_sigma_max_gtruth = im_sigma_max_gtruth_data['Easy1_cdog_sigma_max']
         assert_array_almost_equal_neighborhood_lines(im_sigma_max, im_sigma_max_gtruth, decimal=4)
+
+    def test_strips(self):
+
+        im_nuclei_stain_data = np.load(
+            os.path.join(TEST_DATA_DIR, 'Easy1_nuclei_stain.npz'))
+        im_nuclei_stain = im_nuclei_stain_data['Easy1_nuclei_stain']
+
+        im_nuclei_fgnd_mask_data = np.load(
+            os.path.join(TEST_DATA_DIR, 'Easy1_nuclei_fgnd_mask.npz'))
+        im_nuclei_fgnd_mask = im_nuclei_fgnd_mask_data['Easy1_nuclei_fgnd_mask']
+
+        sigma_min = 4.0 / np.sqrt(2.0)
+        sigma_max = 10.0 / np.sqrt(2.0)
+
+        # filtering overlapping strips gives the same output as filtering
+        # the whole image at once
+        for func in (clog, cdog):
+
+            im_max, im_sigma_max = func(im_nuclei_stain, im_nuclei_fgnd_mask,
+                                        sigma_min, sigma_max)
+
+            self.assertEqual(im_max.dtype, im_nuclei_stain.dtype)
+
+            im_max_strips, im_sigma_max_strips = func(
+                im_nuclei_stain, im_nuclei_fgnd_mask, sigma_min, sigma_max,
+                strip_size=100)
+
+            np.testing.assert_array_equal(im_max_strips, im_max)
+            np.testing.assert_array_equal(im_sigma_max_strips, im_sigma_max)
+
+    def test_cdog_odd_size(self):
+
+        # the octave maxima are upsampled as by skimage.transform.resize when
+        # the image size is not a multiple of the octave factor, as on the
+        # tiles at the edges of slides
+        rng = np.random.RandomState(0)
+
+        im_input = gaussian_filter(rng.uniform(0, 255, (301, 333)), 3)
+        im_mask = gaussian_filter(rng.uniform(size=(301, 333)), 4) > 0.5
+
+        sigma_min = 2.0 / np.sqrt(2.0)
+        sigma_max = 30.0 / np.sqrt(2.0)
+
+        im_max, im_sigma_max = cdog(im_input, im_mask, sigma_min, sigma_max)
+
+        im_max_gtruth, im_sigma_max_gtruth = _cdog_resize(
+            im_input, im_mask, sigma_min, sigma_max)
+
+        np.testing.assert_array_equal(im_max, im_max_gtruth)
+        np.testing.assert_array_equal(im_sigma_max, im_sigma_max_gtruth)
+
+        im_max_strips, im_sigma_max_strips = cdog(
+            im_input, im_mask, sigma_min, sigma_max, strip_size=77)
+
+        np.testing.assert_array_equal(im_max_strips, im_max)
+        np.testing.assert_array_equal(im_sigma_max_strips, im_sigma_max)
@@ -24,6 +24,8 @@ from argparse import Namespace
 import os
 import json
 import collections
+import shutil
+import tempfile
 import unittest
 
 import numpy as np
@@ -36,6 +38,8 @@ import histomicstk.preprocessing.color_normalization as htk_cnorm
 import histomicstk.segmentation.nuclear as htk_nuclear
 import histomicstk.utils as htk_utils
 
+from histomicstk.annotations_and_masks.columnar_annotations import \
+    ColumnarAnnotation
 from histomicstk.cli import utils as cli_utils
 
 TEST_DATA_DIR = os.path.join(os.environ['GIRDER_TEST_DATA_PREFIX'], 'plugins/HistomicsTK')
@@ -287,3 +291,508 @@ class CliCommonTest(unittest.TestCase):
                 a=5,
             ),
         ))
+
+    def test_tile_source_pool(self):
+
+        pool = htk_utils.tile_source_pool.TileSourcePool(maxsize=1)
+
+        easy1_path = os.path.join(TEST_DATA_DIR, 'Easy1.png')
+        l1_path = os.path.join(TEST_DATA_DIR, 'L1.png')
+
+        ts = pool.get(easy1_path)
+        self.assertIs(pool.get(easy1_path), ts)
+        self.assertEqual(pool.info(), (1, 1, 0, 1, 1))
+
+        # opening a second slide evicts the least recently used one
+        pool.get(l1_path)
+        self.assertEqual(pool.info(), (1, 2, 1, 1, 1))
+        pool.get(easy1_path)
+        self.assertEqual(pool.info(), (1, 3, 2, 1, 1))
+
+        pool.clear()
+        self.assertEqual(pool.info(), (0, 0, 0, 0, 1))
+
+    def test_get_tile_source_pool_info(self):
+
+        import dask
+
+        with dask.config.set(scheduler='threads'):
+            self.assertEqual(list(cli_utils.get_tile_source_pool_info()),
+                             ['local'])
+
+        # the pools of worker processes are not reported
+        with dask.config.set(scheduler='processes'):
+            self.assertEqual(cli_utils.get_tile_source_pool_info(), {})
+
+    def test_artifact_cache(self):
+
+        cache_dir = tempfile.mkdtemp()
+        cache = htk_utils.ArtifactCache(cache_dir)
+
+        easy1_path = os.path.join(TEST_DATA_DIR, 'Easy1.png')
+
+        calls = []
+
+        def compute(value):
+            calls.append(value)
+            return np.arange(value)
+
+        # the artifact is only computed on the first request
+        for _ in range(2):
+            np.testing.assert_array_equal(
+                cache.get_or_compute(easy1_path, 'test', 1, {'a': 1},
+                                     compute, 5),
+                np.arange(5))
+        self.assertEqual(calls, [5])
+
+        # different parameters produce a different artifact
+        cache.get_or_compute(easy1_path, 'test', 1, {'a': 2}, compute, 3)
+        self.assertEqual(calls, [5, 3])
+        self.assertEqual(len(os.listdir(cache_dir)), 2)
+
+        # artifacts computed by another version of the code are not reused
+        cache.get_or_compute(easy1_path, 'test', 2, {'a': 2}, compute, 3)
+        self.assertEqual(calls, [5, 3, 3])
+
+        # array parameters are identified by their contents
+        for value in (0, 0, 1):
+            cache.get_or_compute(easy1_path, 'test', 1,
+                                 {'mask': np.full((4, 4), value)},
+                                 compute, value)
+        self.assertEqual(calls, [5, 3, 3, 0, 1])
+
+        # everything beyond max_size is evicted
+        cache.max_size = 0
+        cache.get_or_compute(easy1_path, 'test', 1, {'a': 3}, compute, 4)
+        self.assertEqual(os.listdir(cache_dir), [])
+
+        shutil.rmtree(cache_dir)
+
+    def test_parquet_feature_writer(self):
+
+        import pandas as pd
+        import pyarrow.parquet as pq
+
+        im_label = np.zeros((20, 30), dtype=int)
+        im_label[2:6, 3:9] = 1
+        im_label[10:15, 12:20] = 2
+        im_label[17, 25] = 3
+
+        tile_info = {'gx': 100, 'gy': 200, 'gwidth': 60, 'gheight': 40,
+                     'width': 30, 'height': 20}
+
+        coords, offsets = cli_utils.get_tile_nuclei_contours(im_label,
+                                                             tile_info)
+
+        self.assertEqual(len(offsets), 4)
+        self.assertEqual(coords[offsets[2]].tolist(), [150, 234])
+        np.testing.assert_array_equal(coords[:offsets[1]].min(0), [106, 204])
+        np.testing.assert_array_equal(coords[:offsets[1]].max(0), [116, 210])
+
+        fdata = pd.DataFrame({'Feature.A': [1.5, 2.5, 3.5],
+                              'Feature.B': [1, 2, 3]})
+
+        out_dir = tempfile.mkdtemp()
+        filename = os.path.join(out_dir, 'features.parquet')
+
+        with cli_utils.ParquetFeatureWriter(filename) as writer:
+            writer.write(fdata, (coords, offsets))
+            writer.write(fdata.iloc[:0], (coords[:0], offsets[:1]))
+            writer.write(fdata.iloc[1:], (coords[offsets[1]:],
+                                          offsets[1:] - offsets[1]))
+
+            # every table must have the same columns
+            with self.assertRaises(ValueError):
+                writer.write(fdata[['Feature.B']])
+
+        parquet_file = pq.ParquetFile(filename)
+        self.assertEqual(parquet_file.metadata.num_row_groups, 2)
+        self.assertEqual(writer.num_rows, 5)
+
+        table = parquet_file.read(columns=['Feature.A', 'Feature.B'])
+        self.assertEqual(str(table.schema.field('Feature.B').type), 'float')
+        np.testing.assert_array_equal(table.column('Feature.A').to_numpy(),
+                                      [1.5, 2.5, 3.5, 2.5, 3.5])
+
+        geometry = parquet_file.read(columns=['Geometry']).column(
+            'Geometry').to_pylist()
+        self.assertEqual(len(geometry), 5)
+        np.testing.assert_array_equal(geometry[3], geometry[1])
+        self.assertEqual(geometry[2], [[150, 234]])
+
+        # an empty file is written if there are no features
+        empty_filename = os.path.join(out_dir, 'empty.parquet')
+        cli_utils.ParquetFeatureWriter(empty_filename).close()
+        self.assertEqual(pq.read_table(empty_filename).num_rows, 0)
+
+        shutil.rmtree(out_dir)
+
+    def test_group_annotation_elements(self):
+
+        elements = [
+            {'type': 'point', 'center': [10.125, 20.5, 0],
+             'lineColor': 'rgb(0,255,0)'},
+            {'type': 'polyline', 'closed': True,
+             'points': [[1.001, 2, 0], [3, 4, 0], [5, 2, 0]],
+             'label': {'value': 'nucleus'}},
+            {'type': 'rectangle', 'center': [5, 6, 0], 'width': 2,
+             'height': 4, 'rotation': 0, 'label': {'value': 'cell'},
+             'lineColor': 'rgb(0,255,0)', 'fillColor': 'rgba(0,0,0,0)'},
+        ]
+
+        out_dir = tempfile.mkdtemp()
+        filename = os.path.join(out_dir, 'nuclei.anot')
+
+        with open(filename, 'w') as annotation_file:
+            json.dump({'name': 'nuclei', 'elements': elements},
+                      annotation_file)
+
+        nuclei_annot = cli_utils.read_annotation_elements(filename)
+        self.assertEqual(nuclei_annot, elements)
+
+        class_styles = {'a': {'lineColor': 'rgb(255,0,0)'},
+                        'b': {'lineColor': 'rgb(0,0,255)'}}
+
+        elements_by_class = cli_utils.group_annotation_elements(
+            nuclei_annot, ['b', 'a', 'b'], class_styles)
+
+        # JSON elements of any type keep all their keys and coordinates
+        self.assertEqual(elements_by_class['a'], [
+            dict(elements[1], lineColor='rgb(255,0,0)')])
+        self.assertEqual(elements_by_class['b'], [
+            dict(elements[0], lineColor='rgb(0,0,255)'),
+            dict(elements[2], lineColor='rgb(0,0,255)')])
+        self.assertEqual(
+            json.loads(json.dumps(elements_by_class['b']))[1]['label'],
+            {'value': 'cell'})
+
+        # columnar files are grouped in columnar form
+        columnar_filename = os.path.join(out_dir, 'nuclei.npz')
+        ColumnarAnnotation.from_polylines(
+            [np.array([[1, 2], [3, 4], [5, 2]]),
+             np.array([[6, 7], [8, 9], [6, 9]])]).save(columnar_filename)
+
+        nuclei_annot = cli_utils.read_annotation_elements(columnar_filename)
+        self.assertEqual(len(nuclei_annot), 2)
+
+        elements_by_class = cli_utils.group_annotation_elements(
+            nuclei_annot, ['a', 'a'], class_styles)
+
+        self.assertEqual(elements_by_class['b'], [])
+        self.assertEqual(
+            [e['lineColor'] for e in elements_by_class['a']],
+            ['rgb(255,0,0)'] * 2)
+        self.assertEqual(elements_by_class['a'][1]['points'],
+                         [[6, 7, 0], [8, 9, 0], [6, 9, 0]])
+
+        shutil.rmtree(out_dir)
+
+    def test_write_annotation_stream(self):
+
+        element_lists = [
+            [{'type': 'point', 'center': [1, 2, 0]},
+             {'type': 'polyline', 'closed': True,
+              'points': [[1.5, 2, 0], [3, 4, 0], [5, 2, 0]],
+              'label': {'value': 'nucleus'}}],
+            [],
+            [{'type': 'rectangle', 'center': [5, 6, 0], 'width': 2,
+              'height': 4, 'rotation': 0, 'lineColor': 'rgb(0,255,0)'}],
+        ]
+
+        out_dir = tempfile.mkdtemp()
+        filename = os.path.join(out_dir, 'annotation.anot')
+
+        for name, lists in (('nuclei', element_lists), ('empty', []),
+                            ('empty lists', [[], []])):
+
+            annotation = collections.OrderedDict([
+                ('name', name),
+                ('elements', [e for elements in lists for e in elements]),
+            ])
+
+            # the default output is that of json.dump
+            num_elements = cli_utils.write_annotation_stream(
+                filename, name, iter(lists))
+
+            self.assertEqual(num_elements, len(annotation['elements']))
+
+            with open(filename) as annotation_file:
+                self.assertEqual(annotation_file.read(),
+                                 json.dumps(annotation, indent=2))
+
+            # the compact output is valid JSON without whitespace
+            cli_utils.write_annotation_stream(filename, name, iter(lists),
+                                              compact=True)
+
+            with open(filename) as annotation_file:
+                text = annotation_file.read()
+
+            self.assertEqual(json.loads(text), annotation)
+            self.assertNotIn('\n', text)
+            self.assertNotIn(', ', text.replace(name, ''))
+
+        shutil.rmtree(out_dir)
+
+    def test_iter_dask_results(self):
+
+        import time
+
+        import dask
+        import dask.distributed
+
+        def compute(i):
+            # later tasks finish first
+            time.sleep(0.05 * (5 - i))
+            return [i]
+
+        def tasks():
+            return [dask.delayed(compute)(i) for i in range(6)]
+
+        # without a client results are yielded in order, in batches
+        for batch_size in (1, 4, 64):
+            self.assertEqual(
+                list(cli_utils.iter_dask_results(tasks(),
+                                                 batch_size=batch_size)),
+                [[i] for i in range(6)])
+
+        self.assertEqual(list(cli_utils.iter_dask_results([])), [])
+
+        # with a client results are yielded as they complete, so that all of
+        # them are written even if they arrive out of order
+        with dask.distributed.Client(processes=False, n_workers=1,
+                                     threads_per_worker=6) as client:
+
+            results = list(cli_utils.iter_dask_results(tasks(), client))
+
+            self.assertEqual(sorted(results), [[i] for i in range(6)])
+            self.assertNotEqual(results, sorted(results))
+
+            self.assertEqual(
+                list(cli_utils.iter_dask_results([], client)), [])
+
+            out_dir = tempfile.mkdtemp()
+            filename = os.path.join(out_dir, 'annotation.anot')
+
+            num_elements = cli_utils.write_annotation_stream(
+                filename, 'nuclei',
+                cli_utils.iter_dask_results(
+                    [dask.delayed(compute)(i) for i in range(6)], client))
+
+            with open(filename) as annotation_file:
+                elements = json.load(annotation_file)['elements']
+
+            self.assertEqual(num_elements, 6)
+            self.assertEqual(sorted(elements), list(range(6)))
+
+            shutil.rmtree(out_dir)
+
+    def test_group_tile_positions(self):
+
+        tile_positions = [5, 2, 8, 3, 9, 1, 7]
+
+        for tile_grouping in (-1, 0, 0.5, 1):
+            self.assertEqual(
+                cli_utils.group_tile_positions(tile_positions, tile_grouping),
+                [[pos] for pos in tile_positions])
+
+        # the last group is not full
+        self.assertEqual(
+            cli_utils.group_tile_positions(iter(tile_positions), 3),
+            [[5, 2, 8], [3, 9, 1], [7]])
+        self.assertEqual(
+            cli_utils.group_tile_positions(tile_positions, 10),
+            [tile_positions])
+        self.assertEqual(cli_utils.group_tile_positions([], 3), [])
+
+    def test_tile_nuclei_groups(self):
+
+        from histomicstk.cli.NucleiDetection import NucleiDetection
+        from histomicstk.cli.ComputeNucleiFeatures import \
+            ComputeNucleiFeatures
+
+        import pandas as pd
+
+        image_path = os.path.join(TEST_DATA_DIR, 'Easy1.png')
+
+        args = Namespace(
+            inputImageFile=image_path,
+
+            reference_mu_lab=[8.63234435, -0.11501964, 0.03868433],
+            reference_std_lab=[0.57506023, 0.10403329, 0.01364062],
+
+            stain_1='hematoxylin',
+            stain_2='eosin',
+            stain_3='null',
+
+            stain_1_vector=[-1, -1, -1],
+            stain_2_vector=[-1, -1, -1],
+            stain_3_vector=[-1, -1, -1],
+
+            foreground_threshold=160,
+            min_radius=6,
+            max_radius=12,
+            min_nucleus_area=25,
+            local_max_search_radius=8,
+            ignore_border_nuclei=False,
+            nuclei_annotation_format='bbox',
+
+            fsd_bnd_pts=128,
+            fsd_freq_bins=6,
+            cyto_width=8,
+            num_glcm_levels=32,
+            morphometry_features=True,
+            fsd_features=True,
+            intensity_features=True,
+            gradient_features=True,
+            haralick_features=True,
+            cytoplasm_features=True,
+            use_contours=False,
+            feature_list=[],
+            num_feature_threads=1,
+        )
+
+        it_kwargs = {'tile_size': {'width': 128, 'height': 128}}
+
+        ts = large_image.getTileSource(image_path)
+
+        tile_positions = [
+            tile['tile_position']['position']
+            for tile in ts.tileIterator(**it_kwargs)][:7]
+
+        self.assertEqual(len(tile_positions), 7)
+
+        for annotation_file in ('nuclei.anot', 'nuclei.npz'):
+
+            args.outputNucleiAnnotationFile = annotation_file
+            columnar = annotation_file.endswith('.npz')
+
+            # process each tile by itself
+            tile_nuclei_list = [
+                NucleiDetection.detect_tile_nuclei(
+                    image_path, tile_position, args, it_kwargs)
+                for tile_position in tile_positions]
+
+            if columnar:
+                expected = ColumnarAnnotation.concatenate(
+                    tile_nuclei_list).to_annotation()['elements']
+            else:
+                expected = [annot for annot_list in tile_nuclei_list
+                            for annot in annot_list]
+
+            self.assertGreater(len(expected), 0)
+
+            # process the same tiles in groups, including a grouping value
+            # below 1 and a last group that is not full
+            for tile_grouping in (0, 1, 3, 7):
+
+                group_nuclei_list = [
+                    NucleiDetection.detect_tile_nuclei_group(
+                        image_path, tile_position_group, args, it_kwargs)
+                    for tile_position_group in cli_utils.group_tile_positions(
+                        tile_positions, tile_grouping)]
+
+                if columnar:
+                    result = ColumnarAnnotation.concatenate(
+                        group_nuclei_list).to_annotation()['elements']
+                else:
+                    result = [annot for annot_list in group_nuclei_list
+                              for annot in annot_list]
+
+                self.assertEqual(result, expected)
+
+        args.outputNucleiAnnotationFile = 'nuclei.anot'
+        args.outputNucleiFeatureFile = 'nuclei.csv'
+
+        tile_results = [
+            ComputeNucleiFeatures.compute_tile_nuclei_features(
+                image_path, tile_position, args, it_kwargs)
+            for tile_position in tile_positions]
+
+        expected_annot = [annot for annot_list, _, _ in tile_results
+                          for annot in annot_list]
+        expected_fdata = pd.concat(
+            [fdata for _, fdata, _ in tile_results if fdata is not None],
+            ignore_index=True)
+
+        for tile_grouping in (0, 3):
+
+            group_results = [
+                result
+                for tile_position_group in cli_utils.group_tile_positions(
+                    tile_positions, tile_grouping)
+                for result in
+                ComputeNucleiFeatures.compute_tile_nuclei_features_group(
+                    image_path, tile_position_group, args, it_kwargs)]
+
+            self.assertEqual(len(group_results), len(tile_positions))
+            self.assertEqual(
+                [annot for annot_list, _, _ in group_results
+                 for annot in annot_list],
+                expected_annot)
+
+            pd.testing.assert_frame_equal(
+                pd.concat([fdata for _, fdata, _ in group_results
+                           if fdata is not None], ignore_index=True),
+                expected_fdata)
+
+    def test_compute_tile_foreground_fraction(self):
+
+        wsi_path = os.path.join(
+            TEST_DATA_DIR,
+            'TCGA-06-0129-01Z-00-DX3.bae772ea-dd36-47ec-8185-761989be3cc8.svs'
+        )
+
+        ts = large_image.getTileSource(wsi_path)
+
+        ts_metadata = ts.getMetadata()
+
+        im_fgnd_mask_lres, fgnd_seg_scale = \
+            cli_utils.segment_wsi_foreground_at_low_res(ts)
+
+        # tile sizes and regions that leave partial tiles at the right and
+        # bottom edges of the slide and of the region
+        roi = {'left': ts_metadata['sizeX'] // 3 + 7,
+               'top': ts_metadata['sizeY'] // 3 + 5,
+               'width': 4321, 'height': 3210,
+               'units': 'base_pixels'}
+
+        for it_kwargs in ({'tile_size': {'width': 4096},
+                           'scale': {'magnification': 20}},
+                          {'tile_size': {'width': 1000, 'height': 700},
+                           'scale': {'magnification': 20},
+                           'region': roi},
+                          {'tile_size': {'width': 777},
+                           'scale': {'magnification': 10},
+                           'region': roi}):
+
+            # slice the mask one tile at a time as was done before
+            expected = []
+
+            for tile in ts.tileIterator(**it_kwargs):
+
+                rgn_lres = ts.convertRegionScale(
+                    {'left': tile['gx'], 'top': tile['gy'],
+                     'right': tile['gx'] + tile['gwidth'],
+                     'bottom': tile['gy'] + tile['gheight'],
+                     'units': 'base_pixels'},
+                    targetScale=fgnd_seg_scale, targetUnits='mag_pixels')
+
+                im_tile_fgnd_mask_lres = im_fgnd_mask_lres[
+                    int(rgn_lres['top']):int(rgn_lres['bottom']),
+                    int(rgn_lres['left']):int(rgn_lres['right'])]
+
+                expected.append(im_tile_fgnd_mask_lres.mean()
+                                if im_tile_fgnd_mask_lres.size else 0)
+
+            tile_fgnd_frac_list = htk_utils.compute_tile_foreground_fraction(
+                wsi_path, im_fgnd_mask_lres, fgnd_seg_scale, it_kwargs)
+
+            np.testing.assert_allclose(tile_fgnd_frac_list, expected,
+                                       rtol=1e-12)
+
+            for tile_position in (0, len(expected) - 1):
+                np.testing.assert_allclose(
+                    htk_utils.compute_tile_foreground_fraction(
+                        wsi_path, im_fgnd_mask_lres, fgnd_seg_scale,
+                        it_kwargs, tile_position),
+                    expected[tile_position], rtol=1e-12)
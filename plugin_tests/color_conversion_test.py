@@ -25,6 +25,8 @@ from histomicstk.preprocessing.color_conversion import rgb_to_od
 from histomicstk.preprocessing.color_conversion import od_to_rgb
 from histomicstk.preprocessing.color_conversion import rgb_to_lab
 from histomicstk.preprocessing.color_conversion import lab_to_rgb
+from histomicstk.preprocessing.color_conversion import lab_mean_std
+from histomicstk.preprocessing.color_conversion import LabMoments
 
 
 class ColorConversionTest(unittest.TestCase):
@@ -86,3 +88,22 @@ class ColorConversionTest(unittest.TestCase):
             np.round(lab_to_rgb(rgb_to_lab(im_rand))),
             im_rand
         )
+
+    def test_lab_moments(self):
+
+        np.random.seed(1)
+
+        im_rand = np.random.randint(0, 255, (10, 10, 3))
+        mask = np.random.rand(10, 10) > 0.3
+
+        mean_lab, std_lab = lab_mean_std(im_rand, mask_out=~mask)
+
+        # accumulate in batches, with an empty one, and merge partial results
+        moments = [LabMoments().update(im_rand[:3], mask[:3]),
+                   LabMoments().update(im_rand[3:3]),
+                   LabMoments().update(im_rand[3:], mask[3:])]
+        moments = LabMoments.merge_all(moments)
+
+        self.assertEqual(moments.count, np.count_nonzero(mask))
+        np.testing.assert_array_almost_equal(moments.mean, mean_lab)
+        np.testing.assert_array_almost_equal(moments.std, std_lab)
@@ -23,6 +23,7 @@ import skimage.io
 import unittest
 
 from histomicstk.preprocessing import color_deconvolution as htk_dcv
+from histomicstk.preprocessing import color_normalization as htk_cn
 
 
 TEST_DATA_DIR = os.path.join(os.environ['GIRDER_TEST_DATA_PREFIX'],
@@ -60,3 +61,29 @@ class ColorDeconvolutionTest(unittest.TestCase):
                                               conv_result.Wc, 255)
 
         np.testing.assert_allclose(im, im_reconv, atol=1)
+
+    def test_reinhard_color_deconvolution(self):
+        im_path = os.path.join(TEST_DATA_DIR, 'Easy1.png')
+        im = skimage.io.imread(im_path)[..., :3]
+
+        w = np.array([[0.650, 0.072, 0],
+                      [0.704, 0.990, 0],
+                      [0.286, 0.105, 0]])
+
+        mu = [8.63234435, -0.11501964, 0.03868433]
+        sigma = [0.57506023, 0.10403329, 0.01364062]
+
+        im_stains = htk_dcv.color_deconvolution(
+            htk_cn.reinhard(im, mu, sigma), w).Stains
+
+        out = np.empty(im.shape[:2] + (2,), dtype=np.float32)
+
+        result = htk_dcv.reinhard_color_deconvolution(
+            im, w, mu, sigma, stains=(1, 0), chunk_size=1000, out=out)
+
+        self.assertIs(result, out)
+
+        # float32 arithmetic may round a handful of pixels differently
+        diff = np.abs(out - im_stains[..., [1, 0]])
+        self.assertLessEqual(diff.max(), 4)
+        self.assertLess(np.count_nonzero(diff) / float(diff.size), 1e-3)
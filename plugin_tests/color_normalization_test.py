@@ -91,6 +91,20 @@ class ReinhardNormalizationTest(unittest.TestCase):
         np.testing.assert_allclose(wsi_mean, gt_mean, atol=1e-2)
         np.testing.assert_allclose(wsi_stddev, gt_stddev, atol=1e-2)
 
+    def test_reinhard_stats_seed(self):
+
+        wsi_path = os.path.join(
+            TEST_DATA_DIR,
+            'sample_svs_image.TCGA-DU-6399-01A-01-TS1.e8eb65de-d63e-42db-af6f-14fefbbdf7bd.svs'  # noqa
+        )
+
+        # sampling with a seed is reproducible
+        stats = [htk_cn.reinhard_stats(wsi_path, 0.01, magnification=20,
+                                       seed=1) for _ in range(2)]
+
+        np.testing.assert_array_equal(stats[0].Mu, stats[1].Mu)
+        np.testing.assert_array_equal(stats[0].Sigma, stats[1].Sigma)
+
 
 class BackgroundIntensityTest(unittest.TestCase):
 
@@ -3,6 +3,7 @@ import numpy as np
 import pandas as pd
 import skimage.io
 import skimage.measure
+import skimage.segmentation
 import unittest
 
 import collections
@@ -82,6 +83,7 @@ class FeatureExtractionTest(unittest.TestCase):
         self.im_input = im_input
         self.im_input_nmzd = im_input_nmzd
         self.im_nuclei_stain = im_nuclei_stain
+        self.im_cytoplasm_stain = im_cytoplasm_stain
         self.im_nuclei_seg_mask = im_nuclei_seg_mask
         self.nuclei_rprops = nuclei_rprops
         self.fdata_nuclei = fdata_nuclei
@@ -233,6 +235,150 @@ class FeatureExtractionTest(unittest.TestCase):
         pd.testing.assert_frame_equal(
             fdata, fdata_gtruth, check_less_precise=2)
 
+    def test_feature_row_order(self):
+
+        # rows follow the order of rprops when it is given
+        rprops = self.nuclei_rprops[::-1]
+
+        for func in (htk_features.compute_intensity_features,
+                     htk_features.compute_gradient_features,
+                     htk_features.compute_haralick_features):
+
+            fdata = func(self.im_nuclei_seg_mask, self.im_nuclei_stain)
+
+            fdata_reversed = func(self.im_nuclei_seg_mask,
+                                  self.im_nuclei_stain, rprops=rprops)
+
+            pd.testing.assert_frame_equal(
+                fdata_reversed,
+                fdata.iloc[::-1].reset_index(drop=True))
+
+    def test_nuclei_feature_selection(self):
+
+        feature_list = ['Size', 'Shape.FSD2', 'Nucleus.Intensity.Mean',
+                        'Cytoplasm.Haralick.IDM.Mean']
+
+        fdata = htk_features.compute_nuclei_features(
+            self.im_nuclei_seg_mask, self.im_nuclei_stain,
+            im_cytoplasm=self.im_cytoplasm_stain,
+            feature_list=feature_list, num_threads=2)
+
+        self.assertEqual(list(fdata.columns), [
+            'Size.Area', 'Size.MajorAxisLength', 'Size.MinorAxisLength',
+            'Size.Perimeter', 'Shape.FSD2', 'Nucleus.Intensity.Mean',
+            'Cytoplasm.Haralick.IDM.Mean'])
+
+        pd.testing.assert_frame_equal(fdata,
+                                      self.fdata_nuclei[fdata.columns])
+
+        with self.assertRaises(ValueError):
+            htk_features.compute_nuclei_features(
+                self.im_nuclei_seg_mask, self.im_nuclei_stain,
+                feature_list=['Cytoplasm.Intensity.Mean'])
+
+    def test_label_index(self):
+
+        label_index = htk_features.LabelIndex(self.im_nuclei_seg_mask)
+
+        self.assertEqual(len(label_index), len(self.nuclei_rprops))
+
+        for i, prop in enumerate(self.nuclei_rprops):
+            self.assertEqual(label_index.labels[i], prop.label)
+            self.assertEqual(tuple(label_index.bboxes[i]), prop.bbox)
+            np.testing.assert_array_equal(label_index.get_coords(i),
+                                          prop.coords)
+
+        # a shared index gives the same features as an index built inside
+        rprops = self.nuclei_rprops[::-1]
+
+        for func in (htk_features.compute_intensity_features,
+                     htk_features.compute_gradient_features,
+                     htk_features.compute_haralick_features):
+
+            pd.testing.assert_frame_equal(
+                func(self.im_nuclei_seg_mask, self.im_nuclei_stain,
+                     rprops=rprops, label_index=label_index),
+                func(self.im_nuclei_seg_mask, self.im_nuclei_stain,
+                     rprops=rprops))
+
+        for func in (htk_features.compute_morphometry_features,
+                     htk_features.compute_fsd_features):
+
+            pd.testing.assert_frame_equal(
+                func(self.im_nuclei_seg_mask, rprops=rprops,
+                     label_index=label_index),
+                func(self.im_nuclei_seg_mask, rprops=rprops))
+
+    def test_contour_features(self):
+
+        contours = htk_features.trace_label_contours(self.im_nuclei_seg_mask)
+
+        np.testing.assert_array_equal(
+            contours.labels, [prop.label for prop in self.nuclei_rprops])
+
+        # traced points are boundary pixels of their object
+        im_label = np.pad(self.im_nuclei_seg_mask, 1)
+        im_bounds = skimage.segmentation.find_boundaries(
+            im_label, mode='inner', connectivity=2)[1:-1, 1:-1]
+
+        rows, cols = contours.coords.T
+        self.assertTrue(np.all(im_bounds[rows, cols]))
+        np.testing.assert_array_equal(
+            self.im_nuclei_seg_mask[rows, cols],
+            np.repeat(contours.labels, contours.counts))
+
+        # features other than solidity match regionprops
+        fdata = htk_features.compute_morphometry_features(
+            self.im_nuclei_seg_mask, contours=contours)
+
+        fdata_rprops = htk_features.compute_morphometry_features(
+            self.im_nuclei_seg_mask, rprops=self.nuclei_rprops)
+
+        for col in ['Size.Area', 'Size.MajorAxisLength',
+                    'Size.MinorAxisLength', 'Size.Perimeter',
+                    'Shape.Circularity', 'Shape.Eccentricity',
+                    'Shape.EquivalentDiameter', 'Shape.Extent',
+                    'Shape.MinorMajorAxisRatio']:
+            np.testing.assert_allclose(fdata[col], fdata_rprops[col],
+                                       atol=1e-10)
+
+        # the convex hull through the corners of boundary pixels is larger
+        self.assertTrue(np.all(
+            fdata['Shape.Solidity'] <= fdata_rprops['Shape.Solidity']))
+
+        # rows follow the order of rprops
+        rprops = self.nuclei_rprops[::-1]
+
+        pd.testing.assert_frame_equal(
+            htk_features.compute_morphometry_features(
+                self.im_nuclei_seg_mask, rprops=rprops, contours=contours),
+            fdata.iloc[::-1].reset_index(drop=True))
+
+        ffsd = htk_features.compute_fsd_features(
+            self.im_nuclei_seg_mask, contours=contours)
+
+        pd.testing.assert_frame_equal(
+            htk_features.compute_fsd_features(
+                self.im_nuclei_seg_mask, rprops=rprops, contours=contours),
+            ffsd.iloc[::-1].reset_index(drop=True))
+
+        # FSDs are fractions of the spectral energy of the boundary
+        self.assertTrue(np.all((ffsd >= 0) & (ffsd <= 1)))
+
+        # objects one pixel wide have the FSDs of their traced boundary
+        im_label = np.zeros((20, 30), dtype=int)
+        im_label[5, 3:20] = 1
+        im_label[8:18, 25] = 2
+
+        self.assertTrue(htk_features.compute_fsd_features(
+            im_label).isnull().values.all())
+
+        ffsd = htk_features.compute_fsd_features(
+            im_label, contours=htk_features.trace_label_contours(im_label))
+
+        self.assertTrue(np.all(np.isfinite(ffsd.values)))
+        np.testing.assert_allclose(ffsd.iloc[0], ffsd.iloc[1])
+
     def test_compute_morphometry_features(self):
 
         expected_feature_list = [
@@ -85,3 +85,20 @@ class GlobalCellGraphFeaturesTest(unittest.TestCase):
             voronoi_peri_stddev=0.0,
         ), index=[0])
         assert_frame_equal(actual, expected, check_like=True)
+
+    def testBlocks(self):
+        rng = np.random.RandomState(0)
+        data = rng.uniform(0, 600, (2500, 2))
+        expected = cgcgf(data)
+        density = [col for col in expected.columns if col.startswith('density')]
+
+        # tiling only changes cells and triangles near block borders
+        actual = cgcgf(data, block_size=150)
+        assert_frame_equal(actual[density], expected[density], check_like=True)
+        np.testing.assert_allclose(actual[expected.columns], expected, rtol=1e-2)
+
+        actual = cgcgf(data, block_size=150, relative_accuracy=1e-3)
+        np.testing.assert_allclose(actual[expected.columns], expected, rtol=1e-2)
+
+        with self.assertRaises(ValueError):
+            cgcgf(data, block_size=150, halo=200)
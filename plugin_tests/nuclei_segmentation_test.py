@@ -19,14 +19,17 @@
 
 import os
 import unittest
+import warnings
 
 import numpy as np
+import scipy.ndimage
 import skimage.io
 
 import histomicstk.preprocessing.color_conversion as htk_cvt
 import histomicstk.preprocessing.color_normalization as htk_cnorm
 import histomicstk.preprocessing.color_deconvolution as htk_cdeconv
 import histomicstk.segmentation as htk_seg
+import histomicstk.utils as htk_utils
 
 TEST_DATA_DIR = os.path.join(os.environ['GIRDER_TEST_DATA_PREFIX'],
                              'plugins/HistomicsTK')
@@ -99,3 +102,175 @@ class NucleiSegmentationTest(unittest.TestCase):
         num_nuclei = len(np.unique(im_nuclei_seg_mask)) - 1
 
         self.assertEqual(num_nuclei, 0)
+
+
+class GVFTrackingTest(unittest.TestCase):
+
+    def test_gvf_tracking(self):
+
+        # two separated gaussian blobs are tracked to their peaks
+        y, x = np.mgrid[:40, :60]
+        im_input = (np.exp(-((x - 15) ** 2 + (y - 20) ** 2) / 50.0) +
+                    np.exp(-((x - 45) ** 2 + (y - 20) ** 2) / 50.0))
+        im_mask = im_input > 0.1
+
+        im_label, sinks = htk_seg.nuclear.gvf_tracking(
+            im_input, im_mask, Diffusions=0)
+
+        self.assertEqual(im_label.dtype, np.int32)
+        self.assertEqual(sinks.shape, (2, 2))
+        self.assertLessEqual(
+            np.abs(sinks - [[15, 20], [45, 20]]).max(), 1)
+        np.testing.assert_array_equal(im_label[im_mask & (x < 30)], 1)
+        np.testing.assert_array_equal(im_label[im_mask & (x >= 30)], 2)
+        np.testing.assert_array_equal(im_label[~im_mask], 0)
+
+        # row blocks give the same tracking
+        for num_threads in (2, 7):
+            im_label_mt, sinks_mt = htk_seg.nuclear.gvf_tracking(
+                im_input, im_mask, Diffusions=0, num_threads=num_threads)
+
+            np.testing.assert_array_equal(im_label_mt, im_label)
+            np.testing.assert_array_equal(sinks_mt, sinks)
+
+        # the gradient can be diffused with either method
+        for method in ('explicit', 'implicit'):
+            im_label_diff, sinks_diff = htk_seg.nuclear.gvf_tracking(
+                im_input, im_mask, Mu=1, Lambda=1, Method=method)
+
+            self.assertEqual(len(sinks_diff), 2)
+            np.testing.assert_array_equal(im_label_diff > 0, im_mask)
+
+
+class GradientDiffusionTest(unittest.TestCase):
+
+    def test_gradient_diffusion(self):
+
+        np.random.seed(0)
+        im_input = scipy.ndimage.gaussian_filter(np.random.rand(32, 40), 3)
+        im_dy, im_dx = np.gradient(im_input)
+        im_mask = (im_input > np.median(im_input)).astype(float)
+
+        # a single explicit time-step
+        vXY, vXX = np.gradient(im_dx)
+        vYY, vYX = np.gradient(im_dy)
+        DivY, DivX = np.gradient(vXX + vYY)
+        vx_gt = im_dx + 0.05 * (5 * scipy.ndimage.laplace(im_dx) + 10 * DivX)
+        vy_gt = im_dy + 0.05 * (5 * scipy.ndimage.laplace(im_dy) + 10 * DivY)
+
+        im_vx, im_vy = htk_utils.gradient_diffusion(
+            im_dx, im_dy, im_mask, iterations=1)
+
+        np.testing.assert_allclose(im_vx, vx_gt, rtol=0, atol=1e-12)
+        np.testing.assert_allclose(im_vy, vy_gt, rtol=0, atol=1e-12)
+
+        # float32 gradients are diffused in float32
+        im_vx32, im_vy32 = htk_utils.gradient_diffusion(
+            im_dx.astype(np.float32), im_dy.astype(np.float32), im_mask,
+            iterations=1)
+
+        self.assertEqual(im_vx32.dtype, np.float32)
+        np.testing.assert_allclose(im_vx32, im_vx, rtol=0, atol=1e-6)
+
+        # the implicit solver reaches the fixed point of the time-steps
+        im_vx, im_vy = htk_utils.gradient_diffusion(
+            im_dx, im_dy, im_mask, mu=1, lamda=1, iterations=5000)
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', RuntimeWarning)
+            im_sx, im_sy = htk_utils.gradient_diffusion(
+                im_dx, im_dy, im_mask, mu=1, lamda=1, method='implicit',
+                tol=1e-10)
+
+        np.testing.assert_allclose(im_sx, im_vx, rtol=0, atol=1e-6)
+        np.testing.assert_allclose(im_sy, im_vy, rtol=0, atol=1e-6)
+
+        # an unconverged solution is reported
+        with self.assertWarns(RuntimeWarning):
+            htk_utils.gradient_diffusion(
+                im_dx, im_dy, im_mask, method='implicit', tol=1e-10,
+                maxiter=1)
+
+
+class LevelSetTest(unittest.TestCase):
+
+    def test_narrow_band(self):
+
+        # two disks with eroded initial masks
+        y, x = np.mgrid[:120, :160]
+        im_mask = ((x - 40) ** 2 + (y - 50) ** 2 < 15 ** 2) | \
+            ((x - 115) ** 2 + (y - 70) ** 2 < 20 ** 2)
+        im_input = im_mask.astype(float)
+        im_init = scipy.ndimage.binary_erosion(im_mask, iterations=3)
+
+        # the narrow band gives the edge-based evolution on the whole image
+        im_phi0 = np.where(im_init, -2.0, 2.0)
+        im_phi = htk_seg.level_set.reg_edge(
+            im_input, im_phi0.copy(), iter=20)
+        im_phi_band = htk_seg.level_set.reg_edge(
+            im_input, im_phi0.copy(), iter=20, band=8)
+
+        np.testing.assert_array_equal(im_phi_band > 0, im_phi > 0)
+
+        # the region-based evolution in the band recovers the disks, also
+        # when stopping early
+        for tol in (None, 0.001):
+            im_phi_band = htk_seg.level_set.chan_vese(
+                im_input, im_init.astype(int), 2, iter=30, band=8, tol=tol)
+
+            self.assertLess(np.count_nonzero((im_phi_band <= 0) != im_mask),
+                            0.05 * np.count_nonzero(im_mask))
+
+
+class MinModelTest(unittest.TestCase):
+
+    def test_min_model(self):
+
+        # two dark disks on a bright background
+        y, x = np.mgrid[:60, :80]
+        im_input = np.ones((60, 80))
+        im_input[(x - 20) ** 2 + (y - 30) ** 2 < 100] = 0.2
+        im_input[(x - 55) ** 2 + (y - 28) ** 2 < 144] = 0.3
+        im_input = scipy.ndimage.gaussian_filter(im_input, 1.5)
+
+        im_label = htk_seg.nuclear.min_model(im_input, Delta=0.3,
+                                             MinArea=50)
+
+        self.assertEqual(im_label.max(), 2)
+        self.assertNotEqual(im_label[30, 20], 0)
+        self.assertNotEqual(im_label[28, 55], 0)
+        self.assertNotEqual(im_label[30, 20], im_label[28, 55])
+
+        # objects follow the disks
+        for cx, cy, radius in ((20, 30, 10), (55, 28, 12)):
+            im_obj = im_label == im_label[cy, cx]
+            self.assertFalse(np.any(
+                im_obj & ((x - cx) ** 2 + (y - cy) ** 2 > (radius + 2) ** 2)))
+            self.assertGreater(im_obj.sum(), 0.6 * np.pi * radius ** 2)
+
+
+class GaussianVotingTest(unittest.TestCase):
+
+    def test_gaussian_voting(self):
+
+        # two dark disks on a bright background
+        y, x = np.mgrid[:80, :120]
+        im_input = np.full((80, 120), 200.0)
+        im_input[(x - 30) ** 2 + (y - 40) ** 2 < 144] = 50
+        im_input[(x - 85) ** 2 + (y - 38) ** 2 < 144] = 50
+        im_input = scipy.ndimage.gaussian_filter(im_input, 1)
+
+        nuclei, votes = htk_seg.nuclear.gaussian_voting(
+            im_input, rmax=20, rmin=5, sSigma=2, Tau=5, bw=10, Psi=0.3)
+
+        self.assertEqual(votes.shape, im_input.shape)
+
+        order = np.argsort(nuclei.X)
+        np.testing.assert_allclose(nuclei.X[order], [30, 85], atol=1)
+        np.testing.assert_allclose(nuclei.Y[order], [40, 38], atol=1)
+
+        # no votes are cast without gradients
+        nuclei, votes = htk_seg.nuclear.gaussian_voting(
+            np.zeros((40, 40)), sSigma=2)
+
+        self.assertEqual(len(nuclei.X), 0)
+        self.assertFalse(np.any(votes))
@@ -22,6 +22,9 @@ import unittest
 
 from histomicstk.segmentation.label import trace_object_boundaries
 from histomicstk.segmentation.label import delete_border
+from histomicstk.segmentation.label import area_open
+from histomicstk.segmentation.label import cleanup
+from histomicstk.segmentation.label import split
 
 
 class TraceBoundaryTest(unittest.TestCase):
@@ -89,3 +92,67 @@ class DeleteBorderLabelTest(unittest.TestCase):
         im_label_del = delete_border(im_label)
 
         np.testing.assert_array_equal(im_label_del, im_label)
+
+
+class CleanupLabelTest(unittest.TestCase):
+
+    def test_cleanup(self):
+
+        im_label = np.array([[0, 0, 0, 0, 0, 0, 0, 0],
+                             [0, 4, 4, 0, 0, 6, 6, 0],
+                             [0, 4, 4, 0, 0, 6, 6, 0],
+                             [0, 0, 0, 4, 0, 0, 0, 0],
+                             [0, 0, 0, 0, 0, 0, 0, 0],
+                             [0, 6, 0, 0, 4, 4, 4, 0],
+                             [0, 0, 0, 0, 4, 4, 4, 0],
+                             [0, 0, 0, 0, 0, 0, 0, 9]], dtype=np.int32)
+
+        # labels are condensed and further portions numbered after the last
+        # object, by object and then in raster order
+        im_split = split(im_label, conn=4)
+
+        np.testing.assert_array_equal(
+            im_split[[1, 3, 5, 1, 5, 7], [1, 3, 4, 5, 1, 7]],
+            [1, 4, 5, 2, 6, 3])
+        self.assertEqual(im_split.dtype, np.int32)
+
+        np.testing.assert_array_equal(
+            split(im_label, conn=8)[[1, 3, 5, 5, 7], [1, 3, 4, 1, 7]],
+            [1, 1, 4, 5, 3])
+
+        # cleanup gives the result of split, area_open and delete_border
+        for conn in (4, 8):
+            for min_area in (0, 2, 5):
+                im_clean = area_open(split(im_label, conn), min_area)
+
+                np.testing.assert_array_equal(
+                    cleanup(im_label, conn, min_area), im_clean)
+
+                np.testing.assert_array_equal(
+                    cleanup(im_label, conn, min_area, delete_border=True),
+                    delete_border(im_clean))
+
+        self.assertEqual(cleanup(im_label).dtype, np.int32)
+        self.assertFalse(np.any(cleanup(np.zeros((3, 3), dtype=int))))
+
+    def test_cleanup_without_background(self):
+
+        im_label = np.array([[1, 1, 1, 2],
+                             [1, 1, 2, 2],
+                             [3, 3, 3, 3]], dtype=np.int32)
+
+        # area_open has always counted pixels with a histogram whose bins
+        # shift when there is no background, which cleanup reproduces
+        im_clean = np.array([[0, 0, 0, 0],
+                             [0, 0, 0, 0],
+                             [1, 1, 1, 1]], dtype=np.int32)
+
+        np.testing.assert_array_equal(area_open(im_label, 4), im_clean)
+
+        for conn in (4, 8):
+            np.testing.assert_array_equal(cleanup(im_label, conn, 4), im_clean)
+
+            for min_area in (0, 1, 3, 5):
+                np.testing.assert_array_equal(
+                    cleanup(im_label, conn, min_area),
+                    area_open(split(im_label, conn), min_area))